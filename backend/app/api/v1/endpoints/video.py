@@ -1,8 +1,17 @@
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from app.schemas.video import VideoCreate, VideoResponse
-from app.worker import process_video_task
-from app.core.redis_client import redis_client
+from app.schemas.video import VideoCreate, VideoResponse, TaskStatusBatchRequest, TaskStatusBatchResponse
+from app.core.redis_client import redis_client, compare_and_delete, compare_and_set
+from app.core.config import settings
+from app.core.render_profiles import resolve_render_profile
+from app.services.script_service import normalize_prompt
+from app.services.checkpoint_service import checkpoint_service
+from app.services.scheduler_service import LANES, job_scheduler
+from app.services.progress_service import TERMINAL_STATUSES, progress_hub, progress_publisher
+from app.services.task_state import task_state
+from typing import Optional
+import hashlib
+import re
 import uuid
 import json
 import asyncio
@@ -11,76 +20,302 @@ import logging
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Seconds an identical request waits for the job holding the fingerprint to be admitted
+DEDUPE_ADMISSION_WAIT = 2.0
+
+def _job_fingerprint(request: VideoCreate, profile_name: str) -> str:
+    """
+    Identifies requests that would produce the same video.
+    """
+    payload = json.dumps({
+        "prompt": normalize_prompt(request.prompt),
+        "render_profile": profile_name,
+        "voice_provider": request.voice_provider,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _task_response(state: dict, deduplicated: bool = False) -> VideoResponse:
+    """
+    Builds a VideoResponse from a stored task state (worker updates keep URLs under 'data').
+    """
+    data = state.get("data") or {}
+    return VideoResponse(**{
+        **{k: v for k, v in state.items() if k in VideoResponse.model_fields},
+        "id": state.get("id", state["task_id"]),
+        "video_url": state.get("video_url") or data.get("video_url"),
+        "thumbnail_url": state.get("thumbnail_url") or data.get("thumbnail_url"),
+        "deduplicated": deduplicated,
+    })
+
+async def _find_existing_job(fingerprint_key: str, task_id: str):
+    """
+    Claims the fingerprint for task_id, or returns the state of the admitted job that
+    already holds it. Holders write their task state before claiming, so a fingerprint
+    without a state belongs to a request that was rolled back; it and a failed job's
+    fingerprint are taken over. A holder still being admitted is waited for briefly.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DEDUPE_ADMISSION_WAIT
+    while loop.time() < deadline:
+        if await redis_client.set(fingerprint_key, task_id, nx=True, ex=settings.JOB_DEDUPE_TTL):
+            return None
+
+        existing_id = await redis_client.get(fingerprint_key)
+        if existing_id is None:
+            # Released (rejected or expired) in between: try to claim it again
+            continue
+        state = await task_state.get(existing_id)
+        if state is None or state.get("status") == "failed":
+            # Of several retries, only the first takes over the fingerprint
+            if await compare_and_set(fingerprint_key, existing_id, task_id, ex=settings.JOB_DEDUPE_TTL):
+                return None
+            continue
+        # The estimate is written once the scheduler admitted the job; until then it may still be rejected
+        if "estimated_start_seconds" in state or state.get("status") != "pending":
+            return state
+        await asyncio.sleep(0.05)
+
+    # Still not admitted: run this request on its own rather than attach to a job that may never run
+    return None
+
+def _client_id(http_request: Request) -> str:
+    """
+    Identifies the caller for per-client fair scheduling and queue limits.
+    """
+    host = http_request.client.host if http_request.client else "anonymous"
+    trusted = {proxy.strip() for proxy in settings.SCHEDULER_TRUSTED_PROXIES.split(",") if proxy.strip()}
+    if host in trusted:
+        return http_request.headers.get("X-Client-Id") or host
+    return host
+
+def _job_lane(request: VideoCreate, profile_name: str) -> str:
+    if request.priority:
+        return request.priority
+    return "interactive" if profile_name == "draft" else "standard"
+
 @router.post("/generate", response_model=VideoResponse)
-async def generate_video(request: VideoCreate):
+async def generate_video(request: VideoCreate, http_request: Request):
     """
     Starts a video generation task and returns the task ID.
+    An identical request that is still running returns that task (so the client
+    attaches to its stream); one that completed recently returns its URLs.
     """
+    try:
+        profile = resolve_render_profile(request.render_profile, request.aspect_ratio)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     task_id = str(uuid.uuid4())
-    
-    # Initialize task state in Redis
+    lane = _job_lane(request, profile.name)
+    client_id = _client_id(http_request)
+
+    # Initialize task state in Redis before claiming the fingerprint and queueing, so identical
+    # requests and the worker never find a claimed task without a state
     initial_state = {
         "id": task_id,
         "task_id": task_id,
         "status": "pending",
         "progress": 0,
-        "message": "Task queued"
+        "message": "Task queued",
+        "render_profile": profile.name,
+        "priority": lane,
     }
-    await redis_client.set(f"task:{task_id}", json.dumps(initial_state), ex=3600)
-    
-    # Trigger Celery task
-    process_video_task.delay(task_id, request.prompt)
-    
+    await task_state.save(task_id, initial_state)
+
+    fingerprint_key = f"job:fingerprint:{_job_fingerprint(request, profile.name)}"
+    existing = await _find_existing_job(fingerprint_key, task_id)
+    if existing:
+        await task_state.delete(task_id)
+        logger.info(f"Reusing task {existing['task_id']} for identical request")
+        return _task_response(existing, deduplicated=True)
+
+    # Admission and queueing are one atomic step; the scheduler hands the job to Celery when a slot frees up
+    try:
+        admission = await job_scheduler.submit(task_id, request.prompt, profile.name, lane=lane, client_id=client_id)
+    except Exception as e:
+        logger.error(f"Could not queue task {task_id}: {e}")
+        admission = None
+    if admission is None or not admission.admitted:
+        # Leave no trace, so identical requests aren't deduplicated onto a job that never runs
+        await task_state.delete(task_id)
+        await compare_and_delete(fingerprint_key, task_id)
+        if admission is None:
+            raise HTTPException(status_code=503, detail="Could not queue the job, try again later")
+        raise HTTPException(status_code=429, detail=admission.reason, headers={"Retry-After": str(admission.retry_after)})
+
+    # Field only: a job that already finished must keep its status and TTL
+    initial_state["estimated_start_seconds"] = round(admission.estimated_start_seconds, 1)
+    await task_state.set_field(task_id, "estimated_start_seconds", initial_state["estimated_start_seconds"])
+
     return VideoResponse(**initial_state)
 
+@router.post("/resume/{task_id}", response_model=VideoResponse)
+async def resume_video(task_id: str, http_request: Request):
+    """
+    Re-queues a failed task; it continues after the last checkpointed stage
+    instead of regenerating the script, voiceover and clips.
+    """
+    job = await checkpoint_service.get_job(task_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No checkpoint found for task")
+
+    state = await task_state.get(task_id)
+    # Running or finished tasks are returned as-is
+    if state and state.get("status") != "failed":
+        return _task_response(state)
+
+    client_id = _client_id(http_request)
+    # Resumed jobs keep the lane they were submitted in
+    lane = state.get("priority") if state else None
+    if lane not in LANES:
+        lane = "standard"
+
+    resumed_state = {
+        "id": task_id,
+        "task_id": task_id,
+        "status": "pending",
+        "progress": 0,
+        "message": "Task queued for resume",
+        "render_profile": job["render_profile"],
+        "priority": lane,
+    }
+    # failed -> pending in one step, so concurrent resumes can't both queue the same task;
+    # drops the previous run's result fields, keeps the rest
+    if not await task_state.transition(task_id, "failed", resumed_state, clear=["data", "messages", "event_id", "playlist_url", "estimated_start_seconds"]):
+        current = await task_state.get(task_id)
+        if current:
+            return _task_response(current)
+        raise HTTPException(status_code=409, detail="Task is already being resumed")
+
+    try:
+        admission = await job_scheduler.submit(task_id, job["prompt"], job["render_profile"], lane=lane, client_id=client_id)
+    except Exception as e:
+        logger.error(f"Could not queue task {task_id}: {e}")
+        admission = None
+    if admission is None or not admission.admitted:
+        # Leave the task as it was: failed and resumable later
+        if state:
+            await task_state.save(task_id, state)
+        else:
+            await task_state.delete(task_id)
+        if admission is None:
+            raise HTTPException(status_code=503, detail="Could not queue the job, try again later")
+        raise HTTPException(status_code=429, detail=admission.reason, headers={"Retry-After": str(admission.retry_after)})
+
+    resumed_state["estimated_start_seconds"] = round(admission.estimated_start_seconds, 1)
+    await task_state.set_field(task_id, "estimated_start_seconds", resumed_state["estimated_start_seconds"])
+
+    return VideoResponse(**resumed_state)
+
+@router.get("/queue")
+async def get_queue_metrics():
+    """
+    Queue depth and wait times per scheduling lane.
+    """
+    return await job_scheduler.metrics()
+
 @router.get("/status/{task_id}", response_model=VideoResponse)
 async def get_task_status(task_id: str):
     """
     Retrieves the current status of a task from Redis.
     """
-    task_data = await redis_client.get(f"task:{task_id}")
-    if not task_data:
+    state = await task_state.get(task_id)
+    if not state:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return VideoResponse(**json.loads(task_data))
+    return _task_response(state)
+
+@router.post("/status:batch", response_model=TaskStatusBatchResponse)
+async def get_task_statuses(request: TaskStatusBatchRequest):
+    """
+    Retrieves the status of many tasks in one Redis round trip.
+    Unknown or expired task ids are listed under 'missing'.
+    """
+    task_ids = list(dict.fromkeys(request.task_ids))
+    if len(task_ids) > settings.STATUS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {settings.STATUS_BATCH_MAX} task ids per request")
+
+    tasks, missing = [], []
+    for task_id, state in zip(task_ids, await task_state.get_many(task_ids)):
+        if state:
+            tasks.append(_task_response(state))
+        else:
+            missing.append(task_id)
+    return TaskStatusBatchResponse(tasks=tasks, missing=missing)
+
+def _event_id_key(event_id: str) -> tuple:
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+def _sse_event(payload: dict) -> str:
+    """
+    Formats one SSE event; the id lets EventSource resume with Last-Event-ID.
+    """
+    event_id = payload.get("event_id")
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
 
 @router.get("/stream/{task_id}")
-async def stream_task_progress(task_id: str, request: Request):
+async def stream_task_progress(task_id: str, request: Request, last_event_id: Optional[str] = None):
     """
     Streams task progress updates using Server-Sent Events (SSE).
+    Reconnecting clients (Last-Event-ID header or ?last_event_id=) first get every
+    event they missed, replayed from the task's progress stream.
     """
+    resume_from = request.headers.get("Last-Event-ID") or last_event_id
+    if resume_from and not re.fullmatch(r"\d+-\d+", resume_from):
+        resume_from = None
+
     async def event_generator():
-        # First, send the current state if available
-        task_data = await redis_client.get(f"task:{task_id}")
-        if task_data:
-            yield f"data: {task_data}\n\n"
-        
-        # Subscribe to PubSub for updates
-        pubsub = redis_client.pubsub()
-        await pubsub.subscribe(f"stream:{task_id}")
-        
+        # Subscribe before replaying, so nothing published in between is lost
+        queue = await progress_hub.subscribe(task_id)
+        cursor = None
+
         try:
+            if resume_from:
+                cursor = resume_from
+                for payload in await progress_publisher.replay(task_id, resume_from):
+                    cursor = payload["event_id"]
+                    yield _sse_event(payload)
+                    if payload.get("status") in TERMINAL_STATUSES:
+                        return
+                # The stream may have expired or been trimmed past the terminal event:
+                # a finished task's state still says how it ended
+                state = await task_state.get(task_id)
+                if state and state.get("status") in TERMINAL_STATUSES:
+                    yield _sse_event(state)
+                    return
+            else:
+                # Send the current state if available
+                payload = await task_state.get(task_id)
+                if payload:
+                    cursor = payload.get("event_id")
+                    yield _sse_event(payload)
+                    # Clients attaching to an already finished (e.g. deduplicated) job get the final state only
+                    if payload.get("status") in TERMINAL_STATUSES:
+                        return
+
             while True:
-                # Check if client disconnected
-                if await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=settings.PROGRESS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Keep proxies from closing an idle stream, and notice clients that left
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+
+                # Skip events already sent from the snapshot or the replay
+                event_id = payload.get("event_id")
+                if cursor and event_id and _event_id_key(event_id) <= _event_id_key(cursor):
+                    continue
+                cursor = event_id or cursor
+                yield _sse_event(payload)
+
+                # If task is finished, stop streaming
+                if payload.get("status") in TERMINAL_STATUSES:
                     break
-                
-                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-                if message:
-                    data = message["data"]
-                    yield f"data: {data}\n\n"
-                    
-                    # If task is finished, stop streaming
-                    try:
-                        status_data = json.loads(data)
-                        if status_data.get("status") in ["completed", "failed"]:
-                            break
-                    except:
-                        pass
-                
-                await asyncio.sleep(0.1)
         finally:
-            await pubsub.unsubscribe(f"stream:{task_id}")
-            await pubsub.close()
+            progress_hub.unsubscribe(task_id, queue)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
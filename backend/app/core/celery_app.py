@@ -8,8 +8,15 @@ celery_app = Celery(
     include=["app.worker"]
 )
 
+# I/O-bound stages (script, voice, visuals, upload) and CPU-bound rendering are routed
+# to separate queues so each can be served by appropriately sized workers
 celery_app.conf.task_routes = {
-    "app.worker.process_video_task": "main-queue"
+    "app.worker.process_video_task": "main-queue",
+    "app.worker.script_stage_task": "script-queue",
+    "app.worker.voice_stage_task": "voice-queue",
+    "app.worker.visuals_stage_task": "visuals-queue",
+    "app.worker.render_stage_task": "render-queue",
+    "app.worker.upload_stage_task": "upload-queue",
 }
 
 celery_app.conf.update(
@@ -19,4 +26,8 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    # Scheduler lanes set task priorities; the Redis broker needs priority queues enabled,
+    # and prefetching one task at a time keeps a worker from holding low-priority work
+    broker_transport_options={"priority_steps": list(range(10)), "sep": ":", "queue_order_strategy": "priority"},
+    worker_prefetch_multiplier=1,
 )
@@ -9,22 +9,125 @@ class Settings(BaseSettings):
     # AI Service Keys
     GEMINI_API_KEY: str
     GEMINI_MODEL: str
+    SCRIPT_TIMEOUT: float = 90.0
+    # Generated scripts are cached in Redis by normalized prompt + model + system prompt version
+    SCRIPT_CACHE_ENABLED: bool = True
+    SCRIPT_CACHE_TTL: int = 86400
+    # Stream the script and start clip search for each scene as soon as it is generated
+    SCRIPT_STREAMING: bool = True
     
     # Audio Services
     ELEVENLABS_API_KEY: str
+    # Per-scene synthesis: scenes are voiced concurrently and fragments cached by text/voice/model
+    TTS_PER_SCENE: bool = True
+    TTS_MAX_CONCURRENCY: int = 4
+    TTS_FRAGMENT_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    TTS_TIMEOUT: float = 120.0
     
     # Visual Services
     PEXELS_API_KEY: str
+    PEXELS_MAX_CONCURRENCY: int = 8
+    PEXELS_MAX_CONNECTIONS_PER_HOST: int = 4
+
+    # Pexels search-result cache (in-process LRU in front of Redis), TTLs in seconds
+    SEARCH_CACHE_LOCAL_MAX_ENTRIES: int = 512
+    SEARCH_CACHE_LOCAL_TTL: int = 300
+    SEARCH_CACHE_REDIS_TTL: int = 86400
     
+    # Shared outbound HTTP client (one pooled client per worker process)
+    HTTP_HTTP2: bool = True
+    HTTP_TIMEOUT: float = 60.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+
+    # Stock media downloads
+    DOWNLOAD_MAX_BYTES: int = 300 * 1024 * 1024
+    DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # Shared on-disk media cache (outputs/visuals)
+    MEDIA_CACHE_MAX_BYTES: int = 5 * 1024 * 1024 * 1024
+    MEDIA_CACHE_LEASE_TTL: int = 2 * 3600
+    MEDIA_CACHE_DOWNLOAD_WAIT_TIMEOUT: int = 300
+
+    # Clip normalization (ffmpeg transcode to the render profile, cached in outputs/normalized)
+    FFMPEG_BINARY: Optional[str] = None  # Defaults to the binary MoviePy uses
+    NORMALIZED_CACHE_MAX_BYTES: int = 5 * 1024 * 1024 * 1024
+    NORMALIZE_MAX_CONCURRENCY: int = 0  # 0 = half the CPU cores
+
+    # Video assembly: "auto" uses the ffmpeg fast path for normalized clips, "moviepy" forces MoviePy
+    ASSEMBLY_ENGINE: str = "auto"
+
+    # Segmented rendering: encode scenes in parallel ffmpeg processes, then join by stream copy
+    RENDER_SEGMENTED: bool = True
+    RENDER_SEGMENT_THREADS: int = 2
+    RENDER_MAX_PARALLEL_SEGMENTS: int = 0  # 0 = cpu_count / RENDER_SEGMENT_THREADS
+    RENDER_MEMORY_BUDGET_MB: int = 0  # 0 = no memory cap
+    RENDER_SEGMENT_MEMORY_MB: int = 300
+    RENDER_PROGRESSIVE_UPLOAD: bool = False  # Publish an HLS preview, uploading scenes as they finish encoding
+    RENDER_PROGRESSIVE_UPLOAD_TIMEOUT: float = 60.0  # Seconds preview uploads may run on after the final video is written
+
     # Storage & Cloud
     OUTPUT_DIR: str = "outputs"
     SUPABASE_URL: Optional[str] = None
     SUPABASE_ANON_PUBLIC_KEY: Optional[str] = None
     SUPABASE_BUCKET: str = "videos"
+    STORAGE_BACKEND: str = "supabase"  # "supabase", or "local" to copy into STORAGE_LOCAL_DIR (dev/tests)
+    STORAGE_LOCAL_DIR: str = "outputs/storage"
+    STORAGE_LOCAL_BASE_URL: Optional[str] = None  # Public prefix for local uploads; file paths if unset
+    UPLOAD_CHUNK_SIZE: int = 6 * 1024 * 1024  # Supabase resumable uploads expect 6 MB chunks
+    UPLOAD_RESUMABLE_THRESHOLD: int = 6 * 1024 * 1024  # Larger files go through TUS resumable uploads
+    UPLOAD_RETRIES: int = 3  # Per-chunk retries before an upload gives up
 
     # Redis for Celery and PubSub
     REDIS_URL: str = "redis://localhost:6379/0"
 
+    # Task state (task:{id} hashes): seconds kept while active, and after the task finished
+    TASK_STATE_TTL: int = 3600
+    TASK_STATE_FINISHED_TTL: int = 604800
+    # Most task ids accepted by one POST /status:batch
+    STATUS_BATCH_MAX: int = 500
+
+    # Progress events: at most this many writes per second per task (status changes and
+    # terminal states always go out at once); each task keeps a capped, replayable stream
+    PROGRESS_MAX_EVENTS_PER_SECOND: float = 4.0
+    PROGRESS_STREAM_MAXLEN: int = 500
+    PROGRESS_STREAM_TTL: int = 3600
+    # SSE fan-out: events buffered per slow client, and seconds between keep-alive comments
+    PROGRESS_SUBSCRIBER_BUFFER: int = 100
+    PROGRESS_HEARTBEAT_SECONDS: float = 15.0
+
+    # Pipeline
+    # Run voiceover synthesis and clip fetching concurrently (both only need the script)
+    PIPELINE_CONCURRENT_STAGES: bool = True
+    # Run each stage group as its own Celery task on a dedicated queue (see celery_app.task_routes),
+    # so render workers scale apart from I/O workers. Off by default: the script task then ends
+    # before visuals start, so scenes streamed from the script (SCRIPT_STREAMING) can't start
+    # their clip search early, and voice/visuals overlap across tasks instead of in one process
+    PIPELINE_SPLIT_TASKS: bool = False
+
+    # Job scheduling: jobs wait in per-client priority lanes and at most this many run at once (0 = no limit)
+    SCHEDULER_MAX_IN_FLIGHT: int = 8
+    # Slots of jobs that never reported back are reclaimed after this many seconds
+    SCHEDULER_IN_FLIGHT_TTL: int = 3600
+    # Admission control: /generate answers 429 past these limits (0 = no limit)
+    SCHEDULER_MAX_QUEUED: int = 100
+    SCHEDULER_MAX_QUEUED_PER_CLIENT: int = 10
+    # Clients are told apart by connection address; the X-Client-Id header is only trusted
+    # from these (comma-separated) proxy / auth gateway addresses, which must set it themselves
+    SCHEDULER_TRUSTED_PROXIES: str = ""
+    # Kept well under the task state TTL so queued jobs start before their state expires
+    SCHEDULER_MAX_WAIT_SECONDS: int = 1800
+    # Job duration assumed for a render profile until real durations have been measured
+    SCHEDULER_DEFAULT_JOB_SECONDS: float = 180.0
+    # Identical /generate requests within this window reuse the existing job (seconds)
+    JOB_DEDUPE_TTL: int = 3600
+    # Finished stage results are checkpointed per task so retries and /resume skip them (seconds)
+    CHECKPOINT_TTL: int = 86400
+    # Automatic retries (from the last checkpoint) after unexpected errors
+    PIPELINE_MAX_RETRIES: int = 1
+    PIPELINE_RETRY_DELAY: int = 10
+
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True, extra="ignore")
 
 settings = Settings()
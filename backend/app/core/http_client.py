@@ -0,0 +1,40 @@
+import httpx
+from typing import Optional
+from app.core.config import settings
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide pooled client for outbound media calls, creating it on first use.
+    Connections (and TLS sessions) are kept alive and reused across scenes and tasks,
+    as long as callers stay on the same event loop.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=settings.HTTP_HTTP2 and _http2_available(),
+            timeout=settings.HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
@@ -5,3 +5,31 @@ redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
 
 async def get_redis_client():
     return redis_client
+
+# Atomic check-then-write on string keys holding an owner token (locks, job fingerprints)
+_COMPARE_AND_DELETE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_COMPARE_AND_SET = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+async def compare_and_delete(key: str, expected: str) -> bool:
+    """
+    Deletes `key` only if it still holds `expected`.
+    """
+    return bool(await redis_client.eval(_COMPARE_AND_DELETE, 1, key, expected))
+
+async def compare_and_set(key: str, expected: str, value: str, ex: int) -> bool:
+    """
+    Replaces `key` with `value` (expiring in `ex` seconds) only if it still holds `expected`.
+    """
+    return bool(await redis_client.eval(_COMPARE_AND_SET, 1, key, expected, value, ex))
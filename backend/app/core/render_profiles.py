@@ -0,0 +1,68 @@
+from typing import Optional
+
+
+class RenderProfile:
+    """
+    Output geometry and encoder settings for a render.
+    Cheap profiles (draft) trade quality for speed; only final renders should pay for slow presets.
+    """
+
+    def __init__(self, name: str, width: int, height: int, fps: int, preset: str, crf: int, codec: str = "libx264"):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.preset = preset
+        self.crf = crf
+        self.codec = codec
+
+    @property
+    def orientation(self) -> str:
+        """
+        Pexels search orientation matching the output geometry.
+        """
+        if self.width > self.height:
+            return "landscape"
+        if self.width < self.height:
+            return "portrait"
+        return "square"
+
+    @property
+    def normalize_key(self) -> str:
+        """
+        Identifies normalized intermediates: any profile with the same geometry and fps can share them.
+        """
+        return f"{self.width}x{self.height}p{self.fps}"
+
+
+RENDER_PROFILES = {
+    "draft": RenderProfile("draft", 640, 360, 24, preset="ultrafast", crf=32),
+    "standard": RenderProfile("standard", 1280, 720, 24, preset="ultrafast", crf=23),
+    "high-quality": RenderProfile("high-quality", 1920, 1080, 30, preset="medium", crf=18),
+    "vertical": RenderProfile("vertical", 720, 1280, 24, preset="ultrafast", crf=23),
+    "square": RenderProfile("square", 720, 720, 24, preset="ultrafast", crf=23),
+}
+RENDER_PROFILES["preview"] = RENDER_PROFILES["draft"]
+
+DEFAULT_RENDER_PROFILE = RENDER_PROFILES["standard"]
+
+ASPECT_RATIO_PROFILES = {
+    "16:9": "standard",
+    "9:16": "vertical",
+    "1:1": "square",
+}
+
+
+def resolve_render_profile(name: Optional[str] = None, aspect_ratio: Optional[str] = None) -> RenderProfile:
+    """
+    Picks a profile by explicit name, otherwise by aspect ratio, otherwise the default.
+    """
+    if name:
+        if name not in RENDER_PROFILES:
+            raise ValueError(f"Unknown render profile '{name}'. Available: {sorted(RENDER_PROFILES)}")
+        return RENDER_PROFILES[name]
+    if aspect_ratio:
+        if aspect_ratio not in ASPECT_RATIO_PROFILES:
+            raise ValueError(f"Unsupported aspect ratio '{aspect_ratio}'. Available: {sorted(ASPECT_RATIO_PROFILES)}")
+        return RENDER_PROFILES[ASPECT_RATIO_PROFILES[aspect_ratio]]
+    return DEFAULT_RENDER_PROFILE
@@ -1,10 +1,15 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 class VideoCreate(BaseModel):
     prompt: str
     aspect_ratio: str = "16:9"
     voice_provider: str = "edge-tts"
+    # Named render profile (see app/core/render_profiles.py, validated there); when omitted,
+    # one is picked from aspect_ratio
+    render_profile: Optional[str] = None
+    # Scheduling lane; when omitted, draft/preview renders go to "interactive", the rest to "standard"
+    priority: Optional[Literal["interactive", "standard", "batch"]] = None
 
 class VideoResponse(BaseModel):
     id: str
@@ -15,5 +20,20 @@ class VideoResponse(BaseModel):
     title: Optional[str] = None
     video_url: Optional[str] = None
     thumbnail_url: Optional[str] = None
+    # HLS playlist published while rendering (RENDER_PROGRESSIVE_UPLOAD), playable before the final video
+    playlist_url: Optional[str] = None
     script: Optional[dict] = None
+    render_profile: Optional[str] = None
+    priority: Optional[str] = None
+    # Expected seconds until the job starts running (at submission time)
+    estimated_start_seconds: Optional[float] = None
+    # True when an identical request was already queued or completed and its task is returned
+    deduplicated: bool = False
     error: Optional[str] = None
+
+class TaskStatusBatchRequest(BaseModel):
+    task_ids: List[str]
+
+class TaskStatusBatchResponse(BaseModel):
+    tasks: List[VideoResponse]
+    missing: List[str] = []
@@ -0,0 +1,54 @@
+import json
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+
+class CheckpointService:
+    """
+    Persists each finished pipeline stage's result (and the job's inputs) in a
+    Redis hash per task, so a retried or resumed run skips work that already
+    succeeded. Results must be JSON-serializable; file paths in them are
+    re-validated by the pipeline before reuse.
+    """
+
+    def __init__(self, ttl: int, prefix: str = "checkpoint"):
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.prefix}:{task_id}"
+
+    async def save_job(self, task_id: str, prompt: str, render_profile: str):
+        await self._hset(task_id, "job", {"prompt": prompt, "render_profile": render_profile})
+
+    async def get_job(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raw = await redis_client.hget(self._key(task_id), "job")
+        return json.loads(raw) if raw else None
+
+    async def save(self, task_id: str, stage: str, result: Any):
+        await self._hset(task_id, f"stage:{stage}", result)
+
+    async def load(self, task_id: str) -> Dict[str, Any]:
+        """
+        Returns {stage_name: result} for every checkpointed stage.
+        """
+        raw = await redis_client.hgetall(self._key(task_id))
+        return {
+            field[len("stage:"):]: json.loads(value)
+            for field, value in raw.items()
+            if field.startswith("stage:")
+        }
+
+    async def clear(self, task_id: str):
+        await redis_client.delete(self._key(task_id))
+
+    async def _hset(self, task_id: str, field: str, value: Any):
+        key = self._key(task_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, field, json.dumps(value))
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+
+checkpoint_service = CheckpointService(ttl=settings.CHECKPOINT_TTL)
@@ -1,8 +1,12 @@
 import os
+import asyncio
+import shutil
 import multiprocessing
 from pathlib import Path
 from moviepy import ImageClip, AudioFileClip, VideoFileClip, concatenate_videoclips
 from app.core.config import settings
+from app.core.render_profiles import RenderProfile, DEFAULT_RENDER_PROFILE
+from app.utils.ffmpeg import run_ffmpeg
 
 class EngineService:
     def __init__(self):
@@ -10,9 +14,16 @@ class EngineService:
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.cpu_count = multiprocessing.cpu_count()
 
-    async def assemble_video(self, audio_path: str, scenes: list[dict], output_filename: str, log_callback=None) -> str:
+    async def assemble_video(self, audio_path: str, scenes: list[dict], output_filename: str, log_callback=None, profile: RenderProfile = DEFAULT_RENDER_PROFILE, scene_timings: list[dict] = None, on_segment=None) -> str:
         """
         Assembles video by syncing images to the duration of their respective narration parts.
+        Scene durations come from `scene_timings` (TTS alignment) when available,
+        otherwise from each scene's share of the narration text.
+        Geometry and encoder settings come from the render profile.
+        Uses the ffmpeg fast path when every scene has pre-normalized clips,
+        otherwise (images, un-normalized clips, effects) renders through MoviePy.
+        With `on_segment`, the segmented path also hands over each scene as an
+        HLS segment while later scenes are still encoding (other paths ignore it).
         """
         if not scenes:
             raise ValueError("No scenes provided for video assembly.")
@@ -29,120 +40,330 @@ class EngineService:
             # 1. Load Audio and get total duration
             audio_clip = AudioFileClip(audio_path)
             total_duration = audio_clip.duration
-            
-            # 2. Calculate Total Narrative Length for proportional timing
-            total_chars = sum(len(s.get("narration_part", "")) for s in scenes)
-            if total_chars == 0:
-                print("Warning: Narration parts are empty. Falling back to equal timing.")
-                total_chars = len(scenes) # Fallback
-            
-            clips = []
-            used_visual_paths = set()
-            
-            # 3. Create clips for each scene
-            for i, scene in enumerate(scenes):
-                msg = f"  🎞️ Processing scene {i+1}/{len(scenes)}..."
-                if log_callback:
-                    await log_callback(msg)
-                print(msg)
-
-                narration_text = scene.get("narration_part", "")
-                
-                # Check for video clips first, then fallback to images
-                video_paths = scene.get("video_paths", [])
-                image_paths = scene.get("image_paths", [])
-                
+            audio_clip.close()
+
+            # 2. Plan segments: one entry per clip/image with its screen time
+            segments = self._plan_segments(scenes, total_duration, scene_timings)
+            if not segments:
+                raise ValueError("No valid clips created. Check if visuals were downloaded.")
+
+            output_path = self.output_dir / output_filename
+            used_visual_paths = list(dict.fromkeys(seg["path"] for seg in segments))
+
+            # 3. Render
+            if self._can_use_ffmpeg(scenes, profile):
+                try:
+                    if settings.RENDER_SEGMENTED and len({seg["scene"] for seg in segments}) > 1:
+                        await self._render_segmented(audio_path, segments, output_path, profile, log_callback, on_segment)
+                    else:
+                        await self._render_with_ffmpeg(audio_path, segments, output_path, profile, log_callback)
+                    print(f"✅ Smart assembly completed (ffmpeg): {output_path}")
+                    return str(output_path), used_visual_paths
+                except Exception as e:
+                    print(f"⚠️  ffmpeg assembly failed, falling back to MoviePy: {e}")
+
+            await self._render_with_moviepy(audio_path, segments, len(scenes), output_path, profile, log_callback)
+            print(f"✅ Smart assembly completed: {output_path}")
+            return str(output_path), used_visual_paths
+
+        except Exception as e:
+            print(f"❌ Smart assembly failed: {e}")
+            raise e
+
+    def _plan_segments(self, scenes: list[dict], total_duration: float, scene_timings: list[dict] = None) -> list[dict]:
+        """
+        Splits the narration duration across scenes (using the spoken timings when given,
+        proportionally to text length otherwise), then evenly across each scene's clips (or images).
+        """
+        if scene_timings and len(scene_timings) != len(scenes):
+            print(f"Warning: Got {len(scene_timings)} scene timings for {len(scenes)} scenes. Falling back to text ratios.")
+            scene_timings = None
+
+        # Calculate Total Narrative Length for proportional timing
+        total_chars = sum(len(s.get("narration_part", "")) for s in scenes)
+        if total_chars == 0:
+            print("Warning: Narration parts are empty. Falling back to equal timing.")
+            total_chars = len(scenes) # Fallback
+
+        segments = []
+        for i, scene in enumerate(scenes):
+            narration_text = scene.get("narration_part", "")
+
+            # Check for video clips first (pre-normalized when available), then fallback to images
+            video_paths = scene.get("normalized_paths") or scene.get("video_paths", [])
+            image_paths = scene.get("image_paths", [])
+
+            if scene_timings:
+                # Spoken duration of this scene; the last scene runs to the end of the audio
+                start = scene_timings[i]["start"]
+                end = scene_timings[i]["end"] if i + 1 < len(scenes) and scene_timings[i]["end"] is not None else total_duration
+                scene_duration = max(0.0, min(end, total_duration) - start)
+            else:
                 # Calculate scene duration proportional to text length
                 char_ratio = len(narration_text) / total_chars if total_chars > 0 else 1/len(scenes)
                 scene_duration = char_ratio * total_duration
-                
-                if not video_paths and not image_paths:
-                    print(f"Warning: Scene {i+1} has no visual assets. Skipping.")
+
+            if scene_duration <= 0:
+                print(f"Warning: Scene {i+1} has no spoken duration. Skipping.")
+                continue
+
+            if not video_paths and not image_paths:
+                print(f"Warning: Scene {i+1} has no visual assets. Skipping.")
+                continue
+
+            kind, paths = ("video", video_paths) if video_paths else ("image", image_paths)
+            duration_per_item = scene_duration / len(paths)
+            for path in paths:
+                if not os.path.exists(path):
                     continue
-                
-                if video_paths:
+                segments.append({"scene": i, "kind": kind, "path": path, "duration": duration_per_item})
+
+        return segments
+
+    def _can_use_ffmpeg(self, scenes: list[dict], profile: RenderProfile) -> bool:
+        if settings.ASSEMBLY_ENGINE == "moviepy":
+            return False
+        visual_scenes = [s for s in scenes if s.get("normalized_paths") or s.get("video_paths") or s.get("image_paths")]
+        return bool(visual_scenes) and all(
+            s.get("normalized_profile") == profile.normalize_key and not s.get("effects")
+            for s in visual_scenes
+        )
+
+    async def _render_with_ffmpeg(self, audio_path: str, segments: list[dict], output_path: Path, profile: RenderProfile, log_callback=None):
+        """
+        Trims/pads each normalized segment and concatenates them inside ffmpeg, muxing in
+        the narration. Frames never pass through Python.
+        """
+        if log_callback:
+            await log_callback(f"  ⚡ Finalizing render with ffmpeg ({len(segments)} segments)...")
+        print(f"  ⚡ Rendering {len(segments)} segments with ffmpeg...")
+
+        inputs, filter_graph = self._concat_filter(segments)
+        await run_ffmpeg([
+            *inputs,
+            "-i", audio_path,
+            "-filter_complex", filter_graph,
+            "-map", "[outv]", "-map", f"{len(segments)}:a",
+            *self._video_encoder_args(profile),
+            "-c:a", "aac",
+            "-shortest",
+            "-movflags", "+faststart",
+            str(output_path),
+        ])
+
+    async def _render_segmented(self, audio_path: str, segments: list[dict], output_path: Path, profile: RenderProfile, log_callback=None, on_segment=None):
+        """
+        Encodes every scene as its own ffmpeg process (bounded by RENDER_MAX_PARALLEL_SEGMENTS
+        and the memory budget), all with identical encoder parameters, then joins the
+        scene files by stream copy and muxes in the narration.
+        With `on_segment(index, path, durations)`, each finished scene is also muxed with
+        its slice of the narration into an MPEG-TS segment and handed over in a background
+        task, so neither encoding nor the final mux waits on preview uploads; those still
+        running RENDER_PROGRESSIVE_UPLOAD_TIMEOUT after the final video is written are cancelled.
+        """
+        scene_ids = list(dict.fromkeys(seg["scene"] for seg in segments))
+        work_dir = self.output_dir / f"{output_path.stem}_segments"
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+        concurrency = self._segment_concurrency()
+        msg = f"  ⚡ Rendering {len(scene_ids)} scenes in parallel (up to {concurrency} at once)..."
+        if log_callback:
+            await log_callback(msg)
+        print(msg)
+
+        # Cut scenes on absolute frame boundaries so rounding never accumulates into A/V drift
+        frame_ranges = []
+        elapsed = 0.0
+        for scene_id in scene_ids:
+            scene_duration = sum(seg["duration"] for seg in segments if seg["scene"] == scene_id)
+            start_frame = round(elapsed * profile.fps)
+            elapsed += scene_duration
+            frame_ranges.append(round(elapsed * profile.fps) - start_frame)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        done = 0
+        preview_tasks = []
+
+        async def render_scene(index: int, scene_id: int) -> Path:
+            nonlocal done
+            scene_segments = [seg for seg in segments if seg["scene"] == scene_id]
+            segment_path = work_dir / f"scene_{index:03d}.mp4"
+            inputs, filter_graph = self._concat_filter(scene_segments)
+            async with semaphore:
+                await run_ffmpeg([
+                    *inputs,
+                    "-filter_complex", filter_graph,
+                    "-map", "[outv]",
+                    "-frames:v", str(max(1, frame_ranges[index])),
+                    *self._video_encoder_args(profile),
+                    "-threads", str(settings.RENDER_SEGMENT_THREADS),
+                    "-an",
+                    str(segment_path),
+                ])
+            done += 1
+            if log_callback:
+                await log_callback(f"  🎞️ Rendered scene {done}/{len(scene_ids)}")
+            if on_segment:
+                preview_tasks.append(asyncio.create_task(
+                    self._emit_hls_segment(index, segment_path, audio_path, frame_ranges, profile, on_segment)
+                ))
+            return segment_path
+
+        try:
+            segment_paths = await asyncio.gather(*(render_scene(i, scene_id) for i, scene_id in enumerate(scene_ids)))
+
+            concat_list = work_dir / "concat.txt"
+            concat_list.write_text("".join(f"file '{p.resolve().as_posix()}'\n" for p in segment_paths))
+
+            if log_callback:
+                await log_callback("  ⚡ Joining scenes...")
+            await run_ffmpeg([
+                "-f", "concat", "-safe", "0", "-i", str(concat_list),
+                "-i", audio_path,
+                "-map", "0:v", "-map", "1:a",
+                "-c:v", "copy",
+                "-c:a", "aac",
+                "-shortest",
+                "-movflags", "+faststart",
+                str(output_path),
+            ])
+
+            if preview_tasks:
+                _, pending = await asyncio.wait(preview_tasks, timeout=settings.RENDER_PROGRESSIVE_UPLOAD_TIMEOUT)
+                if pending:
+                    print(f"⚠️  {len(pending)} preview segment(s) still uploading after the render; giving up on them")
+        finally:
+            # Segment files are removed below, so no preview task may outlive this call
+            for task in preview_tasks:
+                task.cancel()
+            await asyncio.gather(*preview_tasks, return_exceptions=True)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def _emit_hls_segment(self, index: int, segment_path: Path, audio_path: str, frame_ranges: list[int], profile: RenderProfile, on_segment):
+        """
+        Muxes a rendered scene with its narration slice into a TS segment timed at its
+        place in the video, and passes it to `on_segment`. Failures stall the preview, never the render.
+        """
+        durations = [max(1, frames) / profile.fps for frames in frame_ranges]
+        start = sum(frame_ranges[:index]) / profile.fps
+        ts_path = segment_path.with_suffix(".ts")
+        try:
+            await run_ffmpeg([
+                "-i", str(segment_path),
+                "-ss", f"{start:.3f}", "-t", f"{durations[index]:.3f}", "-i", audio_path,
+                "-map", "0:v", "-map", "1:a",
+                "-c:v", "copy",
+                "-c:a", "aac",
+                "-output_ts_offset", f"{start:.3f}",
+                "-f", "mpegts",
+                str(ts_path),
+            ])
+            await on_segment(index, str(ts_path), durations)
+        except Exception as e:
+            print(f"⚠️  Could not publish HLS segment {index}: {e}")
+
+    def _segment_concurrency(self) -> int:
+        """
+        Parallel scene encodes: the configured limit (default: one per RENDER_SEGMENT_THREADS cores),
+        further capped by RENDER_MEMORY_BUDGET_MB / RENDER_SEGMENT_MEMORY_MB when a budget is set.
+        """
+        concurrency = settings.RENDER_MAX_PARALLEL_SEGMENTS or max(1, self.cpu_count // max(1, settings.RENDER_SEGMENT_THREADS))
+        if settings.RENDER_MEMORY_BUDGET_MB:
+            concurrency = min(concurrency, settings.RENDER_MEMORY_BUDGET_MB // max(1, settings.RENDER_SEGMENT_MEMORY_MB))
+        return max(1, concurrency)
+
+    def _concat_filter(self, segments: list[dict]) -> tuple[list[str], str]:
+        """
+        Builds ffmpeg inputs and a filter graph that pads/trims each segment to its
+        duration and concatenates them into [outv].
+        """
+        inputs = []
+        filters = []
+        for n, seg in enumerate(segments):
+            inputs += ["-i", seg["path"]]
+            # Pad short clips by holding the last frame, then cut to the exact duration
+            filters.append(
+                f"[{n}:v]tpad=stop_mode=clone:stop_duration={seg['duration']:.3f},"
+                f"trim=duration={seg['duration']:.3f},setpts=PTS-STARTPTS[v{n}]"
+            )
+        concat_inputs = "".join(f"[v{n}]" for n in range(len(segments)))
+        filters.append(f"{concat_inputs}concat=n={len(segments)}:v=1:a=0[outv]")
+        return inputs, ";".join(filters)
+
+    def _video_encoder_args(self, profile: RenderProfile) -> list[str]:
+        # Identical for every segment of a render so segment files can be joined by stream copy
+        return [
+            "-r", str(profile.fps),
+            "-c:v", profile.codec, "-preset", profile.preset, "-crf", str(profile.crf),
+            "-pix_fmt", "yuv420p",
+        ]
+
+    async def _render_with_moviepy(self, audio_path: str, segments: list[dict], scene_count: int, output_path: Path, profile: RenderProfile, log_callback=None):
+        width, height = profile.width, profile.height
+        audio_clip = AudioFileClip(audio_path)
+        clips = []
+        last_scene = None
+
+        try:
+            for seg in segments:
+                if seg["scene"] != last_scene:
+                    last_scene = seg["scene"]
+                    msg = f"  🎞️ Processing scene {seg['scene']+1}/{scene_count}..."
+                    if log_callback:
+                        await log_callback(msg)
+                    print(msg)
+
+                if seg["kind"] == "video":
                     # Logic for Video Clips
-                    duration_per_clip = scene_duration / len(video_paths)
-                    for vid_path in video_paths:
-                        if not os.path.exists(vid_path):
-                            continue
-                        
-                        clip = VideoFileClip(vid_path)
-                        used_visual_paths.add(vid_path)
-                        
-                        # Trim video to match required duration
-                        # Use a tiny safety margin (0.01) to avoid MoviePy last-frame read errors
-                        if clip.duration > duration_per_clip:
-                            clip = clip.subclipped(0, min(duration_per_clip, clip.duration - 0.01))
-                        else:
-                            # If clip is too short, we fill the duration (MoviePy loops the last frame by default)
-                            clip = clip.with_duration(duration_per_clip)
-                        
-                        # High-speed Resize & Crop for consistency
-                        clip = clip.resized(height=720)
-                        if clip.w < 1280:
-                            clip = clip.resized(width=1280)
-                        clip = clip.cropped(x_center=clip.w/2, y_center=clip.h/2, width=1280, height=720)
-                        
-                        clips.append(clip)
-                
+                    clip = VideoFileClip(seg["path"])
+
+                    # Trim video to match required duration
+                    # Use a tiny safety margin (0.01) to avoid MoviePy last-frame read errors
+                    if clip.duration > seg["duration"]:
+                        clip = clip.subclipped(0, min(seg["duration"], clip.duration - 0.01))
+                    else:
+                        # If clip is too short, we fill the duration (MoviePy loops the last frame by default)
+                        clip = clip.with_duration(seg["duration"])
                 else:
                     # Logic for Static Images (Fallback)
-                    duration_per_image = scene_duration / len(image_paths)
-                    for img_path in image_paths:
-                        if not os.path.exists(img_path):
-                            continue
-                        
-                        clip = ImageClip(img_path).with_duration(duration_per_image)
-                        used_visual_paths.add(img_path)
-                        
-                        # High-speed Resize & Crop
-                        clip = clip.resized(height=720)
-                        if clip.w < 1280:
-                            clip = clip.resized(width=1280)
-                        clip = clip.cropped(x_center=clip.w/2, y_center=clip.h/2, width=1280, height=720)
-                        
-                        clips.append(clip)
-
-            if not clips:
-                audio_clip.close()
-                raise ValueError("No valid clips created. Check if visuals were downloaded.")
+                    clip = ImageClip(seg["path"]).with_duration(seg["duration"])
+
+                # High-speed Resize & Crop for consistency (normalized clips already match the profile)
+                if (clip.w, clip.h) != (width, height):
+                    clip = clip.resized(height=height)
+                    if clip.w < width:
+                        clip = clip.resized(width=width)
+                    clip = clip.cropped(x_center=clip.w/2, y_center=clip.h/2, width=width, height=height)
+
+                clips.append(clip)
 
             # 4. Concatenate and Finish
             # 'chain' is MUCH more memory efficient than 'compose'
-            # It works here because we've normalized all clips to 1280x720 above
+            # It works here because we've normalized all clips to the profile size above
             if log_callback:
                 await log_callback("  ⚡ Finalizing render...")
             final_video = concatenate_videoclips(clips, method="chain")
             final_video = final_video.with_audio(audio_clip)
-            
-            output_path = self.output_dir / output_filename
-            
+
             # Limit threads to 2 to prevent memory spikes in parallel encoding
             render_threads = min(2, self.cpu_count)
-            
+
             final_video.write_videofile(
                 str(output_path),
-                fps=24,
-                codec="libx264",
+                fps=profile.fps,
+                codec=profile.codec,
                 audio_codec="aac",
                 threads=render_threads,
-                preset="ultrafast",
+                preset=profile.preset,
+                ffmpeg_params=["-crf", str(profile.crf)],
                 logger=None 
             )
-            
+            final_video.close()
+        finally:
             # Cleanup
             audio_clip.close()
             for clip in clips:
                 clip.close()
-            final_video.close()
-
-            print(f"✅ Smart assembly completed: {output_path}")
-            return str(output_path), list(used_visual_paths)
-
-        except Exception as e:
-            print(f"❌ Smart assembly failed: {e}")
-            raise e
 
     async def extract_thumbnail(self, video_path: str, output_filename: str) -> str:
         """
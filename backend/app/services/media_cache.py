@@ -0,0 +1,286 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Optional
+from app.core.config import settings
+
+
+class MediaCache:
+    """
+    Size-bounded on-disk cache for media files (stock downloads, normalized
+    intermediates), shared by every worker process on the host.
+
+    Files are keyed by name (e.g. the Pexels-derived "12345.mp4") and tracked
+    in a SQLite index (key -> path, size, last access, hits). Tasks take a lease
+    on every file they use; leased files are never evicted, so a clip cannot be
+    deleted while another task is still downloading or rendering it. When the
+    cache grows past its byte budget, the least recently used unleased files
+    are removed.
+
+    The public methods are async: every SQLite call (which may wait up to 30s on
+    another process's write lock) runs in a worker thread, off the event loop.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, lease_ttl: int, download_wait_timeout: int):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lease_ttl = lease_ttl
+        self.download_wait_timeout = download_wait_timeout
+        self.db_path = self.root / "index.sqlite3"
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                    key TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (key, task_id)
+                );
+                CREATE TABLE IF NOT EXISTS downloads (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    started_at REAL NOT NULL
+                );
+                """
+            )
+
+    # -------------------------------------------------------------------------
+    # Lookups & registration
+    # -------------------------------------------------------------------------
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key
+
+    async def lookup(self, key: str, task_id: Optional[str] = None) -> Optional[Path]:
+        """
+        Returns the cached file for `key` (leasing it to `task_id`), or None on a miss.
+        """
+        return await asyncio.to_thread(self._lookup, key, task_id)
+
+    def _lookup(self, key: str, task_id: Optional[str]) -> Optional[Path]:
+        path = self.path_for(key)
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None and path.exists():
+                # File predates the index (or the index was reset): adopt it
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, path, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, str(path), path.stat().st_size, now, now),
+                )
+                row = (path.stat().st_size,)
+
+            if row is None or not path.exists():
+                if row is not None:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.stats["misses"] += 1
+                return None
+
+            conn.execute("UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            if task_id:
+                self._insert_lease(conn, key, task_id, now)
+
+        self.stats["hits"] += 1
+        return path
+
+    async def register(self, key: str, task_id: Optional[str] = None) -> Path:
+        """
+        Records a freshly downloaded file and enforces the disk budget.
+        """
+        return await asyncio.to_thread(self._register, key, task_id)
+
+    def _register(self, key: str, task_id: Optional[str]) -> Path:
+        path = self.path_for(key)
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, path, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, str(path), path.stat().st_size, now, now),
+            )
+            if task_id:
+                self._insert_lease(conn, key, task_id, now)
+            conn.execute("DELETE FROM downloads WHERE key = ?", (key,))
+        self._evict()
+        return path
+
+    # -------------------------------------------------------------------------
+    # Leases
+    # -------------------------------------------------------------------------
+
+    async def lease(self, key: str, task_id: str):
+        await asyncio.to_thread(self._lease, key, task_id)
+
+    def _lease(self, key: str, task_id: str):
+        with closing(self._connect()) as conn:
+            self._insert_lease(conn, key, task_id, time.time())
+
+    async def lease_paths(self, paths, task_id: str):
+        """
+        Leases the entries behind existing local paths (e.g. reused from a checkpoint);
+        paths outside this cache are ignored.
+        """
+        await asyncio.to_thread(self._lease_paths, paths, task_id)
+
+    def _lease_paths(self, paths, task_id: str):
+        with closing(self._connect()) as conn:
+            now = time.time()
+            for path in paths:
+                if path and Path(path).parent.resolve() == self.root.resolve():
+                    self._insert_lease(conn, Path(path).name, task_id, now)
+
+    def _insert_lease(self, conn: sqlite3.Connection, key: str, task_id: str, now: float):
+        conn.execute(
+            "INSERT OR REPLACE INTO leases (key, task_id, expires_at) VALUES (?, ?, ?)",
+            (key, task_id, now + self.lease_ttl),
+        )
+
+    async def release(self, task_id: str):
+        """
+        Drops every lease held by a task, then evicts if over budget.
+        """
+        await asyncio.to_thread(self._release, task_id)
+
+    def _release(self, task_id: str):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM leases WHERE task_id = ?", (task_id,))
+            conn.execute("DELETE FROM downloads WHERE owner = ?", (task_id,))
+        self._evict()
+
+    # -------------------------------------------------------------------------
+    # In-flight downloads (one downloader per key across processes)
+    # -------------------------------------------------------------------------
+
+    async def claim_download(self, key: str, owner: str) -> bool:
+        """
+        Claims the right to download `key`. If another task is already
+        downloading it (or the file has landed meanwhile), waits for that
+        download and returns False. Stale claims (older than the wait timeout)
+        are taken over.
+        """
+        deadline = time.time() + self.download_wait_timeout
+        while True:
+            claimed = await asyncio.to_thread(self._try_claim, key, owner)
+            if claimed is not None:
+                return claimed
+            if time.time() > deadline:
+                return False
+            await asyncio.sleep(0.5)
+
+    def _try_claim(self, key: str, owner: str) -> Optional[bool]:
+        """
+        One claim attempt: True if claimed, False if the file has landed, None while another owner holds it.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, started_at FROM downloads WHERE key = ?", (key,)).fetchone()
+            # Files land (by atomic rename) before their claim is dropped, so checking after
+            # the read never mistakes a finished download for a missing one
+            if self.path_for(key).exists():
+                conn.execute("COMMIT")
+                return False
+            if row is None or row[0] == owner or row[1] < now - self.download_wait_timeout:
+                conn.execute(
+                    "INSERT OR REPLACE INTO downloads (key, owner, started_at) VALUES (?, ?, ?)",
+                    (key, owner, now),
+                )
+                conn.execute("COMMIT")
+                return True
+            conn.execute("COMMIT")
+            return None
+
+    async def abandon_download(self, key: str, owner: str):
+        await asyncio.to_thread(self._abandon_download, key, owner)
+
+    def _abandon_download(self, key: str, owner: str):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM downloads WHERE key = ? AND owner = ?", (key, owner))
+
+    # -------------------------------------------------------------------------
+    # Eviction & metrics
+    # -------------------------------------------------------------------------
+
+    async def evict(self):
+        """
+        Removes least recently used, unleased files until the cache fits its budget.
+        """
+        await asyncio.to_thread(self._evict)
+
+    def _evict(self):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            candidates = conn.execute(
+                """
+                SELECT key, path, size FROM entries
+                WHERE key NOT IN (SELECT key FROM leases)
+                  AND key NOT IN (SELECT key FROM downloads)
+                ORDER BY last_access ASC
+                """
+            ).fetchall()
+
+            evicted = 0
+            for key, path, size in candidates:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    Path(path).unlink(missing_ok=True)
+                except OSError as e:
+                    print(f"  ❌ Failed to evict {key}: {e}")
+                    continue
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+                self.stats["evictions"] += 1
+                self.stats["evicted_bytes"] += size
+
+        if evicted:
+            print(f"🧹 Media cache evicted {evicted} file(s), now {total / 1024 / 1024:.1f} MB (budget {self.max_bytes / 1024 / 1024:.0f} MB)")
+
+    async def metrics(self) -> Dict[str, float]:
+        return await asyncio.to_thread(self._metrics)
+
+    def _metrics(self) -> Dict[str, float]:
+        with closing(self._connect()) as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            leased = conn.execute("SELECT COUNT(DISTINCT key) FROM leases WHERE expires_at >= ?", (time.time(),)).fetchone()[0]
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": entries,
+            "bytes": total,
+            "leased_entries": leased,
+            "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+media_cache = MediaCache(
+    root=Path(settings.OUTPUT_DIR) / "visuals",
+    max_bytes=settings.MEDIA_CACHE_MAX_BYTES,
+    lease_ttl=settings.MEDIA_CACHE_LEASE_TTL,
+    download_wait_timeout=settings.MEDIA_CACHE_DOWNLOAD_WAIT_TIMEOUT,
+)
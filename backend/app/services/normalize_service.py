@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.render_profiles import RenderProfile, DEFAULT_RENDER_PROFILE
+from app.services.media_cache import MediaCache
+from app.utils.ffmpeg import run_ffmpeg
+
+# Part of the cache key: bump when the transcode changes what an intermediate contains
+NORMALIZE_VERSION = 2
+
+
+class NormalizeService:
+    """
+    Transcodes source clips once into the geometry and frame rate of a render profile.
+    Intermediates use a fixed high-quality encode, so every profile with the same
+    geometry can share them.
+    """
+
+    def __init__(self):
+        self.preset = "veryfast"
+        self.crf = 20
+        self.cache = MediaCache(
+            root=Path(settings.OUTPUT_DIR) / "normalized",
+            max_bytes=settings.NORMALIZED_CACHE_MAX_BYTES,
+            lease_ttl=settings.MEDIA_CACHE_LEASE_TTL,
+            download_wait_timeout=settings.MEDIA_CACHE_DOWNLOAD_WAIT_TIMEOUT,
+        )
+        self.max_concurrency = settings.NORMALIZE_MAX_CONCURRENCY or max(1, multiprocessing.cpu_count() // 2)
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+
+    async def normalize_scenes(self, scenes: List[Dict], profile: RenderProfile = DEFAULT_RENDER_PROFILE, log_callback=None, task_id: Optional[str] = None) -> List[Dict]:
+        """
+        Transcodes every scene clip once into the target profile and attaches the
+        results under 'normalized_paths' (plus 'normalized_profile' when every clip
+        succeeded). Clips that fail to normalize keep their source path, so the
+        engine falls back to resizing them itself.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def normalize(path: str) -> str:
+            async with semaphore:
+                try:
+                    return await self.normalize_clip(path, profile, task_id)
+                except Exception as e:
+                    print(f"  ⚠️  Normalization failed for {Path(path).name}, using source: {e}")
+                    return path
+
+        # Scenes can share a clip; normalize each source once
+        unique_paths = list(dict.fromkeys(p for scene in scenes for p in scene.get("video_paths", [])))
+        msg = f"  🎚️ Normalizing {len(unique_paths)} clip(s) to {profile.normalize_key}..."
+        if log_callback:
+            await log_callback(msg)
+        print(msg)
+
+        normalized = dict(zip(unique_paths, await asyncio.gather(*(normalize(p) for p in unique_paths))))
+        for scene in scenes:
+            video_paths = scene.get("video_paths", [])
+            scene["normalized_paths"] = [normalized[p] for p in video_paths]
+            # Only scenes whose clips all normalized can skip per-frame work in the engine
+            if video_paths and all(normalized[p] != p for p in video_paths):
+                scene["normalized_profile"] = profile.normalize_key
+        return scenes
+
+    async def normalize_clip(self, source_path: str, profile: RenderProfile = DEFAULT_RENDER_PROFILE, task_id: Optional[str] = None) -> str:
+        """
+        Returns the normalized intermediate for a source clip, transcoding it on a cache miss.
+        """
+        source_hash = await self._source_hash(source_path)
+        key = f"{source_hash[:32]}_{profile.normalize_key}_v{NORMALIZE_VERSION}.mp4"
+        owner = task_id or f"pid-{os.getpid()}"
+
+        cached = await self.cache.lookup(key, task_id)
+        if cached:
+            return str(cached)
+
+        if not await self.cache.claim_download(key, owner):
+            cached = await self.cache.lookup(key, task_id)
+            if cached:
+                return str(cached)
+            raise RuntimeError(f"Concurrent normalization of {key} did not complete")
+
+        try:
+            await self._transcode(source_path, self.cache.path_for(key), profile)
+        except BaseException:
+            await self.cache.abandon_download(key, owner)
+            raise
+
+        return str(await self.cache.register(key, task_id))
+
+    async def _transcode(self, source_path: str, output_path: Path, profile: RenderProfile):
+        part = output_path.with_name(output_path.name + ".part")
+        vf = (
+            f"scale={profile.width}:{profile.height}:force_original_aspect_ratio=increase,"
+            f"crop={profile.width}:{profile.height},fps={profile.fps},setsar=1"
+        )
+        try:
+            await run_ffmpeg([
+                # Full length: scene durations aren't known yet, and the renderer trims each clip
+                "-i", source_path,
+                "-vf", vf,
+                "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+                "-pix_fmt", "yuv420p",
+                "-an",
+                "-movflags", "+faststart",
+                "-f", "mp4", str(part),
+            ])
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+
+        os.replace(part, output_path)
+
+    async def _source_hash(self, path: str) -> str:
+        """
+        Content hash of a source clip, memoized per (path, size, mtime) for this process.
+        """
+        stat = os.stat(path)
+        memo_key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._hashes:
+            self._hashes[memo_key] = await asyncio.to_thread(self._hash_file, path)
+        return self._hashes[memo_key]
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def release(self, task_id: str):
+        await self.cache.release(task_id)
+
+
+normalize_service = NormalizeService()
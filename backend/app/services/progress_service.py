@@ -0,0 +1,271 @@
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional, Set
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.services.task_state import task_state
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+# Appends an event to the task's stream, mirrors it to the task state and announces it,
+# all atomically. While a task is processing its progress never goes below the stored
+# value, so stage tasks running in parallel (each with its own tracker) can't move it back.
+# KEYS: stream, state hash. ARGV: channel, payload JSON (without progress), progress,
+# clamp flag, stream maxlen, stream TTL, state TTL, field count, fields..., fields to clear...
+_WRITE_EVENT_SCRIPT = """
+local progress = tonumber(ARGV[3])
+if ARGV[4] == '1' then
+    local current = tonumber(redis.call('HGET', KEYS[2], 'progress') or '0') or 0
+    if current > progress then progress = current end
+end
+local head = string.sub(ARGV[2], 1, -2) .. ',"progress":' .. progress
+local event_id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[5], '*', 'payload', head .. '}')
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+
+local count = tonumber(ARGV[8])
+local fields = {'progress', tostring(progress), 'event_id', '"' .. event_id .. '"'}
+for i = 9, 8 + count do fields[#fields + 1] = ARGV[i] end
+redis.call('HSET', KEYS[2], unpack(fields))
+if #ARGV > 8 + count then redis.call('HDEL', KEYS[2], unpack(ARGV, 9 + count, #ARGV)) end
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+
+redis.call('PUBLISH', ARGV[1], head .. ',"event_id":"' .. event_id .. '"}')
+return {event_id, progress}
+"""
+
+
+def progress_stream_key(task_id: str) -> str:
+    return f"progress:{task_id}"
+
+
+def progress_channel(task_id: str) -> str:
+    return f"stream:{task_id}"
+
+
+class ProgressPublisher:
+    """
+    Publishes task progress: every event is appended to a capped Redis Stream per
+    task (so late or reconnecting clients can replay it), mirrored to the
+    `task:{id}` state and announced on the task's PubSub channel.
+
+    Bursts are coalesced to at most `max_per_second` writes per task; only the
+    latest event of a burst is written, with the skipped messages attached under
+    'messages'. Status changes and terminal states are always written at once.
+    """
+
+    def __init__(self, max_per_second: float, stream_maxlen: int, ttl: int):
+        self.min_interval = 1 / max_per_second if max_per_second > 0 else 0
+        self.stream_maxlen = stream_maxlen
+        self.ttl = ttl
+        self._last_write: Dict[str, float] = {}
+        self._last_status: Dict[str, str] = {}
+        self._pending: Dict[str, dict] = {}
+        self._skipped: Dict[str, List[str]] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self._lock = asyncio.Lock()
+        self._script = None
+
+    async def publish(self, task_id: str, status: str, progress: int, message: str, data: Optional[dict] = None):
+        payload = {
+            "task_id": task_id,
+            "status": status,
+            "progress": progress,
+            "message": message,
+            "data": data or {}
+        }
+
+        elapsed = time.monotonic() - self._last_write.get(task_id, 0.0)
+        urgent = status in TERMINAL_STATUSES or status != self._last_status.get(task_id)
+        if urgent or elapsed >= self.min_interval:
+            await self._write(task_id, payload)
+            return
+
+        # Within the rate limit: keep only the latest event and write it when the window ends
+        previous = self._pending.get(task_id)
+        if previous:
+            self._skipped.setdefault(task_id, []).append(previous["message"])
+        self._pending[task_id] = payload
+        if task_id not in self._flushers:
+            self._flushers[task_id] = asyncio.create_task(self._flush_later(task_id, self.min_interval - elapsed))
+
+    async def flush(self, task_id: str):
+        """
+        Writes any coalesced event still waiting for its window (e.g. before a worker task returns).
+        """
+        if task_id in self._pending:
+            await self._write(task_id, None)
+        flusher = self._flushers.pop(task_id, None)
+        if flusher:
+            flusher.cancel()
+
+    async def _flush_later(self, task_id: str, delay: float):
+        await asyncio.sleep(delay)
+        self._flushers.pop(task_id, None)
+        if task_id in self._pending:
+            await self._write(task_id, None)
+
+    async def _write(self, task_id: str, payload: Optional[dict]):
+        async with self._lock:
+            # A newer payload replaces the coalesced one; its skipped messages travel with it
+            pending = self._pending.pop(task_id, None)
+            skipped = self._skipped.pop(task_id, [])
+            if payload is None:
+                payload = pending
+            elif pending:
+                skipped.append(pending["message"])
+            if payload is None:
+                return
+            if skipped:
+                payload["messages"] = skipped + [payload["message"]]
+
+            # Only the progress fields change; profile, priority etc. stay as queued
+            fields = {k: v for k, v in payload.items() if k != "progress"}
+            encoded = [item for pair in task_state.encode(fields).items() for item in pair]
+            clear = [] if skipped else ["messages"]
+            event_id, progress = await self._write_event_script()(
+                keys=[progress_stream_key(task_id), task_state.key(task_id)],
+                args=[
+                    progress_channel(task_id),
+                    json.dumps(fields),
+                    payload["progress"],
+                    1 if payload["status"] == "processing" else 0,
+                    self.stream_maxlen,
+                    self.ttl,
+                    task_state.ttl_for(payload["status"]),
+                    len(encoded),
+                    *encoded,
+                    *clear,
+                ],
+            )
+            payload["progress"] = int(progress)
+            payload["event_id"] = event_id
+
+            if payload["status"] in TERMINAL_STATUSES:
+                self._last_write.pop(task_id, None)
+                self._last_status.pop(task_id, None)
+            else:
+                self._last_write[task_id] = time.monotonic()
+                self._last_status[task_id] = payload["status"]
+
+    def _write_event_script(self):
+        if self._script is None:
+            self._script = redis_client.register_script(_WRITE_EVENT_SCRIPT)
+        return self._script
+
+    async def replay(self, task_id: str, after_event_id: str) -> List[dict]:
+        """
+        Events recorded after `after_event_id` (exclusive), oldest first.
+        """
+        entries = await redis_client.xrange(progress_stream_key(task_id), min=f"({after_event_id}", max="+")
+        events = []
+        for entry_id, fields in entries:
+            payload = json.loads(fields["payload"])
+            payload["event_id"] = entry_id
+            events.append(payload)
+        return events
+
+
+class ProgressHub:
+    """
+    Fans progress events out to SSE clients in this API process over a single
+    shared pattern subscription (`stream:*`), instead of one Redis connection
+    and polling loop per client. The subscription is pushed to a reader task
+    that hands each event to the in-memory queues of that task's subscribers.
+
+    Queues are bounded: a client too slow to keep up loses its oldest buffered
+    events (the latest state and the terminal event are always kept, and it can
+    catch up with Last-Event-ID).
+    """
+
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._reader: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    async def subscribe(self, task_id: str) -> asyncio.Queue:
+        """
+        Registers a subscriber queue; returns once the shared subscription is live,
+        so a snapshot read afterwards can't miss events published in between.
+        """
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            print("⚠️  Progress subscription not ready; streaming may miss early events")
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(task_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+
+    async def _read(self):
+        """
+        Holds the shared subscription, reconnecting with backoff if Redis drops it.
+        """
+        pattern = progress_channel("*")
+        backoff = 0.5
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.psubscribe(pattern)
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+                    elif message["type"] == "psubscribe":
+                        # Only Redis's confirmation means events are being delivered
+                        self._ready.set()
+                        backoff = 0.5
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Progress subscription lost, reconnecting in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+            finally:
+                self._ready.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def _dispatch(self, channel: str, data: str):
+        task_id = channel[len(progress_channel("")):]
+        queues = self._subscribers.get(task_id)
+        if not queues:
+            return
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+
+progress_publisher = ProgressPublisher(
+    max_per_second=settings.PROGRESS_MAX_EVENTS_PER_SECOND,
+    stream_maxlen=settings.PROGRESS_STREAM_MAXLEN,
+    ttl=settings.PROGRESS_STREAM_TTL,
+)
+
+progress_hub = ProgressHub(buffer_size=settings.PROGRESS_SUBSCRIBER_BUFFER)
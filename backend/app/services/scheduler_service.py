@@ -0,0 +1,448 @@
+import asyncio
+import json
+import math
+import time
+import uuid
+from typing import Dict, Optional
+from celery import chain, group
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.redis_client import redis_client, compare_and_delete
+
+# Lanes in strict priority order, with the Celery priority their tasks carry
+# (Redis broker: 0 is served first), so interactive work also jumps ahead of
+# batch stage tasks already waiting in the worker queues
+LANES = ("interactive", "standard", "batch")
+LANE_PRIORITIES = {"interactive": 0, "standard": 3, "batch": 6}
+
+# Admission check and enqueue in one atomic step, so a burst of submissions can't all
+# pass the limits before any of them is queued. Queue depth comes from running counters
+# (sched:waiting) rather than a scan of every estimate. Returns {verdict, estimated start,
+# seconds until the next slot frees, count that hit the limit}, numbers as strings.
+# KEYS: waiting counters, in_flight, estimates, client queue, lane ring, lane metrics
+# ARGV: task id, job JSON, estimate JSON, lane, client id, job seconds, now, max queued,
+#       max queued per client, max wait, max in flight, default job seconds, lanes ahead (comma-separated)
+_ADMIT_AND_ENQUEUE_SCRIPT = """
+local waiting_key, in_flight_key, estimates_key = KEYS[1], KEYS[2], KEYS[3]
+local lane, client_id = ARGV[4], ARGV[5]
+local seconds, now = tonumber(ARGV[6]), tonumber(ARGV[7])
+local max_queued, max_per_client = tonumber(ARGV[8]), tonumber(ARGV[9])
+local max_wait, max_in_flight = tonumber(ARGV[10]), tonumber(ARGV[11])
+local default_seconds = tonumber(ARGV[12])
+
+-- Remaining time of running jobs (at most max_in_flight of them)
+local running, remaining_total, next_slot = 0, 0, nil
+local in_flight = redis.call('ZRANGE', in_flight_key, 0, -1, 'WITHSCORES')
+for i = 1, #in_flight, 2 do
+    local raw = redis.call('HGET', estimates_key, in_flight[i])
+    local job_seconds = raw and cjson.decode(raw).seconds or default_seconds
+    local left = math.max(0, job_seconds - (now - tonumber(in_flight[i + 1])))
+    running = running + 1
+    remaining_total = remaining_total + left
+    if next_slot == nil or left < next_slot then next_slot = left end
+end
+next_slot = next_slot or seconds
+
+-- Work queued in this lane or ahead of it
+local waiting_ahead, seconds_ahead = 0, 0
+for ahead in string.gmatch(ARGV[13], '[^,]+') do
+    waiting_ahead = waiting_ahead + tonumber(redis.call('HGET', waiting_key, 'count:' .. ahead) or '0')
+    seconds_ahead = seconds_ahead + math.max(0, tonumber(redis.call('HGET', waiting_key, 'seconds:' .. ahead) or '0'))
+end
+local start = 0
+if max_in_flight > 0 and running + waiting_ahead >= max_in_flight then
+    start = (remaining_total + seconds_ahead) / max_in_flight
+end
+
+local total = tonumber(redis.call('HGET', waiting_key, 'total') or '0')
+if max_queued > 0 and total >= max_queued then
+    return {'queue_full', tostring(start), tostring(next_slot), tostring(total)}
+end
+local client_waiting = tonumber(redis.call('HGET', waiting_key, 'client:' .. client_id) or '0')
+if max_per_client > 0 and client_waiting >= max_per_client then
+    return {'client_limit', tostring(start), tostring(next_slot), tostring(client_waiting)}
+end
+if max_wait > 0 and start > max_wait then
+    return {'wait', tostring(start), tostring(next_slot), '0'}
+end
+
+-- First waiting job for this client: it joins the lane's ring
+if redis.call('RPUSH', KEYS[4], ARGV[2]) == 1 then
+    redis.call('RPUSH', KEYS[5], client_id)
+end
+redis.call('HINCRBY', KEYS[6], 'waiting', 1)
+redis.call('HSET', estimates_key, ARGV[1], ARGV[3])
+redis.call('HINCRBY', waiting_key, 'total', 1)
+redis.call('HINCRBY', waiting_key, 'count:' .. lane, 1)
+redis.call('HINCRBY', waiting_key, 'client:' .. client_id, 1)
+redis.call('HINCRBYFLOAT', waiting_key, 'seconds:' .. lane, seconds)
+return {'ok', tostring(start), tostring(next_slot), '0'}
+"""
+
+# Takes a job off the running totals of waiting jobs; per-client counters are dropped at zero
+_RELEASE_WAITING_LUA = """
+local function release_waiting(waiting_key, lane, client_id, seconds)
+    redis.call('HINCRBY', waiting_key, 'total', -1)
+    redis.call('HINCRBY', waiting_key, 'count:' .. lane, -1)
+    redis.call('HINCRBYFLOAT', waiting_key, 'seconds:' .. lane, -seconds)
+    if redis.call('HINCRBY', waiting_key, 'client:' .. client_id, -1) <= 0 then
+        redis.call('HDEL', waiting_key, 'client:' .. client_id)
+    end
+end
+"""
+
+# Pops the next job (highest non-empty lane, next client in its ring) and reserves its
+# in-flight slot in the same step, so a job is always either waiting or in flight.
+# Ring entries whose queue turned out empty are skipped within the same lane.
+# KEYS: waiting counters, in_flight; ARGV: key prefix, now, default job seconds, lanes (comma-separated)
+_POP_SCRIPT = _RELEASE_WAITING_LUA + """
+local prefix, now = ARGV[1], ARGV[2]
+for lane in string.gmatch(ARGV[4], '[^,]+') do
+    local ring_key = prefix .. ':' .. lane .. ':clients'
+    while true do
+        local client_id = redis.call('LPOP', ring_key)
+        if not client_id then break end
+        local client_key = prefix .. ':' .. lane .. ':client:' .. client_id
+        local raw = redis.call('LPOP', client_key)
+        if redis.call('LLEN', client_key) > 0 then
+            redis.call('RPUSH', ring_key, client_id)
+        end
+        if raw then
+            local job = cjson.decode(raw)
+            redis.call('ZADD', KEYS[2], now, job.task_id)
+            redis.call('HINCRBY', prefix .. ':' .. lane .. ':metrics', 'waiting', -1)
+            release_waiting(KEYS[1], lane, client_id, tonumber(job.seconds) or tonumber(ARGV[3]))
+            return raw
+        end
+    end
+end
+return false
+"""
+
+# Undoes a pop whose hand-off to Celery failed: the job goes back to the head of its
+# client's queue (and the client to the head of the ring) and its slot is freed.
+# KEYS: waiting counters, in_flight, client queue, lane ring, lane metrics
+# ARGV: job JSON, lane, client id, job seconds, task id
+_REQUEUE_SCRIPT = """
+redis.call('ZREM', KEYS[2], ARGV[5])
+if redis.call('LPUSH', KEYS[3], ARGV[1]) == 1 then
+    redis.call('LPUSH', KEYS[4], ARGV[3])
+end
+redis.call('HINCRBY', KEYS[5], 'waiting', 1)
+redis.call('HINCRBY', KEYS[1], 'total', 1)
+redis.call('HINCRBY', KEYS[1], 'count:' .. ARGV[2], 1)
+redis.call('HINCRBY', KEYS[1], 'client:' .. ARGV[3], 1)
+redis.call('HINCRBYFLOAT', KEYS[1], 'seconds:' .. ARGV[2], ARGV[4])
+return 1
+"""
+
+# Removes a still-waiting job from the queue; returns 0 if it was already dispatched.
+# KEYS: waiting counters, client queue, lane ring, lane metrics, estimates
+# ARGV: job JSON, lane, client id, job seconds, task id
+_WITHDRAW_SCRIPT = _RELEASE_WAITING_LUA + """
+if redis.call('LREM', KEYS[2], 1, ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('LLEN', KEYS[2]) == 0 then
+    redis.call('LREM', KEYS[3], 0, ARGV[3])
+end
+redis.call('HINCRBY', KEYS[4], 'waiting', -1)
+redis.call('HDEL', KEYS[5], ARGV[5])
+release_waiting(KEYS[1], ARGV[2], ARGV[3], tonumber(ARGV[4]))
+return 1
+"""
+
+
+def enqueue_video_pipeline(task_id: str, prompt: str, render_profile: str = "standard", priority: Optional[int] = None):
+    """
+    Queues a job: as a chain of stage tasks on per-stage queues (PIPELINE_SPLIT_TASKS),
+    or as a single task on main-queue. Stage tasks hand results over through checkpoints,
+    so every worker must share OUTPUT_DIR.
+    """
+    args = (task_id, prompt, render_profile)
+
+    def stage(name: str):
+        return celery_app.signature(f"app.worker.{name}", args=args, immutable=True).set(priority=priority)
+
+    if not settings.PIPELINE_SPLIT_TASKS:
+        return stage("process_video_task").apply_async()
+
+    if settings.PIPELINE_CONCURRENT_STAGES:
+        media = group(stage("voice_stage_task"), stage("visuals_stage_task"))
+    else:
+        media = chain(stage("voice_stage_task"), stage("visuals_stage_task"))
+    return chain(
+        stage("script_stage_task"),
+        media,
+        stage("render_stage_task"),
+        stage("upload_stage_task"),
+    ).apply_async()
+
+
+class Admission:
+    """
+    Outcome of an admission check: whether a job may be queued, and if not,
+    why and how long the client should wait before retrying.
+    """
+
+    def __init__(self, admitted: bool, estimated_seconds: float, estimated_start_seconds: float, reason: Optional[str] = None, retry_after: int = 0):
+        self.admitted = admitted
+        self.estimated_seconds = estimated_seconds
+        self.estimated_start_seconds = estimated_start_seconds
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Fair scheduling in front of Celery. Jobs wait in Redis, one FIFO per client
+    per lane, and at most SCHEDULER_MAX_IN_FLIGHT of them are handed to Celery
+    at a time. Lanes are served in priority order; within a lane, clients take
+    turns (round-robin), so one client's burst can't starve the others.
+
+    Redis layout:
+      sched:{lane}:clients          round-robin ring of clients with waiting jobs
+      sched:{lane}:client:{client}  that client's waiting jobs (JSON, FIFO)
+      sched:{lane}:metrics          waiting / dispatched / wait-time counters
+      sched:in_flight               dispatched task ids, scored by dispatch time
+      sched:estimates               task id -> lane, profile and estimated seconds (waiting + in flight)
+      sched:waiting                 running totals of waiting jobs: total, per lane (count and
+                                    estimated seconds) and per client
+      sched:durations               moving average of real job durations per render profile
+
+    Admission control uses the running totals and the in-flight estimates to bound
+    queue depth and the expected wait before a new job starts.
+    """
+
+    def __init__(self, max_in_flight: int, in_flight_ttl: int, max_queued: int = 0, max_queued_per_client: int = 0,
+                 max_wait_seconds: int = 0, default_job_seconds: float = 180.0, prefix: str = "sched"):
+        self.max_in_flight = max_in_flight
+        self.in_flight_ttl = in_flight_ttl
+        self.max_queued = max_queued
+        self.max_queued_per_client = max_queued_per_client
+        self.max_wait_seconds = max_wait_seconds
+        self.default_job_seconds = default_job_seconds
+        self.prefix = prefix
+        self._scripts = {}
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    # -------------------------------------------------------------------------
+    # Admission control
+    # -------------------------------------------------------------------------
+
+    async def estimate_job_seconds(self, render_profile: str) -> float:
+        """
+        Expected wall time of a job, learned from finished jobs with the same profile.
+        """
+        learned = await redis_client.hget(self._key("durations"), render_profile)
+        return float(learned) if learned else self.default_job_seconds
+
+    # -------------------------------------------------------------------------
+    # Queueing & dispatch
+    # -------------------------------------------------------------------------
+
+    async def submit(self, task_id: str, prompt: str, render_profile: str, lane: str = "standard",
+                     client_id: str = "anonymous") -> Admission:
+        """
+        Checks a new job against the queue limits and, if admitted, queues it in its
+        client's lane (atomically) and dispatches whatever fits.
+        """
+        estimated_seconds = await self.estimate_job_seconds(render_profile)
+        now = time.time()
+        estimate = {"lane": lane, "client_id": client_id, "profile": render_profile, "seconds": estimated_seconds}
+        job = {
+            "task_id": task_id,
+            "prompt": prompt,
+            "render_profile": render_profile,
+            "lane": lane,
+            "client_id": client_id,
+            "seconds": estimated_seconds,
+            "queued_at": now,
+        }
+        raw_job = json.dumps(job)
+        verdict, estimated_start, next_slot, count = await self._script(_ADMIT_AND_ENQUEUE_SCRIPT)(
+            keys=[
+                self._key("waiting"),
+                self._key("in_flight"),
+                self._key("estimates"),
+                self._key(lane, "client", client_id),
+                self._key(lane, "clients"),
+                self._key(lane, "metrics"),
+            ],
+            args=[
+                task_id, raw_job, json.dumps(estimate), lane, client_id, estimated_seconds, now,
+                self.max_queued, self.max_queued_per_client, self.max_wait_seconds, self.max_in_flight,
+                self.default_job_seconds, ",".join(LANES[:LANES.index(lane) + 1]),
+            ],
+        )
+        estimated_start, next_slot = float(estimated_start), float(next_slot)
+
+        def reject(reason: str, retry_after: float) -> Admission:
+            return Admission(False, estimated_seconds, estimated_start, reason, max(1, math.ceil(retry_after)))
+
+        if verdict == "queue_full":
+            return reject(f"Queue is full ({count} jobs waiting)", next_slot)
+        if verdict == "client_limit":
+            return reject(f"Too many queued jobs for this client ({count})", next_slot)
+        if verdict == "wait":
+            return reject(f"Estimated wait of {estimated_start:.0f}s exceeds the {self.max_wait_seconds}s limit",
+                          estimated_start - self.max_wait_seconds)
+
+        try:
+            await self.dispatch()
+        except Exception as e:
+            # The caller reports the failure, so a job still waiting must not start later behind its back
+            if await self._script(_WITHDRAW_SCRIPT)(
+                keys=[
+                    self._key("waiting"),
+                    self._key(lane, "client", client_id),
+                    self._key(lane, "clients"),
+                    self._key(lane, "metrics"),
+                    self._key("estimates"),
+                ],
+                args=[raw_job, lane, client_id, estimated_seconds, task_id],
+            ):
+                raise
+            print(f"⚠️  Dispatch failed after {task_id} was handed to Celery: {e}")
+        return Admission(True, estimated_seconds, estimated_start)
+
+    def _script(self, source: str):
+        if source not in self._scripts:
+            self._scripts[source] = redis_client.register_script(source)
+        return self._scripts[source]
+
+    async def finish(self, task_id: str, completed: bool = False):
+        """
+        Frees a finished job's slot and dispatches the next waiting jobs.
+        Completed jobs update the duration estimate for their render profile.
+        """
+        in_flight_key = self._key("in_flight")
+        dispatched_at = await redis_client.zscore(in_flight_key, task_id)
+        raw = await redis_client.hget(self._key("estimates"), task_id)
+        if completed and dispatched_at and raw:
+            profile = json.loads(raw)["profile"]
+            duration = time.time() - dispatched_at
+            previous = await redis_client.hget(self._key("durations"), profile)
+            average = duration if previous is None else 0.8 * float(previous) + 0.2 * duration
+            await redis_client.hset(self._key("durations"), profile, round(average, 1))
+
+        await redis_client.zrem(in_flight_key, task_id)
+        await redis_client.hdel(self._key("estimates"), task_id)
+        await self.dispatch()
+
+    async def dispatch(self):
+        """
+        Hands waiting jobs to Celery until the in-flight limit is reached.
+        Serialized across API and worker processes by a short Redis lock.
+        """
+        lock_key = self._key("lock")
+        token = str(uuid.uuid4())
+        for _ in range(40):
+            if await redis_client.set(lock_key, token, nx=True, px=5000):
+                break
+            await asyncio.sleep(0.05)
+        else:
+            print("⚠️  Scheduler lock busy; leaving dispatch to its holder")
+            return
+
+        try:
+            in_flight_key = self._key("in_flight")
+            # Slots of jobs whose worker died without finishing are reclaimed after the TTL
+            stale = await redis_client.zrangebyscore(in_flight_key, 0, time.time() - self.in_flight_ttl)
+            if stale:
+                await redis_client.zrem(in_flight_key, *stale)
+                await redis_client.hdel(self._key("estimates"), *stale)
+            in_flight = await redis_client.zcard(in_flight_key)
+
+            while self.max_in_flight <= 0 or in_flight < self.max_in_flight:
+                # The job's in-flight slot is taken before Celery sees it, so an instant finish() can't precede it
+                job = await self._pop_next()
+                if not job:
+                    break
+                try:
+                    enqueue_video_pipeline(job["task_id"], job["prompt"], job["render_profile"], priority=LANE_PRIORITIES[job["lane"]])
+                except Exception:
+                    await self._requeue(job)
+                    raise
+                await self._record_dispatch(job)
+                in_flight += 1
+        finally:
+            # Only release our own lock: it may have expired and been taken by another dispatcher
+            await compare_and_delete(lock_key, token)
+
+    async def _pop_next(self) -> Optional[Dict]:
+        """
+        Next job: highest-priority non-empty lane, next client in that lane's ring.
+        Its in-flight slot is reserved in the same step.
+        """
+        raw = await self._script(_POP_SCRIPT)(
+            keys=[self._key("waiting"), self._key("in_flight")],
+            args=[self.prefix, time.time(), self.default_job_seconds, ",".join(LANES)],
+        )
+        return json.loads(raw) if raw else None
+
+    async def _requeue(self, job: Dict):
+        lane, client_id = job["lane"], job["client_id"]
+        await self._script(_REQUEUE_SCRIPT)(
+            keys=[
+                self._key("waiting"),
+                self._key("in_flight"),
+                self._key(lane, "client", client_id),
+                self._key(lane, "clients"),
+                self._key(lane, "metrics"),
+            ],
+            args=[json.dumps(job), lane, client_id, job.get("seconds", self.default_job_seconds), job["task_id"]],
+        )
+
+    async def _record_dispatch(self, job: Dict):
+        wait = time.time() - job["queued_at"]
+        async with redis_client.pipeline(transaction=True) as pipe:
+            metrics_key = self._key(job["lane"], "metrics")
+            pipe.hincrby(metrics_key, "dispatched", 1)
+            pipe.hincrbyfloat(metrics_key, "wait_seconds_total", wait)
+            pipe.hset(metrics_key, "last_wait_seconds", round(wait, 3))
+            await pipe.execute()
+
+    async def metrics(self) -> Dict:
+        """
+        Per-lane queue depth, waiting clients and wait times, plus in-flight jobs.
+        """
+        lanes = {}
+        for lane in LANES:
+            raw = await redis_client.hgetall(self._key(lane, "metrics"))
+            dispatched = int(raw.get("dispatched", 0))
+            wait_total = float(raw.get("wait_seconds_total", 0))
+            oldest_wait = 0.0
+            # The oldest waiting job is at the head of one of the clients' queues
+            for client_id in await redis_client.lrange(self._key(lane, "clients"), 0, -1):
+                head = await redis_client.lindex(self._key(lane, "client", client_id), 0)
+                if head:
+                    oldest_wait = max(oldest_wait, time.time() - json.loads(head)["queued_at"])
+            lanes[lane] = {
+                "waiting": max(0, int(raw.get("waiting", 0))),
+                "waiting_clients": await redis_client.llen(self._key(lane, "clients")),
+                "dispatched": dispatched,
+                "avg_wait_seconds": round(wait_total / dispatched, 3) if dispatched else 0.0,
+                "last_wait_seconds": float(raw.get("last_wait_seconds", 0)),
+                "oldest_wait_seconds": round(oldest_wait, 3),
+            }
+        estimates = [json.loads(raw) for raw in await redis_client.hvals(self._key("estimates"))]
+        return {
+            "lanes": lanes,
+            "in_flight": await redis_client.zcard(self._key("in_flight")),
+            "max_in_flight": self.max_in_flight,
+            "estimated_backlog_seconds": round(sum(e["seconds"] for e in estimates), 1),
+            "job_duration_estimates": await redis_client.hgetall(self._key("durations")),
+        }
+
+
+job_scheduler = JobScheduler(
+    max_in_flight=settings.SCHEDULER_MAX_IN_FLIGHT,
+    in_flight_ttl=settings.SCHEDULER_IN_FLIGHT_TTL,
+    max_queued=settings.SCHEDULER_MAX_QUEUED,
+    max_queued_per_client=settings.SCHEDULER_MAX_QUEUED_PER_CLIENT,
+    max_wait_seconds=settings.SCHEDULER_MAX_WAIT_SECONDS,
+    default_job_seconds=settings.SCHEDULER_DEFAULT_JOB_SECONDS,
+)
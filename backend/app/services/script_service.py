@@ -1,20 +1,66 @@
+import asyncio
+import copy
+import hashlib
+import time
+from typing import Awaitable, Callable, Optional
 from google import genai
 from google.genai import types
 import json
 import re
 from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.utils.json_stream import JsonArrayStreamParser
 from app.utils.prompts import script_prompt
 
+# Changes whenever the system prompt text changes, so stale cached scripts are never served
+SCRIPT_PROMPT_VERSION = hashlib.sha256(script_prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Case, whitespace and trailing punctuation don't change the script we'd generate.
+    """
+    return re.sub(r"\s+", " ", prompt).strip().rstrip(".!?").strip().lower()
+
+
+class _SceneEmitter:
+    """
+    Hands each scene to `on_scene(index, scene)` exactly once, whether it arrived
+    from the stream or only with the finished script (cache hits, joined requests).
+    """
+
+    def __init__(self, on_scene: Callable[[int, dict], Awaitable[None]]):
+        self.on_scene = on_scene
+        self.emitted = 0
+
+    async def __call__(self, scene: dict):
+        index = self.emitted
+        self.emitted += 1
+        await self.on_scene(index, scene)
+
+    async def flush(self, script_data: dict):
+        for scene in copy.deepcopy(script_data.get("scenes", [])[self.emitted:]):
+            await self(scene)
+
 
 class ScriptService:
     def __init__(self):
         self.client = genai.Client(
             api_key=settings.GEMINI_API_KEY) if settings.GEMINI_API_KEY else None
+        self._inflight: dict[str, asyncio.Task] = {}
 
-    async def generate_script(self, prompt: str) -> dict:
+    async def generate_script(self, prompt: str, on_scene: Optional[Callable[[int, dict], Awaitable[None]]] = None) -> dict:
         """
         Generates a structured script including narration and visual keywords.
         Returns a dictionary with 'narration' and 'scenes'.
+
+        Scripts are cached in Redis by normalized prompt, model and system prompt
+        version. Concurrent identical requests share one Gemini call: in-process
+        through a shared task, across workers through a Redis lock.
+
+        With `on_scene`, the response is streamed and `on_scene(index, scene)` is
+        awaited as soon as each scene is complete, so downstream work can start
+        before the whole script has been generated.
         """
         if not self.client:
             if settings.GEMINI_API_KEY:
@@ -22,26 +68,145 @@ class ScriptService:
             else:
                 return {"error": "GEMINI_API_KEY not configured."}
 
+        emitter = _SceneEmitter(on_scene) if on_scene else None
+        script_data = await self._generate(prompt, emitter)
+        if emitter and "error" not in script_data:
+            await emitter.flush(script_data)
+        return script_data
+
+    async def _generate(self, prompt: str, emitter: Optional[_SceneEmitter]) -> dict:
+        if not settings.SCRIPT_CACHE_ENABLED:
+            return await self._generate_uncached(prompt, emitter)
+
+        key = self._cache_key(prompt)
+        cached = await self._cache_get(key)
+        if cached is not None:
+            print(f"✅ Script cache hit for prompt: '{prompt[:60]}'")
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            # Only the caller that starts the generation receives streamed scenes;
+            # callers joining it get theirs from the finished script
+            task = asyncio.create_task(self._generate_single_flight(key, prompt, emitter))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            print(f"⏳ Joining in-flight script generation for prompt: '{prompt[:60]}'")
+
+        # Shield so one cancelled caller doesn't cancel the call others are waiting on;
+        # each caller gets its own copy since later stages mutate the scenes
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _generate_single_flight(self, key: str, prompt: str, emitter: Optional[_SceneEmitter] = None) -> dict:
+        lock_key = f"{key}:lock"
+        deadline = time.monotonic() + settings.SCRIPT_TIMEOUT + 10
+
+        while True:
+            try:
+                acquired = await redis_client.set(lock_key, "1", nx=True, ex=int(settings.SCRIPT_TIMEOUT) + 10)
+            except Exception as e:
+                print(f"  ⚠️  Script cache unavailable: {e}")
+                acquired = True
+
+            if acquired:
+                try:
+                    # A worker that held the lock before us may have just cached the script
+                    cached = await self._cache_get(key)
+                    if cached is not None:
+                        return cached
+                    script_data = await self._generate_uncached(prompt, emitter)
+                    if "error" not in script_data:
+                        await self._cache_set(key, script_data)
+                    return script_data
+                finally:
+                    try:
+                        await redis_client.delete(lock_key)
+                    except Exception:
+                        pass
+
+            # Another worker is generating this exact script; wait for its result
+            cached = await self._cache_get(key)
+            if cached is not None:
+                return cached
+            if time.monotonic() > deadline:
+                return await self._generate_uncached(prompt)
+            await asyncio.sleep(0.5)
+
+    async def _generate_uncached(self, prompt: str, emitter: Optional[_SceneEmitter] = None) -> dict:
         system_instruction = script_prompt
+        config = types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            response_mime_type="application/json",
+            # thinking_config=types.ThinkingConfig(thinking_level='low')
+        )
 
         try:
-            response = self.client.models.generate_content(
-                model=settings.GEMINI_MODEL,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_instruction,
-                    response_mime_type="application/json",
-                    # thinking_config=types.ThinkingConfig(thinking_level='low')
-                ),
-                contents=prompt
-            )
+            # Async client so the event loop (progress publishing, concurrent stages) keeps running
+            if emitter:
+                text = await asyncio.wait_for(self._stream_content(prompt, config, emitter), timeout=settings.SCRIPT_TIMEOUT)
+            else:
+                response = await asyncio.wait_for(
+                    self.client.aio.models.generate_content(
+                        model=settings.GEMINI_MODEL,
+                        config=config,
+                        contents=prompt
+                    ),
+                    timeout=settings.SCRIPT_TIMEOUT
+                )
+                text = response.text
 
             # Extract JSON from response
-            script_data = json.loads(response.text)
+            script_data = json.loads(text)
             return script_data
 
+        except asyncio.TimeoutError:
+            print(f"Script generation timed out after {settings.SCRIPT_TIMEOUT}s")
+            return {"error": f"Script generation timed out after {settings.SCRIPT_TIMEOUT}s"}
         except Exception as e:
             print(f"Error in script generation: {e}")
             return {"error": str(e)}
 
+    async def _stream_content(self, prompt: str, config: types.GenerateContentConfig, emitter: _SceneEmitter) -> str:
+        """
+        Streams the response, emitting scenes as they complete. Returns the full text.
+        """
+        parser = JsonArrayStreamParser("scenes")
+        parts = []
+        stream = await self.client.aio.models.generate_content_stream(
+            model=settings.GEMINI_MODEL,
+            config=config,
+            contents=prompt
+        )
+        async for chunk in stream:
+            if not chunk.text:
+                continue
+            parts.append(chunk.text)
+            for scene in parser.feed(chunk.text):
+                await emitter(scene)
+        return "".join(parts)
+
+    # -------------------------------------------------------------------------
+    # Cache helpers
+    # -------------------------------------------------------------------------
+
+    def _cache_key(self, prompt: str) -> str:
+        digest = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+        return f"script:{settings.GEMINI_MODEL}:{SCRIPT_PROMPT_VERSION}:{digest}"
+
+    async def _cache_get(self, key: str):
+        try:
+            cached = await redis_client.get(key)
+        except Exception as e:
+            print(f"  ⚠️  Script cache unavailable: {e}")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def _cache_set(self, key: str, script_data: dict):
+        try:
+            await redis_client.set(key, json.dumps(script_data), ex=settings.SCRIPT_CACHE_TTL)
+        except Exception as e:
+            print(f"  ⚠️  Script cache unavailable: {e}")
+
 
 script_service = ScriptService()
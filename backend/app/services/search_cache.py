@@ -0,0 +1,81 @@
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+
+class SearchCache:
+    """
+    Two-tier cache for stock search results: a small in-process LRU in front
+    of Redis. Keys are built from the endpoint kind, normalized query,
+    orientation and page size, so identical searches across scenes, tasks
+    and workers only hit the Pexels API once per TTL.
+    """
+
+    def __init__(self, local_max_entries: int, local_ttl: int, redis_ttl: int, prefix: str = "pexels:search"):
+        self.local_max_entries = local_max_entries
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.prefix = prefix
+        self._local: OrderedDict = OrderedDict()
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def _key(self, kind: str, query: str, orientation: str, per_page: int) -> str:
+        normalized = re.sub(r"\s+", " ", query.strip().lower())
+        return f"{self.prefix}:{kind}:{orientation}:{per_page}:{normalized}"
+
+    async def get(self, kind: str, query: str, orientation: str, per_page: int) -> Optional[list]:
+        key = self._key(kind, query, orientation, per_page)
+
+        entry = self._local.get(key)
+        if entry is not None:
+            expires_at, results = entry
+            if expires_at > time.monotonic():
+                self._local.move_to_end(key)
+                self.stats["local_hits"] += 1
+                return results
+            del self._local[key]
+
+        try:
+            cached = await redis_client.get(key)
+        except Exception as e:
+            print(f"  ⚠️  Search cache unavailable: {e}")
+            cached = None
+
+        if cached is not None:
+            results = json.loads(cached)
+            self._store_local(key, results)
+            self.stats["redis_hits"] += 1
+            return results
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, kind: str, query: str, orientation: str, per_page: int, results: list):
+        key = self._key(kind, query, orientation, per_page)
+        self._store_local(key, results)
+        try:
+            await redis_client.set(key, json.dumps(results), ex=self.redis_ttl)
+        except Exception as e:
+            print(f"  ⚠️  Search cache unavailable: {e}")
+
+    def _store_local(self, key: str, results: list):
+        self._local[key] = (time.monotonic() + self.local_ttl, results)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_max_entries:
+            self._local.popitem(last=False)
+
+    def hit_ratio(self) -> float:
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+search_cache = SearchCache(
+    local_max_entries=settings.SEARCH_CACHE_LOCAL_MAX_ENTRIES,
+    local_ttl=settings.SEARCH_CACHE_LOCAL_TTL,
+    redis_ttl=settings.SEARCH_CACHE_REDIS_TTL,
+)
@@ -1,40 +1,53 @@
+import asyncio
+import base64
+import math
 import os
-from supabase import create_client, Client
+import httpx
 from app.core.config import settings
+from app.core.http_client import get_http_client
+from app.core.redis_client import redis_client
 from pathlib import Path
+from typing import AsyncIterator, Optional
+
+TUS_VERSION = "1.0.0"
+# Supabase keeps unfinished resumable uploads for 24 hours
+TUS_UPLOAD_URL_TTL = 23 * 3600
+
 
 class StorageService:
+    """
+    Uploads finished media. Files are streamed from disk in chunks (reads run off
+    the event loop), so an upload never holds the whole file in memory.
+
+    Supabase: small files are sent in one streamed request; files over
+    UPLOAD_RESUMABLE_THRESHOLD use the TUS resumable endpoint, retrying failed
+    chunks from the server's offset and resuming across attempts.
+    STORAGE_BACKEND="local" copies into STORAGE_LOCAL_DIR instead, as a stand-in
+    for development and tests.
+    """
+
     def __init__(self):
-        self.url = settings.SUPABASE_URL
+        self.url = settings.SUPABASE_URL.rstrip("/") if settings.SUPABASE_URL else None
         self.key = settings.SUPABASE_ANON_PUBLIC_KEY
         self.bucket = settings.SUPABASE_BUCKET
-        self.client: Client = None
-        
-        if self.url and self.key:
-            self.client = create_client(self.url, self.key)
+        self.backend = settings.STORAGE_BACKEND
+        self.local_dir = Path(settings.STORAGE_LOCAL_DIR)
+        self.chunk_size = settings.UPLOAD_CHUNK_SIZE
+
+    @property
+    def configured(self) -> bool:
+        return self.backend == "local" or bool(self.url and self.key)
 
     async def upload_file(self, file_path: str, content_type: str = "video/mp4") -> str:
         """
-        Uploads a file to Supabase storage and returns the public URL.
+        Uploads a file to storage and returns the public URL.
         """
-        if not self.client:
+        if not self.configured:
             print(f"Supabase storage not configured. Using local path as URL: {file_path}")
             return file_path
 
-        p = Path(file_path)
-        file_name = p.name
-        
         try:
-            with open(file_path, 'rb') as f:
-                self.client.storage.from_(self.bucket).upload(
-                    path=file_name,
-                    file=f.read(),
-                    file_options={"content-type": content_type, "x-upsert": "true"}
-                )
-            
-            # Get the public URL
-            response = self.client.storage.from_(self.bucket).get_public_url(file_name)
-            return response
+            return await self._upload(file_path, Path(file_path).name, content_type)
         except Exception as e:
             print(f"Error uploading to Supabase: {e}")
             return file_path
@@ -45,4 +58,245 @@ class StorageService:
     async def upload_thumbnail(self, file_path: str) -> str:
         return await self.upload_file(file_path, "image/jpeg")
 
+    def progressive_upload(self, prefix: str, on_publish=None) -> Optional["ProgressiveUpload"]:
+        """
+        Starts an HLS upload under `prefix/`, or returns None when storage isn't configured.
+        """
+        if not self.configured:
+            return None
+        return ProgressiveUpload(self, prefix, on_publish)
+
+    async def _upload(self, file_path: str, object_name: str, content_type: str, cache_control: int = 3600) -> str:
+        """
+        Uploads to the configured backend and returns the public URL; raises on failure.
+        """
+        if self.backend == "local":
+            return await self._upload_local(file_path, object_name)
+
+        size = os.path.getsize(file_path)
+        if size > settings.UPLOAD_RESUMABLE_THRESHOLD:
+            await self._upload_resumable(file_path, object_name, content_type, size, cache_control)
+        else:
+            await self._upload_single(file_path, object_name, content_type, size, cache_control)
+        return f"{self.url}/storage/v1/object/public/{self.bucket}/{object_name}"
+
+    # -------------------------------------------------------------------------
+    # Supabase
+    # -------------------------------------------------------------------------
+
+    def _auth_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.key}", "apikey": self.key}
+
+    async def _upload_single(self, file_path: str, object_name: str, content_type: str, size: int, cache_control: int):
+        response = await get_http_client().post(
+            f"{self.url}/storage/v1/object/{self.bucket}/{object_name}",
+            content=_read_chunks(file_path, 0, size, self.chunk_size),
+            headers={
+                **self._auth_headers(),
+                "Content-Type": content_type,
+                "Content-Length": str(size),
+                "Cache-Control": f"max-age={cache_control}",
+                "x-upsert": "true",
+            },
+        )
+        response.raise_for_status()
+
+    async def _upload_resumable(self, file_path: str, object_name: str, content_type: str, size: int, cache_control: int):
+        """
+        TUS upload: PATCHes one chunk at a time from the server-confirmed offset.
+        The upload URL is kept in Redis, so a retried job continues where the last one stopped.
+        """
+        client = get_http_client()
+        tus_headers = {**self._auth_headers(), "Tus-Resumable": TUS_VERSION}
+        resume_key = f"upload:tus:{self.bucket}:{object_name}:{size}:{int(os.path.getmtime(file_path))}"
+
+        upload_url = await redis_client.get(resume_key)
+        offset = await self._tus_offset(upload_url, tus_headers) if upload_url else None
+        if offset is None:
+            upload_url = await self._tus_create(object_name, content_type, size, cache_control, tus_headers)
+            await redis_client.set(resume_key, upload_url, ex=TUS_UPLOAD_URL_TTL)
+            offset = 0
+        else:
+            print(f"  🔁 Resuming upload of {object_name} at {offset}/{size} bytes")
+
+        failures = 0
+        while offset < size:
+            length = min(self.chunk_size, size - offset)
+            try:
+                response = await client.patch(
+                    upload_url,
+                    content=_read_chunks(file_path, offset, length, length),
+                    headers={
+                        **tus_headers,
+                        "Upload-Offset": str(offset),
+                        "Content-Type": "application/offset+octet-stream",
+                        "Content-Length": str(length),
+                    },
+                )
+                response.raise_for_status()
+                offset = int(response.headers["Upload-Offset"])
+                failures = 0
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                failures += 1
+                if failures > settings.UPLOAD_RETRIES:
+                    raise
+                # The server may have stored part of the chunk; continue from what it has
+                server_offset = await self._tus_offset(upload_url, tus_headers)
+                if server_offset is None:
+                    raise
+                print(f"  🔁 Upload chunk failed ({e}), retrying {object_name} from {server_offset} bytes")
+                offset = server_offset
+                await asyncio.sleep(failures)
+
+        await redis_client.delete(resume_key)
+
+    async def _tus_create(self, object_name: str, content_type: str, size: int, cache_control: int, tus_headers: dict) -> str:
+        metadata = {
+            "bucketName": self.bucket,
+            "objectName": object_name,
+            "contentType": content_type,
+            "cacheControl": str(cache_control),
+        }
+        response = await get_http_client().post(
+            f"{self.url}/storage/v1/upload/resumable",
+            headers={
+                **tus_headers,
+                "Upload-Length": str(size),
+                "Upload-Metadata": ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in metadata.items()),
+                "x-upsert": "true",
+            },
+        )
+        response.raise_for_status()
+        return response.headers["Location"]
+
+    async def _tus_offset(self, upload_url: str, tus_headers: dict) -> Optional[int]:
+        """
+        Bytes the server has received for an upload, or None if it no longer exists.
+        """
+        try:
+            response = await get_http_client().head(upload_url, headers=tus_headers)
+        except httpx.TransportError:
+            return None
+        if response.status_code != 200 or "Upload-Offset" not in response.headers:
+            return None
+        return int(response.headers["Upload-Offset"])
+
+    # -------------------------------------------------------------------------
+    # Local stand-in
+    # -------------------------------------------------------------------------
+
+    async def _upload_local(self, file_path: str, object_name: str) -> str:
+        dest = self.local_dir / self.bucket / object_name
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        part = dest.with_name(dest.name + ".part")
+        size = os.path.getsize(file_path)
+
+        with open(part, "wb") as out:
+            async for chunk in _read_chunks(file_path, 0, size, self.chunk_size):
+                await asyncio.to_thread(out.write, chunk)
+        os.replace(part, dest)
+
+        if settings.STORAGE_LOCAL_BASE_URL:
+            return f"{settings.STORAGE_LOCAL_BASE_URL.rstrip('/')}/{self.bucket}/{object_name}"
+        return str(dest)
+
+
+class ProgressiveUpload:
+    """
+    Publishes a render as HLS while it is still encoding. Each segment is uploaded
+    as soon as the engine finishes it, and the playlist (an EVENT playlist, closed
+    with ENDLIST once every segment is up) is re-published whenever the run of
+    uploaded segments from the start grows, so playback can begin before the final mux.
+    A failed upload only stops the preview; the final MP4 upload is unaffected.
+    """
+
+    def __init__(self, storage: StorageService, prefix: str, on_publish=None):
+        self.storage = storage
+        self.prefix = prefix
+        self.on_publish = on_publish
+        self.playlist_url: Optional[str] = None
+        self.failed = False
+        self._uploaded: set = set()
+        self._published = 0
+        self._lock = asyncio.Lock()
+        self._playlist_path = Path(settings.OUTPUT_DIR) / f"{prefix}.m3u8"
+
+    async def add_segment(self, index: int, segment_path: str, durations: list[float]):
+        """
+        Engine `on_segment` callback: `durations` lists every segment of the render, in order.
+        """
+        if self.failed:
+            return
+        try:
+            await self.storage._upload(segment_path, f"{self.prefix}/{_segment_name(index)}", "video/mp2t")
+        except Exception as e:
+            self._fail(f"segment {index}: {e}")
+            return
+
+        async with self._lock:
+            self._uploaded.add(index)
+            ready = self._published
+            while ready in self._uploaded:
+                ready += 1
+            if ready == self._published or self.failed:
+                return
+            try:
+                await self._publish_playlist(durations, ready)
+            except Exception as e:
+                self._fail(f"playlist: {e}")
+                return
+            # Segments finish out of order, so the first publish may already cover several
+            first_publish = self._published == 0
+            self._published = ready
+
+        if self.on_publish and first_publish:
+            await self.on_publish(self.playlist_url)
+
+    async def _publish_playlist(self, durations: list[float], count: int):
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(durations))}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for index in range(count):
+            lines += [f"#EXTINF:{durations[index]:.3f},", _segment_name(index)]
+        if count == len(durations):
+            lines.append("#EXT-X-ENDLIST")
+
+        self._playlist_path.write_text("\n".join(lines) + "\n")
+        try:
+            # Players re-fetch the playlist while it grows, so it must not be cached
+            self.playlist_url = await self.storage._upload(
+                str(self._playlist_path), f"{self.prefix}/index.m3u8", "application/vnd.apple.mpegurl", cache_control=0
+            )
+        finally:
+            self._playlist_path.unlink(missing_ok=True)
+
+    def _fail(self, reason: str):
+        if not self.failed:
+            print(f"⚠️  Progressive upload stopped ({reason}); the final video upload is unaffected")
+        self.failed = True
+
+
+def _segment_name(index: int) -> str:
+    return f"seg_{index:03d}.ts"
+
+
+async def _read_chunks(file_path: str, offset: int, length: int, chunk_size: int) -> AsyncIterator[bytes]:
+    """
+    Yields `length` bytes of a file starting at `offset`, reading off the event loop.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 storage_service = StorageService()
@@ -0,0 +1,114 @@
+import json
+from typing import Dict, Iterable, List, Optional
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+FINISHED_STATUSES = ("completed", "failed")
+
+# Applies an update only while the stored status is ARGV[1] (or there is no state at all).
+# KEYS: state hash. ARGV: expected status (JSON), TTL, field count, fields..., fields to clear...
+_TRANSITION_SCRIPT = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status and status ~= ARGV[1] then
+    return 0
+end
+local count = tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], unpack(ARGV, 4, 3 + count))
+if #ARGV > 3 + count then
+    redis.call('HDEL', KEYS[1], unpack(ARGV, 4 + count, #ARGV))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# Sets one field of an existing state; a missing (expired or deleted) state is left missing.
+# KEYS: state hash. ARGV: field, value
+_SET_FIELD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+
+class TaskStateStore:
+    """
+    Task state in a Redis hash per task (`task:{id}`), one JSON-encoded value
+    per field, so progress updates only write the fields that changed.
+    Active tasks expire after `ttl`; finished ones are kept for `finished_ttl`
+    so their results stay available to status polling.
+    """
+
+    def __init__(self, ttl: int, finished_ttl: int, prefix: str = "task"):
+        self.ttl = ttl
+        self.finished_ttl = finished_ttl
+        self.prefix = prefix
+
+    def key(self, task_id: str) -> str:
+        return f"{self.prefix}:{task_id}"
+
+    def update(self, pipe, task_id: str, fields: Dict, clear: Iterable[str] = ()):
+        """
+        Queues a partial update on a Redis pipeline (so callers can batch it with other writes).
+        """
+        key = self.key(task_id)
+        pipe.hset(key, mapping=self.encode(fields))
+        clear = list(clear)
+        if clear:
+            pipe.hdel(key, *clear)
+        pipe.expire(key, self.ttl_for(fields.get("status")))
+
+    def ttl_for(self, status: Optional[str]) -> int:
+        return self.finished_ttl if status in FINISHED_STATUSES else self.ttl
+
+    @staticmethod
+    def encode(fields: Dict) -> Dict[str, str]:
+        return {name: json.dumps(value) for name, value in fields.items()}
+
+    async def save(self, task_id: str, fields: Dict, clear: Iterable[str] = ()):
+        async with redis_client.pipeline(transaction=True) as pipe:
+            self.update(pipe, task_id, fields, clear)
+            await pipe.execute()
+
+    async def transition(self, task_id: str, expected_status: str, fields: Dict, clear: Iterable[str] = ()) -> bool:
+        """
+        Atomically applies an update if the task is still in `expected_status` (or has no
+        state); returns False if another caller changed the status first.
+        """
+        encoded = [item for pair in self.encode(fields).items() for item in pair]
+        return bool(await redis_client.eval(
+            _TRANSITION_SCRIPT, 1, self.key(task_id),
+            json.dumps(expected_status), self.ttl_for(fields.get("status")), len(encoded), *encoded, *clear,
+        ))
+
+    async def set_field(self, task_id: str, name: str, value) -> bool:
+        """
+        Updates a single field of an existing state, keeping its TTL.
+        """
+        return bool(await redis_client.eval(_SET_FIELD_SCRIPT, 1, self.key(task_id), name, json.dumps(value)))
+
+    async def delete(self, task_id: str):
+        await redis_client.delete(self.key(task_id))
+
+    async def get(self, task_id: str) -> Optional[Dict]:
+        return self._decode(await redis_client.hgetall(self.key(task_id)))
+
+    async def get_many(self, task_ids: List[str]) -> List[Optional[Dict]]:
+        """
+        Reads many task states in one round trip.
+        """
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                pipe.hgetall(self.key(task_id))
+            raw_states = await pipe.execute()
+        return [self._decode(raw) for raw in raw_states]
+
+    @staticmethod
+    def _decode(raw: Dict) -> Optional[Dict]:
+        if not raw:
+            return None
+        return {name: json.loads(value) for name, value in raw.items()}
+
+
+task_state = TaskStateStore(ttl=settings.TASK_STATE_TTL, finished_ttl=settings.TASK_STATE_FINISHED_TTL)
@@ -1,154 +1,311 @@
+import asyncio
+import os
 import httpx
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 from pathlib import Path
 from app.core.config import settings
+from app.core.http_client import get_http_client
+from app.services.search_cache import search_cache
+from app.services.media_cache import media_cache
+from app.utils.concurrency import HostLimiter
+from app.utils.downloads import DownloadError, stream_download
+
+
+class _FetchContext:
+    """
+    Shared state for one concurrent fetch across all scenes: the HTTP client,
+    request limits, the task leasing cached media, claimed video IDs and
+    in-flight downloads.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, limiter: HostLimiter, task_id: Optional[str] = None, orientation: str = "landscape"):
+        self.client = client
+        self.limiter = limiter
+        self.task_id = task_id
+        self.orientation = orientation
+        self.owner = task_id or f"pid-{os.getpid()}"
+        self.claimed_ids: Set[int] = set()
+        self.downloads: Dict[int, asyncio.Task] = {}
+        # Scene index -> (visual_keywords, task) for scenes fetched while the script was streaming
+        self.prefetched: Dict[int, Tuple[List[str], asyncio.Task]] = {}
+        self.closed = False
+
+    def close(self):
+        """
+        Cancels prefetches nobody is waiting for (e.g. the job failed) and ignores later ones.
+        """
+        self.closed = True
+        for _, task in self.prefetched.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark retrieved so failures aren't logged as unhandled
+
 
 class VisualService:
     def __init__(self):
         self.api_key = settings.PEXELS_API_KEY
         self.base_url = "https://api.pexels.com/v1"
         self.video_base_url = "https://api.pexels.com/videos"
-        self.output_path = Path(settings.OUTPUT_DIR) / "visuals"
-        self.output_path.mkdir(parents=True, exist_ok=True)
 
 
     # -------------------------------------------------------------------------
     # Scene-level orchestration
     # -------------------------------------------------------------------------
 
-    async def fetch_video_clips_for_scenes(self, scenes: List[Dict], log_callback=None) -> List[Dict]:
+    async def fetch_video_clips_for_scenes(self, scenes: List[Dict], log_callback=None, task_id: Optional[str] = None, orientation: str = "landscape", ctx: Optional["_FetchContext"] = None) -> List[Dict]:
         """
         Downloads a pool of best-match video clips per scene using all keywords.
+        All scenes are fetched concurrently, bounded by PEXELS_MAX_CONCURRENCY overall
+        and PEXELS_MAX_CONNECTIONS_PER_HOST per host.
+        Clips are served from / added to the shared media cache and leased to `task_id`.
         Attaches a list of local paths to each scene under 'video_paths'.
+
+        Passing the `ctx` used by `prefetch_scene` reuses clips already fetched for
+        scenes whose keywords are unchanged.
         """
-        for i, scene in enumerate(scenes):
-            keywords = scene.get("visual_keywords", [])
-            msg = f"🎬 Scene {i+1}/{len(scenes)}: searching video clips..."
-            if log_callback:
-                await log_callback(msg)
-            print(msg)
-            clips = await self._fetch_pool_of_videos(keywords, log_callback=log_callback)
-            scene["video_paths"] = clips
-            if not clips:
-                print(f"  ⚠️  Scene {i+1}: no video clips found.")
-            else:
-                print(f"  ✅ Scene {i+1}: found {len(clips)} clip(s).")
+        ctx = ctx or self.new_fetch_context(task_id, orientation)
+
+        async def fetch_scene(i: int, scene: Dict):
+            prefetched = ctx.prefetched.get(i)
+            if prefetched and prefetched[0] == scene.get("visual_keywords", []):
+                scene["video_paths"] = (await prefetched[1])["video_paths"]
+                return
+            await self.fetch_clips_for_scene(i, scene, ctx, total=len(scenes), log_callback=log_callback)
+
+        await asyncio.gather(*(fetch_scene(i, scene) for i, scene in enumerate(scenes)))
+        print(f"🔎 Search cache: {search_cache.stats} (hit ratio {search_cache.hit_ratio():.0%})")
         return scenes
 
+    def new_fetch_context(self, task_id: Optional[str] = None, orientation: str = "landscape") -> "_FetchContext":
+        """
+        Shared limits and claimed clips for one job. Scenes fetched through the same
+        context never reuse each other's clips, even when fetched at different times.
+        """
+        limiter = HostLimiter(settings.PEXELS_MAX_CONCURRENCY, settings.PEXELS_MAX_CONNECTIONS_PER_HOST)
+        return _FetchContext(get_http_client(), limiter, task_id, orientation)
+
+    def prefetch_scene(self, index: int, scene: Dict, ctx: "_FetchContext", log_callback=None):
+        """
+        Starts fetching clips for one scene in the background; `fetch_video_clips_for_scenes`
+        with the same context picks up the result.
+        """
+        if ctx.closed or index in ctx.prefetched:
+            return
+        task = asyncio.create_task(self.fetch_clips_for_scene(index, scene, ctx, log_callback=log_callback))
+        ctx.prefetched[index] = (scene.get("visual_keywords", []), task)
+
+    async def fetch_clips_for_scene(self, index: int, scene: Dict, ctx: "_FetchContext", total: Optional[int] = None, log_callback=None) -> Dict:
+        """
+        Fetches the clip pool for a single scene (e.g. as soon as it is streamed from
+        the script) and attaches it under 'video_paths'.
+        """
+        label = f"{index+1}/{total}" if total else f"{index+1}"
+        keywords = scene.get("visual_keywords", [])
+        msg = f"🎬 Scene {label}: searching video clips..."
+        if log_callback:
+            await log_callback(msg)
+        print(msg)
+        clips = await self._fetch_pool_of_videos(keywords, ctx, log_callback=log_callback)
+        scene["video_paths"] = clips
+        if not clips:
+            print(f"  ⚠️  Scene {index+1}: no video clips found.")
+        else:
+            print(f"  ✅ Scene {index+1}: found {len(clips)} clip(s).")
+        return scene
+
     # -------------------------------------------------------------------------
-    # Fallback search — tries keywords one by one, stops at first good result
+    # Keyword pool — searches keywords in concurrent waves until enough clips
     # -------------------------------------------------------------------------
 
-
-    async def _fetch_pool_of_videos(self, keywords: List[str], max_clips: int = 3, log_callback=None) -> List[str]:
+    async def _fetch_pool_of_videos(self, keywords: List[str], ctx: "_FetchContext", max_clips: int = 3, log_callback=None) -> List[str]:
         """
         Searches across all keywords to build a variety of clips for a scene.
+        Each wave searches just enough keywords (in order) to fill the remaining slots,
+        so fallback keywords are only queried when earlier ones come up empty.
         Returns a list of local paths.
         """
-        headers = {"Authorization": self.api_key}
         clips_found = []
-        downloaded_ids = set()
+        scene_ids = set()
+        remaining = list(keywords)
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            for keyword in keywords:
-                if len(clips_found) >= max_clips:
-                    break
-                
-                try:
-                    response = await client.get(
-                        f"{self.video_base_url}/search",
-                        headers=headers,
-                        params={"query": keyword, "per_page": 5, "orientation": "landscape"}
-                    )
-                    response.raise_for_status()
-                    videos = response.json().get("videos", [])
-
-                    if not videos:
-                        continue
-
-                    # Find the first video in results that we haven't already picked for this scene
-                    for video in videos:
-                        video_id = video["id"]
-                        if video_id in downloaded_ids:
-                            continue
-                        
-                        video_file = self._pick_best_video_file(video.get("video_files", []))
-                        if not video_file:
-                            continue
-
-                        local_path = self._build_local_path(video_id, ".mp4")
-                        downloaded_ids.add(video_id)
-
-                        if local_path.exists():
-                            msg = f"  ✅ Cache hit: '{keyword}'"
-                            if log_callback:
-                                await log_callback(msg)
-                            print(msg)
-                            clips_found.append(str(local_path))
-                            break # Move to next keyword
-
-                        msg = f"  ⬇️ Downloading clip: '{keyword}'"
-                        if log_callback:
-                                await log_callback(msg)
-                        print(msg)
-                        vid_response = await client.get(video_file["link"])
-                        vid_response.raise_for_status()
-                        local_path.write_bytes(vid_response.content)
-                        clips_found.append(str(local_path))
-                        break # Successfully got one from this keyword, move to next
-
-                except Exception as e:
-                    print(f"  ❌ Error for keyword '{keyword}': {e}")
+        while remaining and len(clips_found) < max_clips:
+            batch = remaining[:max_clips - len(clips_found)]
+            remaining = remaining[len(batch):]
+
+            batch_results = await asyncio.gather(*(self._search_videos(keyword, ctx) for keyword in batch))
+
+            picks = []
+            for keyword, videos in zip(batch, batch_results):
+                choice = self._pick_unclaimed_video(videos, scene_ids, ctx.claimed_ids)
+                if not choice:
+                    continue
+                video_id, video_file = choice
+                scene_ids.add(video_id)
+                ctx.claimed_ids.add(video_id)
+                picks.append((keyword, video_id, video_file))
+
+            paths = await asyncio.gather(*(
+                self._download_clip(keyword, video_id, video_file, ctx, log_callback)
+                for keyword, video_id, video_file in picks
+            ))
+            clips_found.extend(path for path in paths if path)
 
         return clips_found
 
-    async def fetch_thumbnail_image(self, keywords: List[str], log_callback=None) -> Optional[str]:
+    async def _search_videos(self, keyword: str, ctx: "_FetchContext") -> List[Dict]:
+        url = f"{self.video_base_url}/search"
+        try:
+            cached = await search_cache.get("videos", keyword, ctx.orientation, 5)
+            if cached is not None:
+                return cached
+
+            async with ctx.limiter.limit(url):
+                response = await ctx.client.get(
+                    url,
+                    headers={"Authorization": self.api_key},
+                    params={"query": keyword, "per_page": 5, "orientation": ctx.orientation}
+                )
+            response.raise_for_status()
+            videos = response.json().get("videos", [])
+            await search_cache.set("videos", keyword, ctx.orientation, 5, videos)
+            return videos
+        except Exception as e:
+            print(f"  ❌ Error for keyword '{keyword}': {e}")
+            return []
+
+    def _pick_unclaimed_video(self, videos: List[Dict], scene_ids: set, claimed_ids: set) -> Optional[tuple]:
+        """
+        Picks the first usable video not yet used by this scene, preferring
+        ones no other scene has claimed. Returns (video_id, video_file) or None.
+        """
+        fallback = None
+        for video in videos:
+            video_id = video["id"]
+            if video_id in scene_ids:
+                continue
+
+            video_file = self._pick_best_video_file(video.get("video_files", []))
+            if not video_file:
+                continue
+
+            if video_id not in claimed_ids:
+                return video_id, video_file
+            if fallback is None:
+                fallback = (video_id, video_file)
+
+        # Every result is already used by another scene — share its download
+        return fallback
+
+    async def _download_clip(self, keyword: str, video_id: int, video_file: Dict, ctx: "_FetchContext", log_callback=None) -> Optional[str]:
+        """
+        Downloads a clip once per fetch; scenes that pick the same video share the download.
+        """
+        key = f"{video_id}.mp4"
+
+        task = ctx.downloads.get(video_id)
+        if task is None:
+            # Registered before any await, so a concurrent scene picking the same video joins this task
+            task = asyncio.create_task(self._cached_or_download(keyword, key, video_file["link"], ctx, log_callback))
+            ctx.downloads[video_id] = task
+
+        try:
+            return str(await task)
+        except Exception as e:
+            print(f"  ❌ Error downloading clip for '{keyword}': {e}")
+            return None
+
+    async def _cached_or_download(self, keyword: str, key: str, url: str, ctx: "_FetchContext", log_callback=None) -> Path:
+        cached = await media_cache.lookup(key, ctx.task_id)
+        if cached:
+            msg = f"  ✅ Cache hit: '{keyword}'"
+            if log_callback:
+                await log_callback(msg)
+            print(msg)
+            return cached
+
+        msg = f"  ⬇️ Downloading clip: '{keyword}'"
+        if log_callback:
+            await log_callback(msg)
+        print(msg)
+        return await self._download_media(key, url, ctx)
+
+    async def _download_media(self, key: str, url: str, ctx: "_FetchContext") -> Path:
+        """
+        Downloads `url` into the media cache under `key`. If another task on this
+        host is already downloading the same file, waits for it instead.
+        """
+        if not await media_cache.claim_download(key, ctx.owner):
+            cached = await media_cache.lookup(key, ctx.task_id)
+            if cached:
+                return cached
+            raise DownloadError(f"Concurrent download of {key} did not complete")
+
+        try:
+            async with ctx.limiter.limit(url):
+                await stream_download(
+                    ctx.client,
+                    url,
+                    media_cache.path_for(key),
+                    max_bytes=settings.DOWNLOAD_MAX_BYTES,
+                    chunk_size=settings.DOWNLOAD_CHUNK_SIZE
+                )
+        except BaseException:
+            await media_cache.abandon_download(key, ctx.owner)
+            raise
+
+        return await media_cache.register(key, ctx.task_id)
+
+    async def fetch_thumbnail_image(self, keywords: List[str], log_callback=None, task_id: Optional[str] = None, orientation: str = "landscape") -> Optional[str]:
         """
         Searches for a high-quality image to use as a thumbnail based on keywords.
         Returns the local path to the downloaded image.
         """
         headers = {"Authorization": self.api_key}
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            for keyword in keywords:
-                try:
-                    msg = f"🖼️ Searching thumbnail: '{keyword}'"
-                    if log_callback:
-                        await log_callback(msg)
-                    print(msg)
+        client = get_http_client()
+        ctx = _FetchContext(client, HostLimiter(settings.PEXELS_MAX_CONCURRENCY, settings.PEXELS_MAX_CONNECTIONS_PER_HOST), task_id)
+        for keyword in keywords:
+            try:
+                msg = f"🖼️ Searching thumbnail: '{keyword}'"
+                if log_callback:
+                    await log_callback(msg)
+                print(msg)
+                photos = await search_cache.get("photos", keyword, orientation, 5)
+                if photos is None:
                     response = await client.get(
                         f"{self.base_url}/search",
                         headers=headers,
-                        params={"query": keyword, "per_page": 5, "orientation": "landscape"}
+                        params={"query": keyword, "per_page": 5, "orientation": orientation},
+                        timeout=30.0
                     )
                     response.raise_for_status()
                     photos = response.json().get("photos", [])
+                    await search_cache.set("photos", keyword, orientation, 5, photos)
+
+                if not photos:
+                    continue
+
+                # Pick the first photo
+                photo = photos[0]
+                photo_id = photo["id"]
+                # Use the 'large' or 'original' size
+                image_url = photo.get("src", {}).get("large") or photo.get("src", {}).get("original")
+                
+                if not image_url:
+                    continue
 
-                    if not photos:
-                        continue
-
-                    # Pick the first photo
-                    photo = photos[0]
-                    photo_id = photo["id"]
-                    # Use the 'large' or 'original' size
-                    image_url = photo.get("src", {}).get("large") or photo.get("src", {}).get("original")
-                    
-                    if not image_url:
-                        continue
-
-                    local_path = self._build_local_path(photo_id, ".jpg")
-                    if local_path.exists():
-                        return str(local_path)
-
-                    if log_callback:
-                        await log_callback("  ⬇️ Downloading thumbnail...")
-                    print(f"  ⬇️  Downloading thumbnail image...")
-                    img_response = await client.get(image_url)
-                    img_response.raise_for_status()
-                    local_path.write_bytes(img_response.content)
-                    return str(local_path)
-
-                except Exception as e:
-                    print(f"  ❌ Error fetching thumbnail for '{keyword}': {e}")
+                key = f"{photo_id}.jpg"
+                cached = await media_cache.lookup(key, task_id)
+                if cached:
+                    return str(cached)
+
+                if log_callback:
+                    await log_callback("  ⬇️ Downloading thumbnail...")
+                print(f"  ⬇️  Downloading thumbnail image...")
+                return str(await self._download_media(key, image_url, ctx))
+
+            except Exception as e:
+                print(f"  ❌ Error fetching thumbnail for '{keyword}': {e}")
         
         return None
 
@@ -156,9 +313,6 @@ class VisualService:
     # Helpers
     # -------------------------------------------------------------------------
 
-    def _build_local_path(self, media_id: int, ext: str) -> Path:
-        return self.output_path / f"{media_id}{ext}"
-
     def _pick_best_video_file(self, video_files: list) -> Optional[dict]:
         """
         From a list of Pexels video file objects, prefer the HD version (720p/1080p).
@@ -166,27 +320,8 @@ class VisualService:
         """
         if not video_files:
             return None
-        # Prefer HD (height >= 720), then take whatever is available
-        hd_files = [f for f in video_files if f.get("height", 0) >= 720]
+        # Prefer HD (short side >= 720, so portrait clips qualify too), then take whatever is available
+        hd_files = [f for f in video_files if min(f.get("width") or 0, f.get("height") or 0) >= 720]
         return hd_files[0] if hd_files else video_files[0]
 
-    async def cleanup_unused_visuals(self, used_paths: List[str]):
-        """
-        Removes visual files that are not in the used_paths list for the current task.
-        """
-        print(f"🧹 Cleaning up unused visuals (keeping {len(used_paths)} files)...")
-        used_set = {Path(p).resolve() for p in used_paths}
-        
-        count = 0
-        for file in self.output_path.glob("*"):
-            if file.is_file() and file.suffix in [".jpg", ".mp4"]:
-                if file.resolve() not in used_set:
-                    try:
-                        file.unlink()
-                        count += 1
-                    except Exception as e:
-                        print(f"  ❌ Failed to delete {file.name}: {e}")
-        
-        print(f"✨ Cleanup complete. Removed {count} unused files.")
-
 visual_service = VisualService()
\ No newline at end of file
@@ -1,17 +1,37 @@
 import edge_tts
 import asyncio
+import base64
+import hashlib
 import os
 import re
+import uuid
 from pathlib import Path
-from elevenlabs.client import ElevenLabs
+from typing import Optional
+from elevenlabs.client import AsyncElevenLabs
 from app.core.config import settings
+from app.services.media_cache import MediaCache
+from app.utils.alignment import scene_timings_from_words, words_from_characters
+from app.utils.ffmpeg import probe_duration, run_ffmpeg
+
+ELEVENLABS_VOICE_ID = "JBFqnCBsd6RMkjVDRZzb" # Adam
+ELEVENLABS_MODEL_ID = "eleven_multilingual_v2"
+ELEVENLABS_OUTPUT_FORMAT = "mp3_44100_128"
+# 'en-US-ChristopherNeural' is a good high-quality male voice
+EDGE_VOICE = "en-US-ChristopherNeural"
 
 class VoiceService:
     def __init__(self):
         self.api_key = settings.ELEVENLABS_API_KEY
-        self.client = ElevenLabs(api_key=self.api_key) if self.api_key else None
+        # Native async client: synthesis never blocks the event loop and is cancelled with its task
+        self.client = AsyncElevenLabs(api_key=self.api_key, timeout=settings.TTS_TIMEOUT) if self.api_key else None
         self.output_dir = Path(settings.OUTPUT_DIR) / "audio"
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.fragment_cache = MediaCache(
+            root=self.output_dir / "fragments",
+            max_bytes=settings.TTS_FRAGMENT_CACHE_MAX_BYTES,
+            lease_ttl=settings.MEDIA_CACHE_LEASE_TTL,
+            download_wait_timeout=settings.MEDIA_CACHE_DOWNLOAD_WAIT_TIMEOUT,
+        )
 
     async def generate_voiceover(self, script: str | dict, output_filename: str = "voiceover.mp3") -> str:
         """
@@ -19,34 +39,43 @@ class VoiceService:
         If script is a dict, extracts the 'narration' field.
         Tries ElevenLabs first, falls back to Edge TTS.
         """
+        audio_path, _ = await self.generate_voiceover_with_timings(script, output_filename)
+        return audio_path
+
+    async def generate_voiceover_with_timings(self, script: str | dict, output_filename: str = "voiceover.mp3") -> tuple[str, Optional[list]]:
+        """
+        Same as generate_voiceover, but also returns per-scene timings:
+        [{"start": s, "end": e}, ...], one per scene in the script (None if the
+        script has no scenes or no alignment is available).
+
+        With TTS_PER_SCENE, each scene's 'narration_part' is synthesized concurrently
+        (fragments are cached, so unchanged scenes are never re-voiced) and the timings
+        are the exact fragment boundaries. Otherwise the whole narration is voiced in
+        one request and timings come from the provider's word alignment.
+        """
+        scenes = []
         if isinstance(script, dict):
+            scenes = script.get("scenes", [])
             script = script.get("narration", "")
 
-        if not script:
-            return "Error: No narration text provided."
-
         output_path = self.output_dir / output_filename
 
+        if settings.TTS_PER_SCENE and any(s.get("narration_part", "").strip() for s in scenes):
+            try:
+                return await self._generate_per_scene(scenes, output_path)
+            except Exception as e:
+                print(f"Per-scene synthesis failed, voicing full narration instead: {e}")
+
+        if not script:
+            return "Error: No narration text provided.", None
+
         # 1. Try ElevenLabs if API key is present
         if self.client:
             try:
                 print(f"Attempting ElevenLabs generation for: {output_filename}")
-                # Use correct model_id and voice_id
-                # model_id is required in the latest SDK for .convert()
-                audio = self.client.text_to_speech.convert(
-                    text=script,
-                    voice_id="JBFqnCBsd6RMkjVDRZzb", # Adam
-                    model_id="eleven_multilingual_v2",
-                    output_format="mp3_44100_128"
-                )
-                
-                with open(output_path, "wb") as f:
-                    for chunk in audio:
-                        if chunk:
-                            f.write(chunk)
-                
+                words = await self._synthesize_elevenlabs(script, output_path)
                 print(f"ElevenLabs voiceover generated: {output_path}")
-                return str(output_path)
+                return str(output_path), scene_timings_from_words(scenes, words)
             except Exception as e:
                 print(f"ElevenLabs failed or blocked: {e}")
                 print("Falling back to Edge TTS...")
@@ -54,15 +83,186 @@ class VoiceService:
         # 2. Fallback to Edge TTS (Free, no API key required)
         try:
             print(f"Attempting Edge TTS generation for: {output_filename}")
-            # 'en-US-ChristopherNeural' is a good high-quality male voice
-            communicate = edge_tts.Communicate(script, "en-US-ChristopherNeural")
-            await communicate.save(output_path)
-            
+            words = await self._synthesize_edge(script, output_path)
             print(f"Edge TTS voiceover generated: {output_path}")
-            return str(output_path)
+            return str(output_path), scene_timings_from_words(scenes, words)
         except Exception as e:
             error_msg = f"Both ElevenLabs and Edge TTS failed: {e}"
             print(error_msg)
-            return f"Error: {error_msg}"
+            return f"Error: {error_msg}", None
+
+    # -------------------------------------------------------------------------
+    # Per-scene synthesis
+    # -------------------------------------------------------------------------
+
+    async def _generate_per_scene(self, scenes: list[dict], output_path: Path) -> tuple[str, list]:
+        """
+        Voices every scene with one provider (ElevenLabs, else Edge TTS, so the voice
+        never changes mid-video), then joins the fragments by stream copy.
+        """
+        providers = (["elevenlabs"] if self.client else []) + ["edge"]
+        last_error = None
+        # Fragments are leased to this call until they are joined, so eviction can't remove them
+        lease_id = f"voice:{uuid.uuid4().hex}"
+
+        try:
+            for provider in providers:
+                try:
+                    fragments = await self._synthesize_fragments(scenes, provider, lease_id)
+                    break
+                except Exception as e:
+                    last_error = e
+                    print(f"{provider} per-scene synthesis failed: {e}")
+            else:
+                raise RuntimeError(f"All providers failed: {last_error}")
+
+            return await self._join_fragments(fragments, output_path, provider)
+        finally:
+            await self.fragment_cache.release(lease_id)
+
+    async def _join_fragments(self, fragments: list, output_path: Path, provider: str) -> tuple[str, list]:
+        # Join fragments losslessly; scene boundaries are the cumulative fragment durations
+        timings = []
+        elapsed = 0.0
+        concat_lines = []
+        for fragment in fragments:
+            if fragment is None:
+                timings.append({"start": round(elapsed, 3), "end": round(elapsed, 3)})
+                continue
+            path, duration = fragment
+            timings.append({"start": round(elapsed, 3), "end": round(elapsed + duration, 3)})
+            elapsed += duration
+            concat_lines.append(f"file '{Path(path).resolve().as_posix()}'\n")
+
+        concat_list = output_path.with_name(output_path.name + ".concat.txt")
+        concat_list.write_text("".join(concat_lines))
+        try:
+            await run_ffmpeg(["-f", "concat", "-safe", "0", "-i", str(concat_list), "-c", "copy", str(output_path)])
+        finally:
+            concat_list.unlink(missing_ok=True)
+
+        timings[0]["start"] = 0.0
+        timings[-1]["end"] = None
+        print(f"Per-scene voiceover generated ({provider}, {len(concat_lines)} fragments): {output_path}")
+        return str(output_path), timings
+
+    async def _synthesize_fragments(self, scenes: list[dict], provider: str, lease_id: str) -> list:
+        """
+        Returns (path, duration) per scene (None for scenes without narration),
+        synthesizing at most TTS_MAX_CONCURRENCY fragments at once. Identical
+        fragments wanted by other scenes or jobs are synthesized only once.
+        """
+        semaphore = asyncio.Semaphore(settings.TTS_MAX_CONCURRENCY)
+        texts = [s.get("narration_part", "").strip() for s in scenes]
+
+        async def synthesize(i: int):
+            text = texts[i]
+            if not text:
+                return None
+
+            # Neighbouring text keeps ElevenLabs intonation continuous across fragment boundaries
+            context = {}
+            if provider == "elevenlabs":
+                context = {
+                    "previous_text": texts[i - 1] if i > 0 else None,
+                    "next_text": texts[i + 1] if i + 1 < len(texts) else None,
+                }
+
+            key = self._fragment_key(text, provider, **context)
+            cached = await self.fragment_cache.lookup(key, lease_id)
+            if cached:
+                return str(cached), await probe_duration(str(cached))
+
+            owner = f"{lease_id}:{i}"
+            if not await self.fragment_cache.claim_download(key, owner):
+                # Another scene or job synthesized the same fragment meanwhile
+                cached = await self.fragment_cache.lookup(key, lease_id)
+                if cached:
+                    return str(cached), await probe_duration(str(cached))
+                raise RuntimeError(f"Concurrent synthesis of {key} did not complete")
+
+            path = self.fragment_cache.path_for(key)
+            part = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.part")
+            try:
+                async with semaphore:
+                    if provider == "elevenlabs":
+                        await self._synthesize_elevenlabs(text, part, **context)
+                    else:
+                        await self._synthesize_edge(text, part)
+                os.replace(part, path)
+            except BaseException:
+                await self.fragment_cache.abandon_download(key, owner)
+                raise
+            finally:
+                part.unlink(missing_ok=True)
+
+            await self.fragment_cache.register(key, lease_id)
+            return str(path), await probe_duration(str(path))
+
+        return await asyncio.gather(*(synthesize(i) for i in range(len(scenes))))
+
+    def _fragment_key(self, text: str, provider: str, previous_text: str = None, next_text: str = None) -> str:
+        if provider == "elevenlabs":
+            voice = f"{ELEVENLABS_VOICE_ID}|{ELEVENLABS_MODEL_ID}|{ELEVENLABS_OUTPUT_FORMAT}"
+        else:
+            voice = f"{EDGE_VOICE}|edge-tts"
+        # The context changes the synthesized audio, so it is part of the key
+        digest = hashlib.sha256(f"{provider}|{voice}|{previous_text or ''}|{next_text or ''}|{text}".encode("utf-8")).hexdigest()
+        return f"{provider}_{digest[:40]}.mp3"
+
+    # -------------------------------------------------------------------------
+    # Providers
+    # -------------------------------------------------------------------------
+
+    async def _synthesize_elevenlabs(self, text: str, output_path: Path, previous_text: str = None, next_text: str = None) -> list:
+        """
+        Writes ElevenLabs audio to output_path and returns (word, start_seconds) pairs.
+        """
+        context = {}
+        if previous_text:
+            context["previous_text"] = previous_text
+        if next_text:
+            context["next_text"] = next_text
+
+        # model_id is required in the latest SDK for .convert_with_timestamps()
+        response = await asyncio.wait_for(
+            self.client.text_to_speech.convert_with_timestamps(
+                text=text,
+                voice_id=ELEVENLABS_VOICE_ID,
+                model_id=ELEVENLABS_MODEL_ID,
+                output_format=ELEVENLABS_OUTPUT_FORMAT,
+                **context
+            ),
+            timeout=settings.TTS_TIMEOUT
+        )
+
+        with open(output_path, "wb") as f:
+            f.write(base64.b64decode(response.audio_base_64))
+
+        if not response.alignment:
+            return []
+        return words_from_characters(
+            response.alignment.characters,
+            response.alignment.character_start_times_seconds
+        )
+
+    async def _synthesize_edge(self, text: str, output_path: Path) -> list:
+        """
+        Streams Edge TTS audio to output_path and returns (word, start_seconds) pairs.
+        """
+        communicate = edge_tts.Communicate(text, EDGE_VOICE, boundary="WordBoundary")
+        words = []
+
+        async def stream():
+            with open(output_path, "wb") as f:
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        f.write(chunk["data"])
+                    elif chunk["type"] == "WordBoundary":
+                        # Offsets are in 100-nanosecond ticks
+                        words.append((chunk["text"], chunk["offset"] / 10_000_000))
+
+        await asyncio.wait_for(stream(), timeout=settings.TTS_TIMEOUT)
+        return words
 
 voice_service = VoiceService()
@@ -0,0 +1,66 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def count_words(text: str) -> int:
+    return len(_WORD_RE.findall(text or ""))
+
+
+def words_from_characters(characters: Sequence[str], start_times: Sequence[float]) -> List[Tuple[str, float]]:
+    """
+    Groups character-level alignment (e.g. ElevenLabs) into (word, start_seconds) pairs.
+    """
+    words = []
+    current = ""
+    current_start = None
+    for char, start in zip(characters, start_times):
+        if char.isspace():
+            if current:
+                words.append((current, current_start))
+            current, current_start = "", None
+            continue
+        if not current:
+            current_start = start
+        current += char
+    if current:
+        words.append((current, current_start))
+    return [(w, t) for w, t in words if _WORD_RE.search(w)]
+
+
+def scene_timings_from_words(scenes: List[Dict], words: List[Tuple[str, float]]) -> Optional[List[Dict]]:
+    """
+    Maps spoken word timestamps onto scenes by walking each scene's word count
+    through the boundary list. Returns [{"start": s, "end": e}, ...] per scene, with
+    the first scene starting at 0 and the last ending at None (end of audio),
+    or None when there is nothing to align.
+
+    If the TTS tokenized a different number of words than the scene texts contain
+    (numbers, abbreviations), scene boundaries are scaled proportionally.
+    """
+    if not scenes or not words:
+        return None
+
+    scene_words = [count_words(scene.get("narration_part", "")) for scene in scenes]
+    total_scene_words = sum(scene_words)
+    if total_scene_words == 0:
+        return None
+
+    scale = len(words) / total_scene_words
+    starts = []
+    cumulative = 0
+    for count in scene_words:
+        index = min(len(words) - 1, round(cumulative * scale))
+        starts.append(words[index][1])
+        cumulative += count
+    starts[0] = 0.0
+    # Guard against non-monotonic boundaries from sparse alignment data
+    for i in range(1, len(starts)):
+        starts[i] = max(starts[i], starts[i - 1])
+
+    timings = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else None
+        timings.append({"start": round(start, 3), "end": round(end, 3) if end is not None else None})
+    return timings
@@ -0,0 +1,29 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict
+from urllib.parse import urlsplit
+
+
+class HostLimiter:
+    """
+    Bounds outbound requests both globally and per host.
+    Create one per event loop (e.g. per pipeline run), since asyncio
+    semaphores are bound to the loop they are first used on.
+    """
+
+    def __init__(self, max_concurrency: int, max_per_host: int):
+        self.max_per_host = max(1, max_per_host)
+        self._global = asyncio.Semaphore(max(1, max_concurrency))
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.max_per_host)
+        return self._hosts[host]
+
+    @asynccontextmanager
+    async def limit(self, url: str):
+        async with self._host_semaphore(url):
+            async with self._global:
+                yield
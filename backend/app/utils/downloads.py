@@ -0,0 +1,100 @@
+import os
+from pathlib import Path
+from typing import Optional
+import httpx
+
+
+class DownloadError(Exception):
+    """
+    Raised when a download is rejected (too large) or arrives incomplete.
+    """
+
+
+def partial_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + ".part")
+
+
+async def stream_download(
+    client: httpx.AsyncClient,
+    url: str,
+    dest: Path,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = 1024 * 1024,
+    retries: int = 2,
+) -> Path:
+    """
+    Streams `url` to `dest` chunk by chunk without buffering the body in memory.
+
+    Bytes are written to `<dest>.part` and only renamed into place once the
+    received size matches the advertised length, so `dest` never exists in a
+    truncated state. A leftover `.part` file (from a crash or a dropped
+    connection) is resumed with an HTTP Range request when the server allows it.
+    """
+    attempt = 0
+    while True:
+        try:
+            await _download_once(client, url, dest, max_bytes, chunk_size)
+            return dest
+        except DownloadError:
+            raise
+        except httpx.TransportError as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            print(f"  🔁 Download interrupted ({e}), resuming {dest.name} (attempt {attempt}/{retries})...")
+
+
+async def _download_once(client: httpx.AsyncClient, url: str, dest: Path, max_bytes: Optional[int], chunk_size: int):
+    part = partial_path(dest)
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code == 416:
+            # Our partial file does not line up with the remote one; start over
+            part.unlink(missing_ok=True)
+            raise httpx.TransportError("Range not satisfiable, restarting download")
+
+        response.raise_for_status()
+
+        if response.status_code != 206:
+            # Server ignored the Range header and is sending the whole body
+            offset = 0
+
+        expected = _expected_total(response, offset)
+        if max_bytes and expected and expected > max_bytes:
+            part.unlink(missing_ok=True)
+            raise DownloadError(f"{url} is {expected} bytes, over the {max_bytes} byte limit")
+
+        received = offset
+        with open(part, "ab" if offset else "wb") as f:
+            async for chunk in response.aiter_bytes(chunk_size):
+                received += len(chunk)
+                if max_bytes and received > max_bytes:
+                    f.close()
+                    part.unlink(missing_ok=True)
+                    raise DownloadError(f"{url} exceeded the {max_bytes} byte limit")
+                f.write(chunk)
+
+    if expected is not None and received != expected:
+        # Keep the partial file so the next attempt can resume from it
+        raise httpx.TransportError(f"Incomplete download: got {received} of {expected} bytes")
+
+    os.replace(part, dest)
+
+
+def _expected_total(response: httpx.Response, offset: int) -> Optional[int]:
+    """
+    Total size of the remote file, from Content-Range (partial responses)
+    or Content-Length (full responses). None if the server did not say.
+    """
+    content_range = response.headers.get("content-range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+
+    content_length = response.headers.get("content-length")
+    if content_length and content_length.isdigit() and "content-encoding" not in response.headers:
+        return offset + int(content_length)
+    return None
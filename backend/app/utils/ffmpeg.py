@@ -0,0 +1,43 @@
+import asyncio
+from typing import List
+from moviepy.config import FFMPEG_BINARY
+from app.core.config import settings
+
+ffmpeg_binary = settings.FFMPEG_BINARY or FFMPEG_BINARY
+
+
+async def run_ffmpeg(args: List[str]):
+    """
+    Runs ffmpeg with the given arguments without blocking the event loop.
+    Raises RuntimeError with the tail of stderr on failure; the process is
+    killed if the awaiting task is cancelled.
+    """
+    cmd = [ffmpeg_binary, "-y", "-hide_banner", "-loglevel", "error", *args]
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    try:
+        _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='ignore').strip()[-500:]}")
+
+
+async def probe_duration(path: str) -> float:
+    """
+    Exact media duration in seconds, measured by decoding the file
+    (container headers are unreliable for concatenated or VBR MP3s).
+    """
+    cmd = [ffmpeg_binary, "-hide_banner", "-nostats", "-i", path, "-f", "null", "-progress", "pipe:1", "-"]
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not read {path}: {stderr.decode(errors='ignore').strip()[-500:]}")
+
+    duration = 0.0
+    for line in stdout.decode(errors="ignore").splitlines():
+        if line.startswith("out_time_us=") and line[12:].strip().isdigit():
+            duration = int(line[12:]) / 1_000_000
+    return duration
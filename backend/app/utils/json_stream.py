@@ -0,0 +1,70 @@
+import json
+import re
+from typing import Dict, List
+
+_ARRAY_KEY_RE = r'"{}"\s*:\s*\['
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally extracts the objects of one top-level array (e.g. "scenes")
+    from a JSON document arriving in chunks. Each object is returned by `feed`
+    as soon as its closing brace arrives, before the rest of the document.
+    """
+
+    def __init__(self, key: str):
+        self._key_re = re.compile(_ARRAY_KEY_RE.format(re.escape(key)))
+        self.buffer = ""
+        self._pos = 0            # scan position in buffer
+        self._in_array = False
+        self._done = False
+        self._depth = 0          # brace depth inside the array
+        self._start = None       # buffer index where the current object began
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        Appends a chunk and returns the array items completed by it.
+        """
+        self.buffer += chunk
+        items = []
+        if self._done:
+            return items
+
+        if not self._in_array:
+            match = self._key_re.search(self.buffer)
+            if not match:
+                return items
+            self._in_array = True
+            self._pos = match.end()
+
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    items.append(json.loads(buffer[self._start:i + 1]))
+                    self._start = None
+            elif char == "]" and self._depth == 0:
+                self._done = True
+                break
+
+        self._pos = len(buffer)
+        return items
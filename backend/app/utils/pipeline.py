@@ -0,0 +1,124 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+class PipelineStageError(Exception):
+    """
+    Raised by a stage to abort the pipeline with a user-facing failure message.
+    """
+
+
+class Stage:
+    """
+    A named unit of pipeline work. `func` receives the results of all
+    previously finished stages (keyed by stage name) and returns its own result.
+    """
+
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Awaitable[Any]], depends_on: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on)
+
+
+async def run_stage_graph(
+    stages: List[Stage],
+    completed: Optional[Dict[str, Any]] = None,
+    on_complete: Optional[Callable[[str, Any], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """
+    Runs stages as a dependency graph: every stage starts as soon as all of
+    its dependencies have finished, so independent stages overlap.
+    If any stage fails, the remaining stages are cancelled and the error is re-raised.
+
+    Stages found in `completed` (e.g. restored checkpoints) are not run again;
+    their stored result is used instead. `on_complete(name, result)` is awaited
+    after each stage that actually ran.
+    """
+    completed = completed or {}
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        if stage.name in completed:
+            continue
+        missing = [dep for dep in stage.depends_on if dep not in names]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stage(s): {missing}")
+
+    results: Dict[str, Any] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def _run(stage: Stage):
+        if stage.name in completed:
+            results[stage.name] = completed[stage.name]
+            return results[stage.name]
+        if stage.depends_on:
+            await asyncio.gather(*(tasks[dep] for dep in stage.depends_on))
+        results[stage.name] = await stage.func(results)
+        if on_complete:
+            await on_complete(stage.name, results[stage.name])
+        return results[stage.name]
+
+    # All tasks are created before any of them runs, so dependency lookups always resolve
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(_run(stage), name=f"stage:{stage.name}")
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    return results
+
+
+def select_stages(stages: List[Stage], targets: Iterable[str], completed: Dict[str, Any]) -> List[Stage]:
+    """
+    Returns the subset of `stages` needed to produce `targets`: the targets plus
+    any dependency (transitively) that is not already in `completed`. Completed
+    dependencies are included too, so `run_stage_graph` can resolve them.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    needed = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        if name in completed:
+            continue
+        pending.extend(by_name[name].depends_on)
+    return [stage for stage in stages if stage.name in needed]
+
+
+class ProgressTracker:
+    """
+    Splits the 0-99 progress range into per-stage budgets.
+    Each stage can only advance its own share, so progress stays monotonic
+    and bounded even when several stages report interleaved updates.
+    """
+
+    def __init__(self, budgets: Dict[str, int], publish: Callable[[int, str], Awaitable[None]]):
+        self.budgets = dict(budgets)
+        self.spent = {name: 0 for name in budgets}
+        self.publish = publish
+
+    @property
+    def progress(self) -> int:
+        return min(99, sum(self.spent.values()))
+
+    def stage(self, name: str) -> Callable[..., Awaitable[None]]:
+        """
+        Returns a `log_step(message, progress_inc=0)` callback bound to one stage.
+        """
+        async def log_step(message: str, progress_inc: int = 0):
+            self.spent[name] = min(self.budgets[name], self.spent[name] + progress_inc)
+            await self.publish(self.progress, message)
+        return log_step
+
+    def complete(self, name: str):
+        """
+        Marks a stage as fully done, claiming any budget it did not report.
+        """
+        self.spent[name] = self.budgets[name]
@@ -1,124 +1,372 @@
 import asyncio
-import json
 import logging
+import os
+from celery.signals import worker_process_shutdown, worker_shutdown
 from app.core.celery_app import celery_app
 from app.services.script_service import script_service
 from app.services.voice_service import voice_service
 from app.services.visual_service import visual_service
 from app.services.engine_service import engine_service
 from app.services.storage_service import storage_service
+from app.services.media_cache import media_cache
+from app.services.normalize_service import normalize_service
+from app.services.checkpoint_service import checkpoint_service
+from app.services.scheduler_service import job_scheduler
+from app.services.progress_service import progress_publisher
+from app.services.task_state import task_state
 from app.core.redis_client import redis_client
+from app.core.http_client import close_http_client
+from app.core.config import settings
+from app.core.render_profiles import resolve_render_profile
+from app.utils.pipeline import Stage, ProgressTracker, PipelineStageError, run_stage_graph, select_stages
 
 logger = logging.getLogger(__name__)
 
 async def update_task_progress(task_id: str, status: str, progress: int, message: str, data: dict = None):
     """
-    Updates task status in Redis and publishes to PubSub channel.
+    Records a progress event (task state, replayable stream, PubSub), coalescing bursts.
     """
-    payload = {
-        "task_id": task_id,
-        "status": status,
-        "progress": progress,
-        "message": message,
-        "data": data or {}
-    }
-    # Store state in Redis
-    await redis_client.set(f"task:{task_id}", json.dumps(payload), ex=3600)  # Expire in 1 hour
-    # Publish to PubSub
-    await redis_client.publish(f"stream:{task_id}", json.dumps(payload))
-
-async def run_video_pipeline(task_id: str, prompt: str):
-    try:
-        current_progress = 0
-        
-        async def log_step(message: str, progress_inc: int = 0):
-            nonlocal current_progress
-            current_progress = min(99, current_progress + progress_inc)
-            await update_task_progress(task_id, "processing", current_progress, message)
+    await progress_publisher.publish(task_id, status, progress, message, data)
+
+# Share of the 0-99 progress range owned by each pipeline stage
+PIPELINE_STAGE_BUDGETS = {
+    "script": 15,
+    "voice": 15,
+    "visuals": 20,
+    "normalize": 10,
+    "render": 20,
+    "thumbnail": 6,
+    "upload": 13,
+}
+
+# Stages run by each Celery task when the pipeline is split across queues
+# (I/O-bound stages and CPU-bound ffmpeg work scale on separate workers)
+PIPELINE_TASK_STAGES = {
+    "script": ["script"],
+    "voice": ["voice"],
+    "visuals": ["visuals"],
+    "render": ["normalize", "render"],
+    "upload": ["thumbnail", "upload"],
+}
+
+def _checkpoint_paths(stage: str, result) -> list:
+    """
+    Local files a checkpointed stage result depends on.
+    """
+    if stage == "voice":
+        return [result["audio_path"]]
+    if stage in ("visuals", "normalize"):
+        return [p for scene in result for p in scene.get("video_paths", []) + scene.get("normalized_paths", [])]
+    if stage in ("render", "thumbnail"):
+        return [result] if result else []
+    return []
+
+def _reusable_checkpoints(stages: list, checkpoints: dict) -> dict:
+    """
+    Keeps checkpoints whose files still exist (cached clips may have been evicted)
+    and whose dependencies are reusable too. Stages are listed in dependency order.
+    """
+    reusable = {}
+    for stage in stages:
+        if stage.name not in checkpoints or not all(dep in reusable for dep in stage.depends_on):
+            continue
+        if all(os.path.exists(p) for p in _checkpoint_paths(stage.name, checkpoints[stage.name])):
+            reusable[stage.name] = checkpoints[stage.name]
+    return reusable
+
+async def run_video_pipeline(task_id: str, prompt: str, render_profile: str = "standard", can_retry: bool = False, targets: list = None):
+    """
+    Runs the pipeline for a task, skipping stages checkpointed by an earlier attempt.
+    With `targets`, only those stages (plus any missing dependencies) are run.
+    Returns the outcome: "completed", "processing" (targets done, job not finished),
+    "failed", or "retry" when an unexpected error should be retried by the caller.
+    """
+    profile = resolve_render_profile(render_profile)
+
+    async def publish_progress(progress: int, message: str):
+        await update_task_progress(task_id, "processing", progress, message)
+
+    tracker = ProgressTracker(PIPELINE_STAGE_BUDGETS, publish_progress)
+
+    # Scenes streamed from the script start their clip search before the rest of the script arrives
+    fetch_ctx = visual_service.new_fetch_context(task_id, profile.orientation)
+    stream_scenes = False
+
+    async def on_scene(index: int, scene: dict):
+        log_step = tracker.stage("visuals")
+        visual_service.prefetch_scene(index, scene, fetch_ctx, log_callback=lambda msg: log_step(msg, 2))
 
+    # 1. Script
+    async def script_stage(results: dict) -> dict:
+        log_step = tracker.stage("script")
         await log_step("Generating script...", 10)
-        
-        # 1. Script
-        script_data = await script_service.generate_script(prompt)
+
+        script_data = await script_service.generate_script(prompt, on_scene=on_scene if stream_scenes else None)
         if "error" in script_data:
-            await update_task_progress(task_id, "failed", 0, f"Script Error: {script_data['error']}")
-            return
+            raise PipelineStageError(f"Script Error: {script_data['error']}")
 
         await log_step(f"Script ready: {script_data.get('title', 'Video')}", 5)
+        return script_data
+
+    # 2. Voice
+    async def voice_stage(results: dict) -> dict:
+        log_step = tracker.stage("voice")
         await log_step("Generating voiceover...", 10)
 
-        # 2. Voice
         audio_filename = f"{task_id}_audio.mp3"
-        audio_path = await voice_service.generate_voiceover(script_data, audio_filename)
-        
+        audio_path, scene_timings = await voice_service.generate_voiceover_with_timings(results["script"], audio_filename)
+
         if audio_path.startswith("Error"):
-            await update_task_progress(task_id, "failed", 0, f"Voice Error: {audio_path}")
-            return
-        
+            raise PipelineStageError(f"Voice Error: {audio_path}")
+
         await log_step("Voiceover generated.", 5)
+        return {"audio_path": audio_path, "scene_timings": scene_timings}
+
+    # 3. Visuals (Video Clips)
+    async def visuals_stage(results: dict) -> list:
+        log_step = tracker.stage("visuals")
         await log_step("Fetching visual assets...", 5)
-        
-        # 3. Visuals (Video Clips)
+
         scenes_with_visuals = await visual_service.fetch_video_clips_for_scenes(
-            script_data["scenes"], 
-            log_callback=lambda msg: log_step(msg, 2)
+            results["script"]["scenes"],
+            log_callback=lambda msg: log_step(msg, 2),
+            ctx=fetch_ctx
+        )
+
+        tracker.complete("visuals")
+        await log_step("Visual assets ready.")
+        return scenes_with_visuals
+
+    # 4. Normalize clips to the render format (cached across jobs)
+    async def normalize_stage(results: dict) -> list:
+        log_step = tracker.stage("normalize")
+        scenes = await normalize_service.normalize_scenes(
+            results["visuals"],
+            profile=profile,
+            log_callback=lambda msg: log_step(msg, 2),
+            task_id=task_id
         )
-        
-        await log_step("Visual assets ready.", 5)
 
-        # 4. Smart Assembly
+        tracker.complete("normalize")
+        await log_step("Clips normalized.")
+        return scenes
+
+    # 5. Smart Assembly
+    async def render_stage(results: dict) -> str:
+        log_step = tracker.stage("render")
         output_file = f"{task_id}_final.mp4"
-        local_video_path, used_visual_paths = await engine_service.assemble_video(
-            audio_path, 
-            scenes_with_visuals, 
+
+        # Optionally upload scenes as HLS while the rest are still encoding
+        progressive = None
+        if settings.RENDER_PROGRESSIVE_UPLOAD:
+            async def publish_playlist(url: str):
+                await task_state.save(task_id, {"playlist_url": url})
+                await update_task_progress(task_id, "processing", tracker.progress, "Preview is playable while rendering continues.", {"playlist_url": url})
+
+            progressive = storage_service.progressive_upload(f"{task_id}_hls", on_publish=publish_playlist)
+
+        local_video_path, _ = await engine_service.assemble_video(
+            results["voice"]["audio_path"],
+            results["normalize"],
             output_file,
-            log_callback=lambda msg: log_step(msg, 2)
+            log_callback=lambda msg: log_step(msg, 2),
+            profile=profile,
+            scene_timings=results["voice"]["scene_timings"],
+            on_segment=progressive.add_segment if progressive else None
         )
-        
-        await log_step("Video rendered.", 10)
+
+        tracker.complete("render")
+        await log_step("Video rendered.")
+        return local_video_path
+
+    # 6. Extract/Search Thumbnail
+    async def thumbnail_stage(results: dict):
+        log_step = tracker.stage("thumbnail")
         await log_step("Extracting thumbnail...", 5)
 
-        # 5. Extract/Search Thumbnail
+        local_video_path = results["render"]
         thumbnail_filename = f"{task_id}_thumb.jpg"
-        thumb_keywords = script_data.get("thumbnail_keywords", [])
+        thumb_keywords = results["script"].get("thumbnail_keywords", [])
         local_thumb_path = None
-        
+
         if thumb_keywords:
             local_thumb_path = await visual_service.fetch_thumbnail_image(
                 thumb_keywords,
-                log_callback=lambda msg: log_step(msg, 1)
+                log_callback=lambda msg: log_step(msg, 1),
+                task_id=task_id,
+                orientation=profile.orientation
             )
-        
+
         if not local_thumb_path:
             local_thumb_path = await engine_service.extract_thumbnail(local_video_path, thumbnail_filename)
-        
-        if local_thumb_path:
-            used_visual_paths.append(local_thumb_path)
-
-        # 6. Cleanup unused visuals
-        await log_step("Cleaning up temporary files...", 2)
-        await visual_service.cleanup_unused_visuals(used_visual_paths)
-        
-        # 7. Upload to Cloud
-        await log_step("Uploading video...", 5)
-        cloud_url = await storage_service.upload_video(local_video_path)
-        cloud_thumb_url = None
+
+        tracker.complete("thumbnail")
+        return local_thumb_path
+
+    # 7. Upload to Cloud
+    async def upload_stage(results: dict) -> dict:
+        log_step = tracker.stage("upload")
+        local_video_path = results["render"]
+        local_thumb_path = results["thumbnail"]
+
+        await log_step("Uploading video...", 7)
+        # Video and thumbnail go up concurrently
+        uploads = [storage_service.upload_video(local_video_path)]
         if local_thumb_path:
-            cloud_thumb_url = await storage_service.upload_thumbnail(local_thumb_path)
-        
-        # 8. Update Final Status
-        await update_task_progress(task_id, "completed", 100, "Video generated successfully!", {
+            uploads.append(storage_service.upload_thumbnail(local_thumb_path))
+        cloud_url, *thumb_urls = await asyncio.gather(*uploads)
+        cloud_thumb_url = thumb_urls[0] if thumb_urls else None
+
+        return {
             "video_url": cloud_url,
             "thumbnail_url": cloud_thumb_url
-        })
+        }
+
+    # Voice and visuals only depend on the script, so they can overlap
+    visuals_deps = ["script"] if settings.PIPELINE_CONCURRENT_STAGES else ["script", "voice"]
+    stages = [
+        Stage("script", script_stage),
+        Stage("voice", voice_stage, depends_on=["script"]),
+        Stage("visuals", visuals_stage, depends_on=visuals_deps),
+        Stage("normalize", normalize_stage, depends_on=["visuals"]),
+        Stage("render", render_stage, depends_on=["voice", "normalize"]),
+        Stage("thumbnail", thumbnail_stage, depends_on=["script", "render"]),
+        Stage("upload", upload_stage, depends_on=["render", "thumbnail"]),
+    ]
+
+    outcome = "failed"
+    try:
+        await checkpoint_service.save_job(task_id, prompt, profile.name)
+        completed = _reusable_checkpoints(stages, await checkpoint_service.load(task_id))
+        for name in completed:
+            tracker.complete(name)
+        if targets:
+            stages = select_stages(stages, targets, completed)
+            completed = {name: result for name, result in completed.items() if name in {stage.name for stage in stages}}
+        # Only when this run fetches the visuals too; a split script task can't hand prefetches on
+        stream_scenes = (
+            settings.SCRIPT_STREAMING
+            and settings.PIPELINE_CONCURRENT_STAGES
+            and any(stage.name == "visuals" and stage.name not in completed for stage in stages)
+        )
+
+        if completed:
+            # Keep reused clips leased so they can't be evicted mid-render
+            await media_cache.lease_paths(_checkpoint_paths("visuals", completed.get("visuals", [])) + [completed.get("thumbnail")], task_id)
+            await normalize_service.cache.lease_paths(_checkpoint_paths("normalize", completed.get("normalize", [])), task_id)
+            if not targets:
+                await publish_progress(tracker.progress, f"Resuming after: {', '.join(completed)}")
+
+        async def save_checkpoint(name: str, result):
+            await checkpoint_service.save(task_id, name, result)
+
+        results = await run_stage_graph(stages, completed=completed, on_complete=save_checkpoint)
+
+        # 8. Update Final Status
+        if "upload" in results:
+            await update_task_progress(task_id, "completed", 100, "Video generated successfully!", results["upload"])
+            await checkpoint_service.clear(task_id)
+            outcome = "completed"
+        else:
+            outcome = "processing"
 
+    except PipelineStageError as e:
+        await update_task_progress(task_id, "failed", 0, str(e), {"resumable": True})
     except Exception as e:
         logger.error(f"Worker Error: {e}")
-        await update_task_progress(task_id, "failed", 0, f"System Error: {str(e)}")
+        if can_retry:
+            await update_task_progress(task_id, "processing", tracker.progress, f"Retrying from last checkpoint after error: {str(e)}")
+            outcome = "retry"
+            return outcome
+        await update_task_progress(task_id, "failed", 0, f"System Error: {str(e)}", {"resumable": True})
+    finally:
+        fetch_ctx.close()
+        # A finished job frees its scheduler slot for the next waiting one; done first, so a
+        # failing cleanup below can't hold the slot until the in-flight TTL reclaims it
+        if outcome in ("completed", "failed"):
+            try:
+                await job_scheduler.finish(task_id, completed=outcome == "completed")
+            except Exception as e:
+                logger.error(f"Scheduler error: {e}")
+        # Don't leave a coalesced update waiting until the next task runs on this loop
+        cleanups = [progress_publisher.flush(task_id)]
+        # Release this task's leases so its clips become evictable (but stay cached);
+        # a job continuing in another stage task keeps them until it finishes
+        if outcome != "processing":
+            cleanups += [media_cache.release(task_id), normalize_service.release(task_id)]
+        for cleanup in cleanups:
+            try:
+                await cleanup
+            except Exception as e:
+                logger.error(f"Cleanup error for task {task_id}: {e}")
+    return outcome
 
-@celery_app.task(name="app.worker.process_video_task")
-def process_video_task(task_id: str, prompt: str):
+# One long-lived event loop per worker process, so pooled clients (HTTP, Redis)
+# keep their connections between tasks instead of being bound to a throwaway loop
+_worker_loop: asyncio.AbstractEventLoop = None
+
+def run_in_worker_loop(coro):
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(coro)
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker_loop(**kwargs):
+    """
+    Closes pooled connections when the worker (or a prefork child) exits.
+    """
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        return
+    try:
+        _worker_loop.run_until_complete(close_http_client())
+        _worker_loop.run_until_complete(redis_client.aclose())
+    except Exception as e:
+        logger.warning(f"Error closing worker connections: {e}")
+    finally:
+        _worker_loop.close()
+        _worker_loop = None
+
+def _run_pipeline_task(task, task_id: str, prompt: str, render_profile: str, targets: list = None):
     """
-    Celery task wrapper for the async pipeline.
+    Runs (part of) the pipeline inside a Celery task. Unexpected errors are retried
+    (resuming from the last checkpoint) up to PIPELINE_MAX_RETRIES times.
     """
-    return asyncio.run(run_video_pipeline(task_id, prompt))
+    can_retry = task.request.retries < settings.PIPELINE_MAX_RETRIES
+    outcome = run_in_worker_loop(run_video_pipeline(task_id, prompt, render_profile, can_retry=can_retry, targets=targets))
+    if outcome == "retry":
+        raise task.retry(countdown=settings.PIPELINE_RETRY_DELAY)
+    if outcome == "failed" and targets:
+        # The failure is already published; raising stops the rest of the chain
+        raise PipelineStageError(f"Pipeline failed during {', '.join(targets)}")
+    return outcome
+
+@celery_app.task(name="app.worker.process_video_task", bind=True)
+def process_video_task(self, task_id: str, prompt: str, render_profile: str = "standard"):
+    """
+    Celery task wrapper for the whole async pipeline in one worker.
+    """
+    return _run_pipeline_task(self, task_id, prompt, render_profile)
+
+@celery_app.task(name="app.worker.script_stage_task", bind=True)
+def script_stage_task(self, task_id: str, prompt: str, render_profile: str = "standard"):
+    return _run_pipeline_task(self, task_id, prompt, render_profile, PIPELINE_TASK_STAGES["script"])
+
+@celery_app.task(name="app.worker.voice_stage_task", bind=True)
+def voice_stage_task(self, task_id: str, prompt: str, render_profile: str = "standard"):
+    return _run_pipeline_task(self, task_id, prompt, render_profile, PIPELINE_TASK_STAGES["voice"])
+
+@celery_app.task(name="app.worker.visuals_stage_task", bind=True)
+def visuals_stage_task(self, task_id: str, prompt: str, render_profile: str = "standard"):
+    return _run_pipeline_task(self, task_id, prompt, render_profile, PIPELINE_TASK_STAGES["visuals"])
+
+@celery_app.task(name="app.worker.render_stage_task", bind=True)
+def render_stage_task(self, task_id: str, prompt: str, render_profile: str = "standard"):
+    return _run_pipeline_task(self, task_id, prompt, render_profile, PIPELINE_TASK_STAGES["render"])
+
+@celery_app.task(name="app.worker.upload_stage_task", bind=True)
+def upload_stage_task(self, task_id: str, prompt: str, render_profile: str = "standard"):
+    return _run_pipeline_task(self, task_id, prompt, render_profile, PIPELINE_TASK_STAGES["upload"])
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+# Settings are read at import time: provide the required keys and keep outputs out of the tree
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("GEMINI_MODEL", "test")
+os.environ.setdefault("ELEVENLABS_API_KEY", "test")
+os.environ.setdefault("PEXELS_API_KEY", "test")
+os.environ.setdefault("OUTPUT_DIR", tempfile.mkdtemp(prefix="video-generator-tests-"))
+
+import fakeredis
+import pytest
+import app.core.redis_client
+
+
+@pytest.fixture
+async def redis(monkeypatch):
+    """
+    In-memory Redis (with Lua scripting) in place of the shared client,
+    in every app module that imported it.
+    """
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    shared = app.core.redis_client.redis_client
+    for name, module in list(sys.modules.items()):
+        if name.startswith("app") and getattr(module, "redis_client", None) is shared:
+            monkeypatch.setattr(module, "redis_client", client)
+    yield client
+    await client.aclose()
@@ -0,0 +1,44 @@
+from app.utils.alignment import scene_timings_from_words, words_from_characters
+
+
+def _characters(text: str, step: float = 0.1):
+    return list(text), [round(i * step, 3) for i in range(len(text))]
+
+
+def test_words_from_characters_groups_on_whitespace():
+    characters, starts = _characters("Hello  big world")
+    assert words_from_characters(characters, starts) == [("Hello", 0.0), ("big", 0.7), ("world", 1.1)]
+
+
+def test_words_from_characters_drops_punctuation_only_tokens():
+    characters, starts = _characters("Wait - what?")
+    assert [word for word, _ in words_from_characters(characters, starts)] == ["Wait", "what?"]
+
+
+def test_scene_timings_follow_word_boundaries():
+    scenes = [{"narration_part": "One two three."}, {"narration_part": "Four five."}, {"narration_part": "Six."}]
+    words = [("One", 0.2), ("two", 0.5), ("three", 0.9), ("Four", 1.6), ("five", 2.0), ("Six", 2.7)]
+
+    assert scene_timings_from_words(scenes, words) == [
+        {"start": 0.0, "end": 1.6},
+        {"start": 1.6, "end": 2.7},
+        {"start": 2.7, "end": None},
+    ]
+
+
+def test_scene_timings_scale_when_tts_word_count_differs():
+    # "1990" is spoken as two words, so the TTS reports more words than the script has
+    scenes = [{"narration_part": "In 1990"}, {"narration_part": "it ended"}]
+    words = [("In", 0.0), ("nineteen", 0.3), ("ninety", 0.8), ("it", 1.4), ("ended", 1.7)]
+
+    # Scene 2 starts 2 of 4 script words in: word 2.5 of 5 spoken words, rounded to word 2
+    assert scene_timings_from_words(scenes, words) == [
+        {"start": 0.0, "end": 0.8},
+        {"start": 0.8, "end": None},
+    ]
+
+
+def test_scene_timings_need_words_and_narration():
+    assert scene_timings_from_words([], [("a", 0.0)]) is None
+    assert scene_timings_from_words([{"narration_part": "Hi"}], []) is None
+    assert scene_timings_from_words([{"narration_part": ""}], [("a", 0.0)]) is None
@@ -0,0 +1,97 @@
+import httpx
+import pytest
+from app.utils.downloads import DownloadError, partial_path, stream_download
+
+BODY = bytes(range(256)) * 40
+URL = "https://videos.example/clip.mp4"
+
+
+class _DroppedStream(httpx.AsyncByteStream):
+    """
+    Sends the first `limit` bytes of a body, then drops the connection.
+    """
+
+    def __init__(self, body: bytes, limit: int):
+        self.body = body
+        self.limit = limit
+
+    async def __aiter__(self):
+        yield self.body[:self.limit]
+        raise httpx.ReadError("connection reset")
+
+
+def _range_server(requests: list, drop_first_after: int = 0):
+    """
+    Serves BODY, honouring Range requests; optionally drops the first response early.
+    """
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        range_header = request.headers.get("Range")
+        if range_header:
+            start = int(range_header.removeprefix("bytes=").rstrip("-"))
+            if start >= len(BODY):
+                return httpx.Response(416)
+            return httpx.Response(206, content=BODY[start:], headers={
+                "Content-Range": f"bytes {start}-{len(BODY) - 1}/{len(BODY)}",
+            })
+        if drop_first_after and len(requests) == 1:
+            return httpx.Response(200, stream=_DroppedStream(BODY, drop_first_after),
+                                  headers={"Content-Length": str(len(BODY))})
+        return httpx.Response(200, content=BODY)
+    return handler
+
+
+async def _download(handler, dest, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        return await stream_download(client, URL, dest, chunk_size=1000, **kwargs)
+
+
+async def test_download_lands_complete_file(tmp_path):
+    dest = tmp_path / "clip.mp4"
+    assert await _download(_range_server([]), dest) == dest
+    assert dest.read_bytes() == BODY
+    assert not partial_path(dest).exists()
+
+
+async def test_dropped_connection_resumes_with_range(tmp_path):
+    requests = []
+    dest = tmp_path / "clip.mp4"
+    await _download(_range_server(requests, drop_first_after=3000), dest)
+
+    assert dest.read_bytes() == BODY
+    assert [r.headers.get("Range") for r in requests] == [None, "bytes=3000-"]
+
+
+async def test_leftover_part_file_is_resumed(tmp_path):
+    requests = []
+    dest = tmp_path / "clip.mp4"
+    partial_path(dest).write_bytes(BODY[:5000])
+    await _download(_range_server(requests), dest)
+
+    assert dest.read_bytes() == BODY
+    assert requests[0].headers["Range"] == "bytes=5000-"
+
+
+async def test_server_ignoring_range_restarts_from_zero(tmp_path):
+    dest = tmp_path / "clip.mp4"
+    partial_path(dest).write_bytes(b"stale bytes")
+    await _download(lambda request: httpx.Response(200, content=BODY), dest)
+    assert dest.read_bytes() == BODY
+
+
+async def test_unsatisfiable_range_discards_part_file(tmp_path):
+    requests = []
+    dest = tmp_path / "clip.mp4"
+    partial_path(dest).write_bytes(BODY + b"extra")
+    await _download(_range_server(requests), dest)
+
+    assert dest.read_bytes() == BODY
+    assert [r.headers.get("Range") for r in requests] == [f"bytes={len(BODY) + 5}-", None]
+
+
+async def test_oversized_download_is_rejected(tmp_path):
+    dest = tmp_path / "clip.mp4"
+    with pytest.raises(DownloadError):
+        await _download(_range_server([]), dest, max_bytes=1000)
+    assert not dest.exists()
+    assert not partial_path(dest).exists()
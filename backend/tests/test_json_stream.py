@@ -0,0 +1,45 @@
+import json
+from app.utils.json_stream import JsonArrayStreamParser
+
+DOCUMENT = json.dumps({
+    "title": "Deep sea {scenes: [}",
+    "scenes": [
+        {"narration_part": "The ocean is \"deep\" {really}.", "visual_keywords": ["ocean", "abyss"]},
+        {"narration_part": "Back\\slash and ] bracket", "meta": {"nested": {"depth": 2}}},
+        {"narration_part": "Last one", "visual_keywords": []},
+    ],
+    "hashtags": ["#sea"],
+})
+
+
+def _feed_in_chunks(size: int):
+    parser = JsonArrayStreamParser("scenes")
+    batches = [parser.feed(DOCUMENT[i:i + size]) for i in range(0, len(DOCUMENT), size)]
+    return parser, batches
+
+
+def test_items_match_the_parsed_document():
+    expected = json.loads(DOCUMENT)["scenes"]
+    for size in (1, 2, 7, 64, len(DOCUMENT)):
+        parser, batches = _feed_in_chunks(size)
+        assert [item for batch in batches for item in batch] == expected
+        assert json.loads(parser.buffer) == json.loads(DOCUMENT)
+
+
+def test_each_item_is_returned_as_soon_as_it_closes():
+    parser = JsonArrayStreamParser("scenes")
+    first_end = DOCUMENT.index("}", DOCUMENT.index("abyss")) + 1
+
+    assert parser.feed(DOCUMENT[:first_end - 1]) == []
+    assert parser.feed(DOCUMENT[first_end - 1:first_end]) == [json.loads(DOCUMENT)["scenes"][0]]
+
+
+def test_items_after_the_array_are_ignored():
+    parser = JsonArrayStreamParser("scenes")
+    assert parser.feed('{"scenes": [{"a": 1}], "other": [{"b": 2}]}') == [{"a": 1}]
+    assert parser.feed(', "more": {"c": 3}}') == []
+
+
+def test_missing_key_yields_nothing():
+    parser = JsonArrayStreamParser("scenes")
+    assert parser.feed('{"title": "x", "items": [{"a": 1}]}') == []
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from app.services.media_cache import MediaCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MediaCache(tmp_path / "cache", max_bytes=100, lease_ttl=60, download_wait_timeout=5)
+
+
+async def _add(cache: MediaCache, key: str, size: int, task_id=None):
+    cache.path_for(key).write_bytes(b"x" * size)
+    return await cache.register(key, task_id)
+
+
+async def test_lookup_hits_registered_files(cache):
+    assert await cache.lookup("clip.mp4") is None
+    path = await _add(cache, "clip.mp4", 10)
+    assert await cache.lookup("clip.mp4") == path
+
+    metrics = await cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["entries"]) == (1, 1, 1)
+
+
+async def test_eviction_skips_leased_files(cache):
+    await _add(cache, "leased.mp4", 60, task_id="task-1")
+    await _add(cache, "old.mp4", 30)
+    await _add(cache, "new.mp4", 30)
+
+    assert cache.path_for("leased.mp4").exists()
+    assert not cache.path_for("old.mp4").exists()
+    assert cache.path_for("new.mp4").exists()
+
+    await cache.release("task-1")
+    await _add(cache, "newest.mp4", 30)
+    assert not cache.path_for("leased.mp4").exists()
+
+
+async def test_second_claimant_waits_for_the_download(cache):
+    assert await cache.claim_download("clip.mp4", "task-1")
+
+    async def finish_download():
+        await asyncio.sleep(0.2)
+        await _add(cache, "clip.mp4", 10, task_id="task-1")
+
+    finisher = asyncio.create_task(finish_download())
+    # False: no second download; the file is there to look up
+    assert not await cache.claim_download("clip.mp4", "task-2")
+    await finisher
+    assert await cache.lookup("clip.mp4", "task-2") is not None
+
+
+async def test_abandoned_claim_can_be_taken_over(cache):
+    assert await cache.claim_download("clip.mp4", "task-1")
+    await cache.abandon_download("clip.mp4", "task-1")
+    assert await cache.claim_download("clip.mp4", "task-2")
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from app.utils.pipeline import ProgressTracker, Stage, run_stage_graph, select_stages
+
+
+async def test_independent_stages_overlap():
+    running = set()
+    overlapped = []
+
+    def stage(name: str):
+        async def run(results):
+            running.add(name)
+            await asyncio.sleep(0.01)
+            overlapped.append(running == {"voice", "visuals"})
+            running.discard(name)
+            return name
+        return run
+
+    results = await run_stage_graph([
+        Stage("script", lambda results: asyncio.sleep(0, "script")),
+        Stage("voice", stage("voice"), depends_on=["script"]),
+        Stage("visuals", stage("visuals"), depends_on=["script"]),
+    ])
+
+    assert results == {"script": "script", "voice": "voice", "visuals": "visuals"}
+    assert any(overlapped)
+
+
+async def test_stage_sees_results_of_its_dependencies():
+    async def render(results):
+        return f"{results['voice']}+{results['visuals']}"
+
+    results = await run_stage_graph([
+        Stage("render", render, depends_on=["voice", "visuals"]),
+        Stage("voice", lambda results: asyncio.sleep(0.01, "audio")),
+        Stage("visuals", lambda results: asyncio.sleep(0, "clips")),
+    ])
+
+    assert results["render"] == "audio+clips"
+
+
+async def test_failure_cancels_remaining_stages():
+    cancelled = asyncio.Event()
+
+    async def slow(results):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def broken(results):
+        raise RuntimeError("voice failed")
+
+    with pytest.raises(RuntimeError, match="voice failed"):
+        await run_stage_graph([Stage("voice", broken), Stage("visuals", slow)])
+    assert cancelled.is_set()
+
+
+async def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError, match="unknown stage"):
+        await run_stage_graph([Stage("render", lambda results: asyncio.sleep(0), depends_on=["voice"])])
+
+
+async def test_completed_stages_are_reused_not_rerun():
+    ran, saved = [], []
+
+    def stage(name: str):
+        async def run(results):
+            ran.append(name)
+            return name
+        return run
+
+    async def on_complete(name, result):
+        saved.append(name)
+
+    stages = [
+        Stage("script", stage("script")),
+        Stage("voice", stage("voice"), depends_on=["script"]),
+        Stage("render", stage("render"), depends_on=["script", "voice"]),
+    ]
+    results = await run_stage_graph(stages, completed={"script": "checkpointed"}, on_complete=on_complete)
+
+    assert ran == saved == ["voice", "render"]
+    assert results["script"] == "checkpointed"
+
+
+def test_select_stages_keeps_only_what_targets_need():
+    stages = [
+        Stage("script", None),
+        Stage("voice", None, depends_on=["script"]),
+        Stage("visuals", None, depends_on=["script"]),
+        Stage("render", None, depends_on=["voice", "visuals"]),
+    ]
+
+    assert [s.name for s in select_stages(stages, ["voice"], {})] == ["script", "voice"]
+    # Completed dependencies are kept (to resolve results) but not expanded further
+    assert [s.name for s in select_stages(stages, ["render"], {"voice": "a", "visuals": "b"})] == ["voice", "visuals", "render"]
+
+
+async def test_progress_tracker_caps_each_stage_at_its_budget():
+    published = []
+
+    async def publish(progress, message):
+        published.append(progress)
+
+    tracker = ProgressTracker({"voice": 20, "visuals": 30}, publish)
+    await tracker.stage("voice")("voiced", 50)
+    await tracker.stage("visuals")("fetched", 10)
+    tracker.complete("visuals")
+
+    assert published == [20, 30]
+    assert tracker.progress == 50
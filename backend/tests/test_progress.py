@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from app.services.progress_service import ProgressHub, ProgressPublisher, progress_stream_key
+from app.services.task_state import task_state
+
+
+@pytest.fixture
+def publisher(redis):
+    return ProgressPublisher(max_per_second=10, stream_maxlen=100, ttl=3600)
+
+
+async def _stream(redis, task_id: str):
+    return await redis.xrange(progress_stream_key(task_id))
+
+
+async def test_bursts_are_coalesced_into_the_latest_event(redis, publisher):
+    await publisher.publish("t1", "processing", 10, "Scripting")
+    await publisher.publish("t1", "processing", 20, "Voicing")
+    await publisher.publish("t1", "processing", 30, "Fetching clips")
+    assert len(await _stream(redis, "t1")) == 1
+
+    await publisher.flush("t1")
+    state = await task_state.get("t1")
+    assert len(await _stream(redis, "t1")) == 2
+    assert state["progress"] == 30
+    assert state["messages"] == ["Voicing", "Fetching clips"]
+
+
+async def test_coalesced_event_is_written_when_the_window_ends(redis, publisher):
+    await publisher.publish("t1", "processing", 10, "Scripting")
+    await publisher.publish("t1", "processing", 20, "Voicing")
+    await asyncio.sleep(0.2)
+
+    assert len(await _stream(redis, "t1")) == 2
+    assert (await task_state.get("t1"))["progress"] == 20
+
+
+async def test_status_changes_are_written_at_once(redis, publisher):
+    await publisher.publish("t1", "processing", 10, "Scripting")
+    await publisher.publish("t1", "processing", 50, "Rendering")
+    await publisher.publish("t1", "completed", 100, "Done", {"video_url": "https://cdn.example/v.mp4"})
+
+    events = await publisher.replay("t1", "0-0")
+    assert [(e["status"], e["progress"]) for e in events] == [("processing", 10), ("completed", 100)]
+    # The coalesced update travels with the terminal event instead of being lost
+    assert events[-1]["messages"] == ["Rendering", "Done"]
+    assert events[-1]["data"] == {"video_url": "https://cdn.example/v.mp4"}
+
+
+async def test_replay_returns_events_after_the_given_id(redis, publisher):
+    for progress, status in ((10, "pending"), (20, "processing"), (100, "completed")):
+        await publisher.publish("t1", status, progress, status)
+    events = await publisher.replay("t1", "0-0")
+
+    assert [e["progress"] for e in await publisher.replay("t1", events[0]["event_id"])] == [20, 100]
+    assert await publisher.replay("t1", events[-1]["event_id"]) == []
+    assert (await task_state.get("t1"))["event_id"] == events[-1]["event_id"]
+
+
+async def test_parallel_stage_trackers_cannot_move_progress_back(redis):
+    # Split mode: voice and visuals run as separate tasks, each publishing its own tracker's total
+    voice = ProgressPublisher(max_per_second=0, stream_maxlen=100, ttl=3600)
+    visuals = ProgressPublisher(max_per_second=0, stream_maxlen=100, ttl=3600)
+    await voice.publish("t1", "processing", 40, "Voiceover ready")
+    await visuals.publish("t1", "processing", 25, "Fetched 3 clips")
+
+    events = await voice.replay("t1", "0-0")
+    assert [e["progress"] for e in events] == [40, 40]
+    assert (await task_state.get("t1"))["progress"] == 40
+
+    # Only processing updates are clamped: a failure resets progress and keeps the state longer
+    await visuals.publish("t1", "failed", 0, "Clip search failed")
+    assert (await task_state.get("t1"))["progress"] == 0
+    assert await redis.ttl(task_state.key("t1")) == task_state.finished_ttl
+
+
+async def test_hub_fans_out_published_events(redis, publisher):
+    hub = ProgressHub(buffer_size=10)
+    first, second = await hub.subscribe("t1"), await hub.subscribe("t1")
+    other = await hub.subscribe("t2")
+    try:
+        # subscribe() returns only after Redis confirmed the subscription, so nothing is missed
+        await publisher.publish("t1", "processing", 10, "Scripting")
+        for queue in (first, second):
+            event = await asyncio.wait_for(queue.get(), timeout=2)
+            assert (event["progress"], event["message"]) == (10, "Scripting")
+        assert other.empty()
+    finally:
+        await hub.close()
+
+
+async def test_slow_subscribers_keep_the_latest_events(redis, publisher):
+    hub = ProgressHub(buffer_size=2)
+    queue = await hub.subscribe("t1")
+    try:
+        for progress in (10, 20, 30):
+            await publisher.publish("t1", "processing" if progress < 30 else "completed", progress, f"{progress}%")
+            await publisher.flush("t1")
+        await asyncio.sleep(0.1)
+        assert [queue.get_nowait()["progress"] for _ in range(queue.qsize())] == [20, 30]
+    finally:
+        await hub.close()
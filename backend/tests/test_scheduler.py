@@ -0,0 +1,161 @@
+import asyncio
+import pytest
+import app.services.scheduler_service as scheduler_service
+from app.services.scheduler_service import LANE_PRIORITIES, JobScheduler
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """
+    Task ids handed to Celery, in order (with the priority they were sent with).
+    """
+    sent = []
+    monkeypatch.setattr(scheduler_service, "enqueue_video_pipeline",
+                        lambda task_id, prompt, render_profile, priority=None: sent.append((task_id, priority)))
+    return sent
+
+
+def _broker_down(*args, **kwargs):
+    raise ConnectionError("broker unreachable")
+
+
+def _scheduler(**limits) -> JobScheduler:
+    return JobScheduler(max_in_flight=limits.pop("max_in_flight", 1), in_flight_ttl=3600, **limits)
+
+
+async def test_jobs_run_within_the_in_flight_limit(redis, dispatched):
+    scheduler = _scheduler(max_in_flight=2)
+    for i in range(4):
+        await scheduler.submit(f"job-{i}", "prompt", "standard")
+    assert [task_id for task_id, _ in dispatched] == ["job-0", "job-1"]
+
+    await scheduler.finish("job-0", completed=True)
+    assert [task_id for task_id, _ in dispatched] == ["job-0", "job-1", "job-2"]
+    assert await redis.hget("sched:durations", "standard") is not None
+
+
+async def test_higher_lanes_go_first_with_their_priority(redis, dispatched):
+    scheduler = _scheduler()
+    await scheduler.submit("running", "prompt", "standard")
+    await scheduler.submit("batch", "prompt", "standard", lane="batch")
+    await scheduler.submit("standard", "prompt", "standard")
+    await scheduler.submit("interactive", "prompt", "draft", lane="interactive")
+
+    for task_id in ("running", "interactive", "standard"):
+        await scheduler.finish(task_id)
+    assert dispatched == [
+        ("running", LANE_PRIORITIES["standard"]),
+        ("interactive", LANE_PRIORITIES["interactive"]),
+        ("standard", LANE_PRIORITIES["standard"]),
+        ("batch", LANE_PRIORITIES["batch"]),
+    ]
+
+
+async def test_clients_take_turns_within_a_lane(redis, dispatched):
+    scheduler = _scheduler()
+    await scheduler.submit("running", "prompt", "standard", client_id="other")
+    for i in range(3):
+        await scheduler.submit(f"a{i}", "prompt", "standard", client_id="burst")
+    await scheduler.submit("b0", "prompt", "standard", client_id="quiet")
+
+    for task_id in ("running", "a0", "b0", "a1"):
+        await scheduler.finish(task_id)
+    assert [task_id for task_id, _ in dispatched] == ["running", "a0", "b0", "a1", "a2"]
+
+
+async def test_burst_cannot_exceed_queue_limits(redis, dispatched):
+    scheduler = _scheduler(max_queued=5, max_queued_per_client=3)
+    admissions = await asyncio.gather(*(
+        scheduler.submit(f"job-{i}", "prompt", "standard", client_id=f"client-{i % 2}") for i in range(20)
+    ))
+
+    # One job runs; of the rest, at most 3 per client and 5 overall may wait
+    totals = await redis.hgetall("sched:waiting")
+    assert int(totals["total"]) <= 5
+    assert max(int(totals["client:client-0"]), int(totals["client:client-1"])) <= 3
+    assert sum(admission.admitted for admission in admissions) == int(totals["total"]) + len(dispatched)
+    rejected = next(admission for admission in admissions if not admission.admitted)
+    assert rejected.retry_after >= 1
+
+
+async def test_running_totals_follow_dispatch(redis, dispatched):
+    scheduler = _scheduler()
+    for i in range(3):
+        await scheduler.submit(f"job-{i}", "prompt", "standard", client_id="client")
+    assert await redis.hget("sched:waiting", "count:standard") == "2"
+
+    await scheduler.finish("job-0")
+    await scheduler.finish("job-1")
+    totals = await redis.hgetall("sched:waiting")
+    assert (totals["total"], totals["count:standard"], float(totals["seconds:standard"])) == ("0", "0", 0.0)
+    # Per-client counters are dropped once the client has nothing waiting
+    assert "client:client" not in totals
+
+
+async def test_estimated_wait_over_the_limit_is_rejected(redis, dispatched):
+    scheduler = _scheduler(max_wait_seconds=100, default_job_seconds=60)
+    assert (await scheduler.submit("running", "prompt", "standard")).admitted
+    # Starts when the running job ends, in about 60s
+    queued = await scheduler.submit("queued", "prompt", "standard")
+    assert queued.admitted and 55 < queued.estimated_start_seconds <= 60
+
+    # Would start after both, in about 120s
+    rejected = await scheduler.submit("late", "prompt", "standard")
+    assert not rejected.admitted
+    assert "exceeds the 100s limit" in rejected.reason
+    assert 15 <= rejected.retry_after <= 20
+    assert not await redis.hexists("sched:estimates", "late")
+
+
+async def test_interactive_jobs_are_not_delayed_by_batch_backlog(redis, dispatched):
+    scheduler = _scheduler(max_wait_seconds=100, default_job_seconds=60)
+    await scheduler.submit("running", "prompt", "standard")
+    for i in range(3):
+        await scheduler.submit(f"batch-{i}", "prompt", "standard", lane="batch", client_id=f"client-{i}")
+
+    admission = await scheduler.submit("interactive", "prompt", "draft", lane="interactive")
+    assert admission.admitted and admission.estimated_start_seconds <= 60
+
+
+async def test_failed_hand_off_puts_the_job_back(redis, monkeypatch):
+    scheduler = _scheduler()
+    monkeypatch.setattr(scheduler_service, "enqueue_video_pipeline", _broker_down)
+    await redis.rpush("sched:standard:client:client", '{"task_id": "queued", "prompt": "p", "render_profile": "standard", '
+                      '"lane": "standard", "client_id": "client", "seconds": 60, "queued_at": 0}')
+    await redis.rpush("sched:standard:clients", "client")
+    await redis.hset("sched:waiting", mapping={"total": 1, "count:standard": 1, "client:client": 1, "seconds:standard": 60})
+
+    with pytest.raises(ConnectionError):
+        await scheduler.dispatch()
+
+    assert await redis.zcard("sched:in_flight") == 0
+    assert await redis.lrange("sched:standard:clients", 0, -1) == ["client"]
+    assert len(await redis.lrange("sched:standard:client:client", 0, -1)) == 1
+    totals = await redis.hgetall("sched:waiting")
+    assert (totals["total"], totals["client:client"], float(totals["seconds:standard"])) == ("1", "1", 60.0)
+
+
+async def test_submit_that_cannot_be_handed_off_is_withdrawn(redis, monkeypatch):
+    scheduler = _scheduler()
+    monkeypatch.setattr(scheduler_service, "enqueue_video_pipeline", _broker_down)
+
+    with pytest.raises(ConnectionError):
+        await scheduler.submit("job", "prompt", "standard", client_id="client")
+
+    assert await redis.zcard("sched:in_flight") == 0
+    assert not await redis.exists("sched:standard:client:client", "sched:standard:clients")
+    assert not await redis.hexists("sched:estimates", "job")
+    assert (await redis.hgetall("sched:waiting"))["total"] == "0"
+
+
+async def test_stale_ring_entries_do_not_skip_to_a_lower_lane(redis, dispatched):
+    scheduler = _scheduler()
+    await scheduler.submit("running", "prompt", "standard")
+    await scheduler.submit("batch", "prompt", "standard", lane="batch")
+    await scheduler.submit("interactive", "prompt", "draft", lane="interactive", client_id="b")
+    # A client listed in the ring with nothing left to run, ahead of the real one
+    await redis.lpush("sched:interactive:clients", "a")
+
+    await scheduler.finish("running")
+    assert [task_id for task_id, _ in dispatched] == ["running", "interactive"]
+    assert await redis.zscore("sched:in_flight", "interactive") is not None
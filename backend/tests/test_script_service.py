@@ -0,0 +1,95 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from app.services.script_service import ScriptService
+
+SCRIPT = {"title": "Deep sea", "narration": "Down we go.", "scenes": [{"text": "Down we go.", "keywords": ["ocean"]}]}
+
+
+class FakeGemini:
+    """
+    Stands in for genai.Client: `client.aio.models.generate_content` answers after
+    `delay` seconds, failing the first `failures` calls.
+    """
+
+    def __init__(self, delay: float = 0.1, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content))
+
+    async def generate_content(self, model, config, contents):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("quota exceeded")
+        return SimpleNamespace(text=json.dumps(SCRIPT))
+
+
+def _service(gemini: FakeGemini) -> ScriptService:
+    service = ScriptService()
+    service.client = gemini
+    return service
+
+
+async def test_concurrent_identical_prompts_share_one_call(redis):
+    gemini = FakeGemini()
+    service = _service(gemini)
+
+    first, second = await asyncio.gather(
+        service.generate_script("Deep sea creatures"),
+        service.generate_script("  deep SEA creatures!"),
+    )
+    assert gemini.calls == 1
+    assert first == second == SCRIPT
+    assert not service._inflight
+
+    # Each caller owns its copy: later stages mutate the scenes
+    first["scenes"][0]["keywords"].append("whale")
+    assert second["scenes"][0]["keywords"] == ["ocean"]
+
+
+async def test_workers_share_one_call_through_redis(redis):
+    gemini = FakeGemini()
+    # Separate services stand in for separate worker processes
+    results = await asyncio.gather(*(_service(gemini).generate_script("Deep sea creatures") for _ in range(2)))
+
+    assert gemini.calls == 1
+    assert results == [SCRIPT, SCRIPT]
+    assert not await redis.keys("*:lock")
+
+
+async def test_cached_script_is_served_without_a_call(redis):
+    gemini = FakeGemini()
+    await _service(gemini).generate_script("Deep sea creatures")
+
+    assert await _service(gemini).generate_script("Deep sea creatures.") == SCRIPT
+    assert gemini.calls == 1
+
+
+async def test_errors_are_not_cached(redis):
+    gemini = FakeGemini(failures=1)
+    service = _service(gemini)
+
+    assert await service.generate_script("Deep sea creatures") == {"error": "quota exceeded"}
+    assert not await redis.keys("script:*")
+
+    assert await service.generate_script("Deep sea creatures") == SCRIPT
+    assert gemini.calls == 2
+
+
+async def test_callers_joining_a_generation_still_get_their_scenes(redis):
+    gemini = FakeGemini()
+    service = _service(gemini)
+    scenes = []
+
+    async def on_scene(index, scene):
+        scenes.append((index, scene["text"]))
+
+    await asyncio.gather(
+        service.generate_script("Deep sea creatures"),
+        service.generate_script("Deep sea creatures", on_scene=on_scene),
+    )
+    assert gemini.calls == 1
+    assert scenes == [(0, "Down we go.")]
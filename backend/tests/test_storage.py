@@ -0,0 +1,174 @@
+import httpx
+import pytest
+import app.services.storage_service as storage_module
+from app.core.config import settings
+from app.services.storage_service import StorageService
+
+BODY = bytes(range(256)) * 14
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_LOCAL_BASE_URL", None)
+    storage = StorageService()
+    storage.backend = "local"
+    storage.local_dir = tmp_path / "storage"
+    storage.chunk_size = 1000
+    return storage
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(BODY)
+    return str(path)
+
+
+class FakeTusServer:
+    """
+    Supabase storage stand-in: single-request uploads plus TUS create / HEAD / PATCH.
+    `fail_patches` PATCH requests drop the connection after storing half their chunk.
+    """
+
+    def __init__(self, fail_patches: int = 0):
+        self.fail_patches = fail_patches
+        self.objects = {}
+        self.uploads = {}
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path))
+        path = request.url.path
+        if request.method == "POST" and path == "/storage/v1/upload/resumable":
+            upload_id = f"upload-{len(self.uploads)}"
+            self.uploads[upload_id] = b""
+            return httpx.Response(201, headers={"Location": f"https://storage.example/tus/{upload_id}"})
+        if request.method == "POST" and path.startswith("/storage/v1/object/"):
+            self.objects[path.removeprefix("/storage/v1/object/")] = request.read()
+            return httpx.Response(200)
+
+        upload_id = path.rsplit("/", 1)[-1]
+        if upload_id not in self.uploads:
+            return httpx.Response(404)
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"Upload-Offset": str(len(self.uploads[upload_id]))})
+        if request.method == "PATCH":
+            if int(request.headers["Upload-Offset"]) != len(self.uploads[upload_id]):
+                return httpx.Response(409)
+            chunk = request.read()
+            if self.fail_patches:
+                self.fail_patches -= 1
+                self.uploads[upload_id] += chunk[:len(chunk) // 2]
+                raise httpx.ReadError("connection reset")
+            self.uploads[upload_id] += chunk
+            return httpx.Response(204, headers={"Upload-Offset": str(len(self.uploads[upload_id]))})
+        return httpx.Response(405)
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    """
+    Returns a StorageService talking to a fresh FakeTusServer (as `.server`).
+    """
+    def make(fail_patches: int = 0) -> StorageService:
+        server = FakeTusServer(fail_patches)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(server.handler))
+        monkeypatch.setattr(storage_module, "get_http_client", lambda: client)
+        monkeypatch.setattr(settings, "UPLOAD_RESUMABLE_THRESHOLD", 1000)
+        storage = StorageService()
+        storage.backend, storage.url, storage.key, storage.bucket = "supabase", "https://storage.example", "key", "videos"
+        storage.chunk_size = 1000
+        storage.server = server
+        return storage
+    return make
+
+
+async def test_local_upload_copies_the_file(local_storage, source):
+    url = await local_storage.upload_video(source)
+
+    assert url == str(local_storage.local_dir / local_storage.bucket / "video.mp4")
+    assert open(url, "rb").read() == BODY
+    assert not list(local_storage.local_dir.rglob("*.part"))
+
+
+async def test_local_upload_uses_the_public_base_url(local_storage, source, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_LOCAL_BASE_URL", "http://localhost:8000/files/")
+    assert await local_storage.upload_video(source) == "http://localhost:8000/files/videos/video.mp4"
+
+
+async def test_small_files_go_up_in_one_request(redis, supabase, tmp_path):
+    storage = supabase()
+    thumbnail = tmp_path / "thumb.jpg"
+    thumbnail.write_bytes(b"jpeg")
+
+    url = await storage.upload_thumbnail(str(thumbnail))
+    assert url == "https://storage.example/storage/v1/object/public/videos/thumb.jpg"
+    assert storage.server.objects == {"videos/thumb.jpg": b"jpeg"}
+
+
+async def test_resumable_upload_continues_from_the_server_offset(redis, supabase, source):
+    storage = supabase(fail_patches=1)
+    url = await storage.upload_video(source)
+
+    assert url == "https://storage.example/storage/v1/object/public/videos/video.mp4"
+    assert storage.server.uploads == {"upload-0": BODY}
+    # The dropped chunk is re-sent from the offset the server reported, not from zero
+    assert [method for method, _ in storage.server.requests].count("HEAD") == 1
+    assert not await redis.keys("upload:tus:*")
+
+
+async def test_failed_upload_is_resumed_by_the_next_attempt(redis, supabase, source, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_RETRIES", 0)
+    storage = supabase(fail_patches=1)
+    # upload_file falls back to the local path when the upload fails
+    assert await storage.upload_video(source) == source
+    stored = len(storage.server.uploads["upload-0"])
+
+    assert await storage.upload_video(source) != source
+    assert storage.server.uploads == {"upload-0": BODY}
+    assert 0 < stored < len(BODY)
+
+
+def _playlist_segments(storage: StorageService, prefix: str) -> tuple[list, bool]:
+    playlist = (storage.local_dir / storage.bucket / prefix / "index.m3u8").read_text().splitlines()
+    return [line for line in playlist if line.endswith(".ts")], "#EXT-X-ENDLIST" in playlist
+
+
+async def test_playlist_grows_with_the_run_of_segments_from_the_start(local_storage, tmp_path):
+    published = []
+
+    async def on_publish(url):
+        published.append(url)
+
+    upload = local_storage.progressive_upload("t1_hls", on_publish=on_publish)
+    durations = [2.0, 2.5, 3.0]
+    segments = []
+    for index in range(3):
+        segments.append(tmp_path / f"scene_{index}.ts")
+        segments[index].write_bytes(b"ts")
+
+    # Segment 1 finishes first: nothing playable until segment 0 is up
+    await upload.add_segment(1, str(segments[1]), durations)
+    assert upload.playlist_url is None
+
+    await upload.add_segment(0, str(segments[0]), durations)
+    assert _playlist_segments(local_storage, "t1_hls") == (["seg_000.ts", "seg_001.ts"], False)
+    # Announced once, on the first publish, even though it covered two segments
+    assert published == [upload.playlist_url]
+
+    await upload.add_segment(2, str(segments[2]), durations)
+    assert _playlist_segments(local_storage, "t1_hls") == (["seg_000.ts", "seg_001.ts", "seg_002.ts"], True)
+    assert len(published) == 1
+
+
+async def test_failed_segment_stops_the_preview(local_storage, tmp_path):
+    upload = local_storage.progressive_upload("t1_hls")
+    segment = tmp_path / "scene_1.ts"
+    segment.write_bytes(b"ts")
+
+    await upload.add_segment(0, str(tmp_path / "missing.ts"), [2.0, 2.0])
+    await upload.add_segment(1, str(segment), [2.0, 2.0])
+
+    assert upload.failed
+    assert upload.playlist_url is None
+    assert not (local_storage.local_dir / local_storage.bucket / "t1_hls" / "seg_001.ts").exists()
@@ -0,0 +1,48 @@
+from app.services.task_state import task_state
+
+
+async def test_partial_updates_keep_other_fields(redis):
+    await task_state.save("t1", {"status": "pending", "progress": 0, "render_profile": "draft"})
+    await task_state.save("t1", {"status": "processing", "progress": 40, "data": {"step": 2}})
+
+    assert await task_state.get("t1") == {
+        "status": "processing", "progress": 40, "render_profile": "draft", "data": {"step": 2},
+    }
+    assert await redis.ttl(task_state.key("t1")) == task_state.ttl
+
+
+async def test_finished_tasks_are_kept_longer_and_fields_can_be_cleared(redis):
+    await task_state.save("t1", {"status": "processing", "messages": ["a", "b"]})
+    await task_state.save("t1", {"status": "completed"}, clear=["messages"])
+
+    assert await task_state.get("t1") == {"status": "completed"}
+    assert await redis.ttl(task_state.key("t1")) == task_state.finished_ttl
+
+
+async def test_get_many_reports_missing_tasks_as_none(redis):
+    await task_state.save("t1", {"status": "pending"})
+    await task_state.save("t3", {"status": "failed"})
+
+    states = await task_state.get_many(["t1", "t2", "t3"])
+    assert states == [{"status": "pending"}, None, {"status": "failed"}]
+
+
+async def test_transition_only_applies_from_the_expected_status(redis):
+    await task_state.save("t1", {"status": "failed", "data": {"error": "boom"}, "progress": 0})
+
+    assert await task_state.transition("t1", "failed", {"status": "pending"}, clear=["data"])
+    assert not await task_state.transition("t1", "failed", {"status": "pending", "progress": 5})
+    assert await task_state.get("t1") == {"status": "pending", "progress": 0}
+    assert await redis.ttl(task_state.key("t1")) == task_state.ttl
+
+
+async def test_set_field_keeps_the_ttl_and_never_recreates_a_state(redis):
+    await task_state.save("t1", {"status": "pending"})
+    await redis.expire(task_state.key("t1"), 100)
+
+    assert await task_state.set_field("t1", "estimated_start_seconds", 12.5)
+    assert (await task_state.get("t1"))["estimated_start_seconds"] == 12.5
+    assert 0 < await redis.ttl(task_state.key("t1")) <= 100
+
+    assert not await task_state.set_field("t2", "estimated_start_seconds", 12.5)
+    assert not await redis.exists(task_state.key("t2"))
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi import FastAPI
+import app.services.scheduler_service as scheduler_service
+from starlette.requests import Request
+from app.api.v1.endpoints import video
+from app.core.config import settings
+from app.services.checkpoint_service import checkpoint_service
+from app.services.progress_service import progress_stream_key
+from app.services.scheduler_service import Admission, job_scheduler
+from app.services.task_state import task_state
+
+
+async def _idle_subscription(task_id: str) -> asyncio.Queue:
+    return asyncio.Queue()
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    sent = []
+    monkeypatch.setattr(scheduler_service, "enqueue_video_pipeline", lambda task_id, *args, **kwargs: sent.append(task_id))
+    return sent
+
+
+@pytest.fixture
+async def api(redis, monkeypatch):
+    # Registered scripts are bound to the client they were registered with
+    monkeypatch.setattr(job_scheduler, "_scripts", {})
+    monkeypatch.setattr(video.progress_hub, "subscribe", _idle_subscription)
+    monkeypatch.setattr(video.progress_hub, "unsubscribe", lambda task_id, queue: None)
+    application = FastAPI()
+    application.include_router(video.router, prefix="/video")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url="http://test") as client:
+        yield client
+
+
+async def test_concurrent_resumes_queue_the_task_once(api, dispatched):
+    await checkpoint_service.save_job("t1", "A prompt", "standard")
+    await task_state.save("t1", {"id": "t1", "task_id": "t1", "status": "failed", "progress": 0,
+                                 "message": "System Error", "priority": "batch"})
+
+    responses = await asyncio.gather(*(api.post("/video/resume/t1") for _ in range(3)))
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert {response.json()["status"] for response in responses} == {"pending"}
+    assert dispatched == ["t1"]
+    assert (await task_state.get("t1"))["priority"] == "batch"
+
+
+async def test_resume_of_a_running_task_returns_its_state(api, dispatched):
+    await checkpoint_service.save_job("t1", "A prompt", "standard")
+    await task_state.save("t1", {"id": "t1", "task_id": "t1", "status": "processing", "progress": 40, "message": "Rendering"})
+
+    response = await api.post("/video/resume/t1")
+    assert response.json()["progress"] == 40
+    assert dispatched == []
+
+
+def _request(host: str, client_id: str) -> Request:
+    return Request({"type": "http", "client": (host, 1234), "headers": [(b"x-client-id", client_id.encode())]})
+
+
+def test_client_id_header_is_only_trusted_from_configured_proxies(monkeypatch):
+    assert video._client_id(_request("203.0.113.7", "someone-else")) == "203.0.113.7"
+
+    monkeypatch.setattr(settings, "SCHEDULER_TRUSTED_PROXIES", "10.0.0.2, 10.0.0.3")
+    assert video._client_id(_request("10.0.0.3", "user-42")) == "user-42"
+    assert video._client_id(_request("203.0.113.7", "user-42")) == "203.0.113.7"
+
+
+async def test_reconnect_after_the_stream_expired_gets_the_final_state(api, redis):
+    await task_state.save("t1", {"id": "t1", "status": "completed", "progress": 100, "event_id": "1700000000000-0"})
+    await redis.delete(progress_stream_key("t1"))
+
+    response = await api.get("/video/stream/t1", headers={"Last-Event-ID": "1690000000000-0"})
+    events = [json.loads(line.removeprefix("data: ")) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [(event["status"], event["progress"]) for event in events] == [("completed", 100)]
+
+
+async def _fingerprint_holder(redis) -> str:
+    keys = await redis.keys("job:fingerprint:*")
+    assert len(keys) == 1
+    return await redis.get(keys[0])
+
+
+async def test_identical_requests_share_one_job(api, redis, dispatched):
+    responses = await asyncio.gather(*(api.post("/video/generate", json={"prompt": "Deep sea creatures"}) for _ in range(3)))
+
+    tasks = [response.json() for response in responses]
+    assert len({task["task_id"] for task in tasks}) == 1
+    assert sorted(task["deduplicated"] for task in tasks) == [False, True, True]
+    assert dispatched == [tasks[0]["task_id"]]
+    # The losers' own states are not left behind
+    assert await redis.keys("task:*") == [task_state.key(tasks[0]["task_id"])]
+
+
+async def test_a_failed_job_gives_up_its_fingerprint(api, redis, dispatched):
+    first = (await api.post("/video/generate", json={"prompt": "Deep sea creatures"})).json()
+    await task_state.save(first["task_id"], {"status": "failed"})
+
+    retry = (await api.post("/video/generate", json={"prompt": "deep sea  creatures"})).json()
+    assert not retry["deduplicated"] and retry["task_id"] != first["task_id"]
+    assert dispatched == [first["task_id"], retry["task_id"]]
+    assert await _fingerprint_holder(redis) == retry["task_id"]
+
+
+async def test_requests_are_not_attached_to_a_job_that_is_rejected(api, redis, dispatched, monkeypatch):
+    submit = job_scheduler.submit
+    calls = []
+
+    async def reject_first(task_id, *args, **kwargs):
+        calls.append(task_id)
+        if len(calls) == 1:
+            # Slow admission check that ends in a rejection
+            await asyncio.sleep(0.2)
+            return Admission(False, 60, 0, reason="Queue is full", retry_after=30)
+        return await submit(task_id, *args, **kwargs)
+
+    monkeypatch.setattr(job_scheduler, "submit", reject_first)
+    first = asyncio.create_task(api.post("/video/generate", json={"prompt": "Deep sea creatures"}))
+    await asyncio.sleep(0.05)
+    second = await api.post("/video/generate", json={"prompt": "Deep sea creatures"})
+
+    assert (await first).status_code == 429
+    assert second.status_code == 200 and not second.json()["deduplicated"]
+    assert dispatched == [second.json()["task_id"]]
+    assert await _fingerprint_holder(redis) == second.json()["task_id"]